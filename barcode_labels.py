@@ -0,0 +1,262 @@
+"""
+物流视频录制系统 - 条形码标签PDF
+条形码用 reportlab 的 Code128 直接以矢量绘制在页面上，不生成临时图片；
+标签按网格排版，逐页写出，已完成的页面只以压缩后的内容保留，内存占用与标签数量基本无关。
+标签很多且安装了 pypdf 时，可按页拆分给多个进程同时生成，最后合并为一个文件
+"""
+
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+from reportlab.graphics.barcode.code128 import Code128
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfgen import canvas
+
+# 标签数据: (快递单号, 录制时间, 问题类型, 备注)
+Label = Tuple[str, str, str, str]
+
+# reportlab 内置的中文字体，阅读器自带字形，不需要嵌入字体文件
+FONT_NAME = "STSong-Light"
+
+DEFAULT_LABEL_SETTINGS = {
+    # 条形码最大尺寸（磅），超出标签宽度时按标签宽度缩小
+    "width": 300,
+    "height": 100,
+    # 每行标签数
+    "codes_per_row": 2,
+    "show_time": True,
+    "show_problems": True,
+}
+
+PAGE_MARGIN = 36
+HEADER_HEIGHT = 24
+LABEL_PADDING = 8
+FONT_SIZE = 9
+LINE_HEIGHT = 12
+# 标签数达到此值且安装了 pypdf 时才使用多进程，少量标签时启动进程反而更慢
+PARALLEL_MIN_LABELS = 2000
+
+
+def register_font():
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(UnicodeCIDFont(FONT_NAME))
+
+
+def pypdf_available() -> bool:
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class LabelLayout:
+    """根据设置计算页面上的标签网格"""
+
+    def __init__(self, settings: Optional[dict] = None, pagesize=A4):
+        self.settings = {**DEFAULT_LABEL_SETTINGS, **(settings or {})}
+        self.page_width, self.page_height = pagesize
+        self.columns = max(1, int(self.settings["codes_per_row"]))
+        self.cell_width = (self.page_width - 2 * PAGE_MARGIN) / self.columns
+        self.barcode_width = min(self.settings["width"], self.cell_width - 2 * LABEL_PADDING)
+        self.barcode_height = self.settings["height"]
+
+        # 单号一行，另外可选录制时间、问题和备注
+        self.text_lines = 1 + int(bool(self.settings["show_time"])) + 2 * int(bool(self.settings["show_problems"]))
+        self.cell_height = self.barcode_height + self.text_lines * LINE_HEIGHT + 3 * LABEL_PADDING
+        usable_height = self.page_height - 2 * PAGE_MARGIN - HEADER_HEIGHT
+        self.rows = max(1, int(usable_height // self.cell_height))
+
+    @property
+    def labels_per_page(self) -> int:
+        return self.columns * self.rows
+
+    def page_count(self, label_count: int) -> int:
+        return max(1, math.ceil(label_count / self.labels_per_page))
+
+    def cell_origin(self, position: int) -> Tuple[float, float]:
+        """第 position 个标签的左下角坐标"""
+        row, column = divmod(position, self.columns)
+        x = PAGE_MARGIN + column * self.cell_width
+        y = self.page_height - PAGE_MARGIN - HEADER_HEIGHT - (row + 1) * self.cell_height
+        return x, y
+
+
+def fit_text(text: str, width: float, font_size: float = FONT_SIZE) -> str:
+    """截断超出宽度的文字"""
+    if pdfmetrics.stringWidth(text, FONT_NAME, font_size) <= width:
+        return text
+    while text and pdfmetrics.stringWidth(text + "…", FONT_NAME, font_size) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+def draw_barcode(pdf: canvas.Canvas, value: str, x: float, y: float, max_width: float, height: float) -> bool:
+    """在 (x, y) 处居中绘制 Code128 条形码，宽度不超过 max_width"""
+    try:
+        # 先按单位模块宽度计算条码总宽，再缩放到可用宽度
+        natural_width = Code128(value, barWidth=1, quiet=False).width
+        bar_width = max_width / (natural_width + 20)
+        barcode = Code128(value, barWidth=bar_width, barHeight=height, humanReadable=False,
+                          lquiet=10 * bar_width, rquiet=10 * bar_width)
+        barcode.drawOn(pdf, x + (max_width - barcode.width) / 2, y)
+        return True
+    except Exception as e:
+        print(f"生成条形码失败 {value}: {str(e)}")
+        return False
+
+
+def draw_label(pdf: canvas.Canvas, layout: LabelLayout, position: int, label: Label):
+    tracking_number, time_str, problems, notes = label
+    x, y = layout.cell_origin(position)
+
+    # 裁切参考线
+    pdf.setStrokeColor(colors.lightgrey)
+    pdf.setDash(2, 2)
+    pdf.rect(x, y, layout.cell_width, layout.cell_height)
+    pdf.setDash()
+
+    top = y + layout.cell_height - LABEL_PADDING
+    barcode_x = x + (layout.cell_width - layout.barcode_width) / 2
+    barcode_y = top - layout.barcode_height
+    if not draw_barcode(pdf, tracking_number, barcode_x, barcode_y, layout.barcode_width, layout.barcode_height):
+        pdf.setFont(FONT_NAME, FONT_SIZE)
+        pdf.drawCentredString(x + layout.cell_width / 2, barcode_y + layout.barcode_height / 2, "无法生成条形码")
+
+    lines = [f"单号: {tracking_number}"]
+    if layout.settings["show_time"] and time_str:
+        lines.append(f"时间: {time_str}")
+    if layout.settings["show_problems"]:
+        if problems:
+            lines.append(f"问题: {problems}")
+        if notes:
+            lines.append(f"备注: {notes}")
+
+    text_width = layout.cell_width - 2 * LABEL_PADDING
+    pdf.setFillColor(colors.black)
+    pdf.setFont(FONT_NAME, FONT_SIZE)
+    baseline = barcode_y - LABEL_PADDING - FONT_SIZE
+    for line in lines:
+        pdf.drawString(x + LABEL_PADDING, baseline, fit_text(line, text_width))
+        baseline -= LINE_HEIGHT
+
+
+def draw_header(pdf: canvas.Canvas, layout: LabelLayout, page: int, total_pages: int):
+    pdf.setFillColor(colors.black)
+    pdf.setFont(FONT_NAME, 14)
+    pdf.drawString(PAGE_MARGIN, layout.page_height - PAGE_MARGIN - 14, "物流单号条形码")
+    pdf.setFont(FONT_NAME, FONT_SIZE)
+    pdf.drawRightString(layout.page_width - PAGE_MARGIN, layout.page_height - PAGE_MARGIN - 14,
+                        f"第 {page} / {total_pages} 页")
+
+
+def write_pages(output_path: str, labels: Iterable[Label], layout: LabelLayout, first_page: int,
+                total_pages: int, progress: Optional[Callable[[int], None]] = None) -> int:
+    """
+    把标签逐页写入 output_path，返回写入的标签数
+
+    每页画完后立即 showPage，页面内容压缩后保存在文档中，不保留绘图对象
+    """
+    register_font()
+    pdf = canvas.Canvas(output_path, pagesize=(layout.page_width, layout.page_height), pageCompression=1)
+    pdf.setTitle("物流单号条形码")
+    page = first_page
+    position = 0
+    count = 0
+    for label in labels:
+        if position == 0:
+            draw_header(pdf, layout, page, total_pages)
+        draw_label(pdf, layout, position, label)
+        count += 1
+        position += 1
+        if position == layout.labels_per_page:
+            pdf.showPage()
+            page += 1
+            position = 0
+            if progress:
+                progress(count)
+    if position or count == 0:
+        if count == 0:
+            draw_header(pdf, layout, page, total_pages)
+        pdf.showPage()
+    pdf.save()
+    if progress:
+        progress(count)
+    return count
+
+
+def _render_chunk(output_path: str, labels: List[Label], settings: dict, first_page: int, total_pages: int) -> int:
+    """子进程中生成一部分页面"""
+    return write_pages(output_path, labels, LabelLayout(settings), first_page, total_pages)
+
+
+def merge_pdfs(parts: Sequence[str], output_path: str):
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(part)
+    with open(output_path, "wb") as f:
+        writer.write(f)
+
+
+def create_label_pdf(labels: Sequence[Label], output_path: str, settings: Optional[dict] = None,
+                     workers: Optional[int] = None,
+                     progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """
+    生成条形码标签PDF，返回标签数
+
+    Args:
+        labels: [(快递单号, 录制时间, 问题类型, 备注), ...]
+        output_path: 输出文件路径
+        settings: 排版设置，见 DEFAULT_LABEL_SETTINGS
+        workers: 进程数；None 时标签数达到 PARALLEL_MIN_LABELS 且安装了 pypdf 才使用多进程，
+            1 为单进程
+        progress: progress(已完成标签数, 总数)
+    """
+    layout = LabelLayout(settings)
+    total = len(labels)
+    total_pages = layout.page_count(total)
+
+    if workers is None:
+        workers = min(4, os.cpu_count() or 1) if total >= PARALLEL_MIN_LABELS else 1
+    if workers > 1 and not pypdf_available():
+        print("未安装 pypdf，条形码PDF改为单进程生成")
+        workers = 1
+    # 每个进程至少处理几页，页数太少时不拆分
+    workers = min(workers, total_pages)
+
+    if workers <= 1:
+        return write_pages(output_path, labels, layout, 1, total_pages,
+                           (lambda done: progress(done, total)) if progress else None)
+
+    # 按整页拆分，各部分的页码连续
+    pages_per_chunk = math.ceil(total_pages / workers)
+    chunk_size = pages_per_chunk * layout.labels_per_page
+    temp_dir = tempfile.mkdtemp(prefix="labels-", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        parts = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for index, start in enumerate(range(0, total, chunk_size)):
+                part = os.path.join(temp_dir, f"part_{index:04d}.pdf")
+                parts.append(part)
+                future = executor.submit(_render_chunk, part, list(labels[start:start + chunk_size]),
+                                         layout.settings, 1 + index * pages_per_chunk, total_pages)
+                futures[future] = part
+            done = 0
+            for future in as_completed(futures):
+                done += future.result()
+                if progress:
+                    progress(done, total)
+        merge_pdfs(parts, output_path)
+        return total
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,156 @@
+"""
+物流视频录制系统 - 采集循环内存分配测试
+用合成画面模拟采集线程每帧的工作（读取画面、生成预览、保存上一帧、预录制），
+比较逐帧分配新数组的旧写法与复用缓冲区的现写法的每帧分配量、GC次数和耗时。
+每帧分配量取该帧内 tracemalloc 峰值相对帧开始时的增量，同一帧内先释放再分配的内存不重复计算，
+因此是实际分配量的下限
+
+用法:
+    python benchmark_allocations.py --frames 300 --resolution 1920x1080
+    python benchmark_allocations.py --fps 60 --preroll-seconds 0
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from collections import deque
+
+import cv2
+import numpy as np
+
+from benchmark_encoders import synthetic_frames
+from capture_pipeline import BufferPool, PreRollBuffer
+
+PREVIEW_SIZE = (640, 360)
+PREVIEW_BUFFERS = 3
+
+
+class SyntheticCamera:
+    """与 cv2.VideoCapture.read 相同的接口：传入 image 时读入该数组，否则返回新数组"""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+
+    def read(self, image=None):
+        source = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        if image is None or image.shape != source.shape:
+            return True, source.copy()
+        np.copyto(image, source)
+        return True, image
+
+
+def legacy_step(camera, fps: float, preroll_seconds: float):
+    """逐帧分配：read() 返回新数组，预览 resize/cvtColor 生成新数组，上一帧和预录制各复制一次"""
+    preroll = deque(maxlen=max(1, int(preroll_seconds * fps))) if preroll_seconds > 0 else None
+    state = {"last_frame": None}
+
+    def step(index: int):
+        ret, frame = camera.read()
+        small = cv2.resize(frame, PREVIEW_SIZE, interpolation=cv2.INTER_AREA)
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        del rgb
+        state["last_frame"] = frame.copy()
+        if preroll is not None:
+            preroll.append((index / fps, frame.copy()))
+
+    return step
+
+
+def pooled_step(camera, fps: float, preroll_seconds: float):
+    """复用缓冲区：read(image)、resize/cvtColor(dst)、两块采集缓冲区交替、预录制复用被丢弃画面的内存"""
+    preroll = PreRollBuffer(preroll_seconds, 1 << 40) if preroll_seconds > 0 else None
+    pool = BufferPool(PREVIEW_BUFFERS)
+    state = {"buffers": [None, None], "current": 0, "last_frame": None, "small": None}
+
+    def step(index: int):
+        current = state["current"]
+        ret, frame = camera.read(state["buffers"][current])
+        state["buffers"][current] = frame
+        state["current"] = 1 - current
+
+        shape = (PREVIEW_SIZE[1], PREVIEW_SIZE[0], 3)
+        if state["small"] is None:
+            state["small"] = np.empty(shape, dtype=np.uint8)
+        cv2.resize(frame, PREVIEW_SIZE, dst=state["small"], interpolation=cv2.INTER_AREA)
+        slot = pool.acquire(shape)
+        if slot is not None:
+            cv2.cvtColor(state["small"], cv2.COLOR_BGR2RGB, dst=pool.buffer(slot))
+            # 主线程显示完后交还
+            pool.release(slot)
+        state["last_frame"] = frame
+        if preroll is not None:
+            preroll.add(frame, index / fps)
+
+    return step
+
+
+def run_case(name: str, make_step, frames, count: int, fps: float, preroll_seconds: float) -> dict:
+    # 先运行一段时间让缓冲区填满，只统计稳定状态
+    warmup = int(max(preroll_seconds, 1) * fps) + 1
+
+    step = make_step(SyntheticCamera(frames), fps, preroll_seconds)
+    for index in range(warmup):
+        step(index)
+    gc.collect()
+    collections = [0]
+    callback = lambda phase, info: collections.__setitem__(0, collections[0] + (phase == "start"))
+    gc.callbacks.append(callback)
+    tracemalloc.start()
+    allocated = 0
+    try:
+        for index in range(warmup, warmup + count):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            step(index)
+            allocated += tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+        gc.callbacks.remove(callback)
+
+    # tracemalloc 会拖慢运行，耗时单独测量
+    step = make_step(SyntheticCamera(frames), fps, preroll_seconds)
+    for index in range(warmup):
+        step(index)
+    start = time.perf_counter()
+    for index in range(warmup, warmup + count):
+        step(index)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "name": name,
+        "bytes_per_frame": allocated / count,
+        "mb_per_second": allocated / count * fps / (1024 * 1024),
+        "gc": collections[0],
+        "ms_per_frame": elapsed / count * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较采集循环逐帧分配与复用缓冲区的内存分配量")
+    parser.add_argument("--frames", type=int, default=300, help="统计的帧数")
+    parser.add_argument("--resolution", default="1920x1080", help="画面尺寸，如 1280x720")
+    parser.add_argument("--fps", type=float, default=30.0, help="采集帧率，用于换算每秒分配量")
+    parser.add_argument("--preroll-seconds", type=float, default=3.0, help="预录制时长，0为关闭")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    print(f"生成 {width}x{height} 测试画面...")
+    frames = synthetic_frames(30, width, height)
+
+    results = [
+        run_case("逐帧分配", legacy_step, frames, args.frames, args.fps, args.preroll_seconds),
+        run_case("复用缓冲区", pooled_step, frames, args.frames, args.fps, args.preroll_seconds),
+    ]
+
+    print()
+    print(f"{'写法':<10}{'每帧分配KB':>12}{'每秒分配MB':>12}{'GC次数':>8}{'每帧毫秒':>10}")
+    for r in results:
+        print(f"{r['name']:<10}{r['bytes_per_frame'] / 1024:>14.1f}{r['mb_per_second']:>14.1f}"
+              f"{r['gc']:>10}{r['ms_per_frame']:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
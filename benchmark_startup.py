@@ -0,0 +1,128 @@
+"""
+物流视频录制系统 - 启动耗时测试
+在新的Python进程中按阶段计时：启动准备（依赖检查、Qt插件路径）、各模块导入、
+QApplication 和主窗口创建，以及直到摄像头读到第一帧（camera_ready）的时间
+
+用法:
+    python benchmark_startup.py --runs 5
+    python benchmark_startup.py --offscreen     # 无显示器的环境
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# 子进程中打印结果的前缀
+RESULT_PREFIX = "STARTUP_PHASES "
+
+
+def measure(timeout: float):
+    """在当前进程中依次执行启动的各个阶段并计时"""
+    phases = []
+    origin = time.perf_counter()
+    last = origin
+
+    def mark(name):
+        nonlocal last
+        now = time.perf_counter()
+        phases.append((name, now - last))
+        last = now
+
+    import run  # 导入时设置Qt插件路径
+    mark("run.py 导入与Qt插件路径")
+    run.check_and_install_dependencies()
+    mark("依赖检查")
+    import numpy  # noqa: F401
+    mark("导入 numpy")
+    import cv2  # noqa: F401
+    mark("导入 cv2")
+    from PyQt6.QtCore import QTimer
+    from PyQt6.QtWidgets import QApplication
+    mark("导入 PyQt6")
+    import video_recorder_gui
+    mark("导入 video_recorder_gui")
+    app = QApplication(sys.argv[:1])
+    mark("创建 QApplication")
+
+    # 视频线程在主窗口构造时就已启动，就绪/失败的槽函数需要在创建窗口之前替换
+    ready = {"ok": False, "done": False}
+    window_class = video_recorder_gui.MainWindow
+    original_ready, original_error = window_class.handle_camera_ready, window_class.show_error
+
+    def on_ready(self, *args):
+        original_ready(self, *args)
+        ready.update(ok=True, done=True)
+        app.exit(0)
+
+    def on_error(self, *args):
+        original_error(self, *args)
+        ready["done"] = True
+        app.exit(0)
+
+    window_class.handle_camera_ready, window_class.show_error = on_ready, on_error
+    window = window_class()
+    window.show()
+    mark("创建主窗口")
+
+    thread = window.video_thread
+    if thread is not None and not ready["done"]:
+        QTimer.singleShot(int(timeout * 1000), lambda: app.exit(0))
+        app.exec()
+    mark("摄像头就绪" if ready["ok"] else "摄像头未就绪（超时或失败）")
+
+    total = time.perf_counter() - origin
+    if thread is not None:
+        thread.is_running = False
+        thread.wait(3000)
+    return phases, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量程序启动各阶段耗时")
+    parser.add_argument("--runs", type=int, default=3, help="测量次数，取中位数")
+    parser.add_argument("--timeout", type=float, default=10.0, help="等待摄像头就绪的最长时间（秒）")
+    parser.add_argument("--offscreen", action="store_true", help="使用 offscreen 平台，不显示窗口")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # 摄像头打开失败时的提示框会阻塞，测量时只输出到终端
+        from PyQt6.QtWidgets import QMessageBox
+        QMessageBox.warning = staticmethod(lambda *a, **k: print("提示:", *a[1:]))
+        phases, total = measure(args.timeout)
+        print(RESULT_PREFIX + json.dumps({"phases": phases, "total": total}, ensure_ascii=False))
+        return
+
+    env = dict(os.environ)
+    if args.offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--timeout", str(args.timeout)]
+
+    runs = []
+    for i in range(args.runs):
+        started = time.perf_counter()
+        result = subprocess.run(command, capture_output=True, text=True, env=env)
+        wall = time.perf_counter() - started
+        lines = [line for line in result.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+        if result.returncode != 0 or not lines:
+            print(f"第 {i + 1} 次测量失败:\n{result.stdout[-2000:]}\n{result.stderr[-2000:]}")
+            return
+        data = json.loads(lines[-1][len(RESULT_PREFIX):])
+        data["wall"] = wall
+        runs.append(data)
+        print(f"第 {i + 1} 次: {data['total']:.3f}s（含解释器启动 {wall:.3f}s）")
+
+    print(f"\n{'阶段':<28}{'中位数(ms)':>12}")
+    for index, (name, _) in enumerate(runs[0]["phases"]):
+        values = [run["phases"][index][1] for run in runs if len(run["phases"]) > index]
+        print(f"{name:<30}{statistics.median(values) * 1000:>12.1f}")
+    print(f"{'合计':<30}{statistics.median(r['total'] for r in runs) * 1000:>12.1f}")
+    print(f"{'含解释器启动':<30}{statistics.median(r['wall'] for r in runs) * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
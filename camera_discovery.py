@@ -0,0 +1,132 @@
+"""
+物流视频录制系统 - 摄像头检测
+并行探测各个摄像头编号，每个探测有独立的超时，不存在的编号不会拖慢整体；
+上次检测到的摄像头列表和分辨率保存在磁盘上，启动时直接使用，再在后台刷新
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+
+import cv2
+
+CACHE_FILE = Path("camera_cache.json")
+# 探测的摄像头编号范围
+PROBE_INDICES = range(10)
+# 单个摄像头打开并读取一帧的超时（秒）
+PROBE_TIMEOUT = 3.0
+
+
+def probe_camera(index: int) -> Optional[dict]:
+    """打开摄像头并读取一帧，成功时返回编号、名称和默认分辨率"""
+    cap = cv2.VideoCapture(index, cv2.CAP_ANY)
+    try:
+        if not cap.isOpened():
+            return None
+        ret, frame = cap.read()
+        if not ret:
+            return None
+        return {
+            "index": index,
+            "name": f"摄像头 {index}",
+            "width": frame.shape[1],
+            "height": frame.shape[0],
+            "fps": cap.get(cv2.CAP_PROP_FPS) or None,
+        }
+    except Exception as e:
+        print(f"检测摄像头 {index} 失败: {str(e)}")
+        return None
+    finally:
+        cap.release()
+
+
+def discover_cameras(indices: Iterable[int] = PROBE_INDICES, timeout: float = PROBE_TIMEOUT,
+                     exclude: Iterable[int] = ()) -> List[dict]:
+    """
+    并行探测摄像头
+
+    每个编号在独立的守护线程中探测，超时未返回的编号视为不存在，
+    卡住的驱动调用不会阻塞程序退出
+
+    Args:
+        indices: 要探测的编号
+        timeout: 总等待时间（各编号同时开始，等同于单个探测的超时）
+        exclude: 跳过的编号，如正在使用中的摄像头（部分系统不允许同时打开）
+    """
+    excluded = set(exclude)
+    pending = [index for index in indices if index not in excluded]
+    results: "queue.Queue" = queue.Queue()
+    for index in pending:
+        threading.Thread(
+            target=lambda i=index: results.put((i, probe_camera(i))),
+            name=f"camera-probe-{index}", daemon=True
+        ).start()
+
+    cameras = []
+    deadline = time.monotonic() + timeout
+    for _ in pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            index, camera = results.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if camera is not None:
+            cameras.append(camera)
+    return sorted(cameras, key=lambda camera: camera["index"])
+
+
+def load_cached_cameras(cache_file: Path = CACHE_FILE) -> List[dict]:
+    """读取上次检测到的摄像头列表，没有缓存时返回空列表"""
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return json.load(f).get("cameras", [])
+    except (OSError, ValueError):
+        return []
+
+
+def save_cached_cameras(cameras: List[dict], cache_file: Path = CACHE_FILE):
+    temp_path = cache_file.with_name(f"{cache_file.name}.tmp")
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"updated": time.time(), "cameras": cameras}, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, cache_file)
+    except OSError as e:
+        print(f"保存摄像头缓存失败: {e}")
+
+
+def merge_in_use(cameras: List[dict], known: List[dict], in_use: Iterable[int]) -> List[dict]:
+    """
+    正在使用的摄像头没有被探测，沿用已知的信息
+
+    in_use 只应包含已确认打开成功的摄像头，否则失效的编号会一直留在缓存中
+    """
+    in_use = set(in_use)
+    found = {camera["index"] for camera in cameras}
+    kept = [camera for camera in known if camera["index"] in in_use and camera["index"] not in found]
+    return sorted(cameras + kept, key=lambda camera: camera["index"])
+
+
+def refresh_in_background(callback: Callable[[List[dict]], None], known: List[dict],
+                          in_use: Iterable[int] = (), cache_file: Path = CACHE_FILE) -> threading.Thread:
+    """
+    在后台重新探测摄像头，完成后更新缓存并调用 callback(摄像头列表)
+
+    callback 在后台线程中调用，界面程序需要自行转到主线程处理
+    """
+    in_use = list(in_use)
+
+    def run():
+        cameras = merge_in_use(discover_cameras(exclude=in_use), known, in_use)
+        save_cached_cameras(cameras, cache_file)
+        print(f"找到 {len(cameras)} 个摄像头")
+        callback(cameras)
+
+    thread = threading.Thread(target=run, name="camera-discovery", daemon=True)
+    thread.start()
+    return thread
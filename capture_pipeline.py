@@ -0,0 +1,497 @@
+"""
+物流视频录制系统 - 采集与编码流水线
+采集线程只把画面复制进预分配的环形缓冲区，由独立的写入线程负责编码写盘，
+磁盘变慢或CPU繁忙时不会拖慢摄像头读取
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+import cv2
+import numpy as np
+
+# 缓冲区满时的处理策略
+POLICY_BLOCK = "block"              # 等待写入线程腾出空间，不丢帧
+POLICY_DROP_OLDEST = "drop_oldest"  # 丢弃最早未写入的画面
+POLICY_DROP_NEWEST = "drop_newest"  # 丢弃当前画面
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_DROP_NEWEST)
+
+DEFAULT_PIPELINE_CONFIG = {
+    # 缓冲的帧数，30帧约为1秒
+    "queue_size": 30,
+    "policy": POLICY_BLOCK,
+    # 预录制：保留扫码前最近几秒的画面，0表示关闭
+    "preroll_seconds": 3,
+    # 预录制缓冲区的内存上限（MB），超出时丢弃最早的画面；
+    # 未压缩的1080p画面每帧约6MB，3秒30帧约需530MB，128MB只够约0.7秒
+    "preroll_max_mb": 128,
+    # 是否以JPEG压缩保存预录制画面，内存占用约为原来的1/10，但每帧需要额外编码
+    "preroll_jpeg": False,
+    "preroll_jpeg_quality": 85,
+    # 守护模式空闲时每秒解码几帧放入预录制缓冲区，其余画面只抓取不解码；0表示每帧都解码。
+    # 帧率越低CPU占用越低，但视频开头的预录制部分越不流畅（按采集时间重复画面，时长不变）
+    "daemon_preroll_fps": 10,
+    # 桌面端预览的刷新率，与录制帧率无关
+    "preview_fps": 15,
+}
+
+
+def load_pipeline_config(config_path: Path = Path("config.json")) -> dict:
+    """读取 config.json 中的 pipeline 配置，缺省项使用默认值"""
+    config = dict(DEFAULT_PIPELINE_CONFIG)
+    if config_path.exists():
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                config.update(json.load(f).get("pipeline", {}))
+        except Exception as e:
+            print(f"加载流水线配置失败: {e}，使用默认配置")
+    if config["policy"] not in POLICIES:
+        print(f"未知的缓冲策略 {config['policy']}，改用 {POLICY_BLOCK}")
+        config["policy"] = POLICY_BLOCK
+    config["queue_size"] = max(1, int(config["queue_size"]))
+    return config
+
+
+def create_preroll(config: dict) -> Optional["PreRollBuffer"]:
+    """按流水线配置创建预录制缓冲区，未开启时返回None"""
+    if config["preroll_seconds"] <= 0:
+        return None
+    return PreRollBuffer(
+        config["preroll_seconds"],
+        int(config["preroll_max_mb"] * 1024 * 1024),
+        compress=config["preroll_jpeg"],
+        jpeg_quality=config["preroll_jpeg_quality"]
+    )
+
+
+class PreRollBuffer:
+    """
+    预录制缓冲区，保存最近 seconds 秒的画面
+
+    未录制时采集线程不断放入画面；开始录制时取出全部画面写在视频开头，
+    按采集时间重新排布到写入器的帧率上，画面时长与实际经过的时间一致。
+    占用的内存超过 max_bytes 时无论时长都丢弃最早的画面。
+    未压缩时画面复制进可复用的缓冲区，被丢弃画面的缓冲区留给后续画面，空闲时不再逐帧分配内存
+
+    Args:
+        seconds: 保留的时长（秒）
+        max_bytes: 内存上限
+        compress: 是否以JPEG压缩保存
+        jpeg_quality: JPEG质量 0-100
+    """
+
+    def __init__(self, seconds: float, max_bytes: int, compress: bool = False, jpeg_quality: int = 85):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.jpeg_quality = jpeg_quality
+        self._lock = threading.Lock()
+        # (采集时间, 画面或JPEG数据, 占用字节数)
+        self._frames: deque = deque()
+        self._bytes = 0
+        # 可复用的画面缓冲区
+        self._spare: list = []
+        # 内存上限不足以保存 seconds 秒画面时只提示一次
+        self._cap_warned = False
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._bytes
+
+    def add(self, frame: np.ndarray, timestamp: Optional[float] = None):
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        if self.compress:
+            ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not ok:
+                return
+            size = encoded.nbytes
+        else:
+            size = frame.nbytes
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            # 先移出超时或超出内存上限的画面，其缓冲区可直接用于当前画面
+            while self._frames and (
+                self._bytes + size > self.max_bytes or timestamp - self._frames[0][0] > self.seconds
+            ):
+                if not self._cap_warned and timestamp - self._frames[0][0] <= self.seconds:
+                    self._warn_capacity(timestamp, size)
+                self._release(self._frames.popleft())
+            if self.compress:
+                data = encoded
+            else:
+                data = self._spare.pop() if self._spare else None
+                if data is None or data.shape != frame.shape or data.dtype != frame.dtype:
+                    data = np.empty_like(frame)
+                np.copyto(data, frame)
+            self._frames.append((timestamp, data, size))
+            self._bytes += size
+
+    def _warn_capacity(self, timestamp: float, size: int):
+        """按实际帧率和画面大小估算保存 seconds 秒所需的内存"""
+        self._cap_warned = True
+        span = timestamp - self._frames[0][0]
+        if span <= 0:
+            return
+        fps = len(self._frames) / span
+        needed_mb = self.seconds * fps * size / (1024 * 1024)
+        print(f"预录制内存上限 {self.max_bytes / (1024 * 1024):.0f} MB 只能保存约 {span:.1f} 秒画面"
+              f"（设置为 {self.seconds} 秒，约需 {needed_mb:.0f} MB），"
+              f"可调大 pipeline.preroll_max_mb 或开启 pipeline.preroll_jpeg")
+
+    def _release(self, entry: tuple):
+        self._bytes -= entry[2]
+        if not self.compress:
+            self._spare.append(entry[1])
+
+    def clear(self):
+        with self._lock:
+            while self._frames:
+                self._release(self._frames.popleft())
+
+    def drain(self, fps: float) -> Iterator[np.ndarray]:
+        """
+        取出并清空缓冲区，按 fps 重新排布画面
+
+        采集帧率低于 fps 时重复画面，高于时跳过画面。
+        返回的迭代器在使用时才解码JPEG，可以交给写入线程消费
+        """
+        with self._lock:
+            # 取出的缓冲区交给迭代器，写入线程可能仍在读取，不再复用
+            frames = list(self._frames)
+            self._frames.clear()
+            self._bytes = 0
+        return self._resample(frames, fps)
+
+    def _resample(self, frames: list, fps: float) -> Iterator[np.ndarray]:
+        if not frames:
+            return
+        start = frames[0][0]
+        count = int(round((frames[-1][0] - start) * fps)) + 1
+        index = 0
+        decoded_index, decoded = -1, None
+        for k in range(count):
+            slot = start + k / fps
+            while index + 1 < len(frames) and frames[index + 1][0] <= slot:
+                index += 1
+            if index != decoded_index:
+                data = frames[index][1]
+                decoded = cv2.imdecode(data, cv2.IMREAD_COLOR) if self.compress else data
+                decoded_index = index
+            yield decoded
+
+
+class FramePacer:
+    """
+    按单调时钟把实际采集到的画面排布到写入器声明的固定帧率上
+
+    摄像头在弱光下常常只有15-25帧/秒，直接按30帧写入会让视频快放、时长变短。
+    每帧按采集时间计算应占用的帧位：落后时重复当前画面，超前时丢弃，
+    视频时长与实际经过的时间一致
+
+    Args:
+        fps: 写入器声明的帧率
+    """
+
+    def __init__(self, fps: float):
+        self.fps = fps
+        self.start: Optional[float] = None
+        self.last: Optional[float] = None
+        self.captured = 0
+        self.written = 0
+        self.duplicated = 0
+        self.dropped = 0
+
+    def pace(self, timestamp: Optional[float] = None) -> int:
+        """
+        登记一帧画面
+
+        Returns:
+            这一帧应写入的次数：0为丢弃，大于1为重复
+        """
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        if self.start is None:
+            self.start = timestamp
+        self.last = timestamp
+        self.captured += 1
+
+        # 截至这一帧的采集时间，视频中应有的帧数
+        due = int((timestamp - self.start) * self.fps) + 1
+        repeat = max(0, due - self.written)
+        if repeat == 0:
+            self.dropped += 1
+        else:
+            self.duplicated += repeat - 1
+        self.written += repeat
+        return repeat
+
+    def elapsed(self, now: Optional[float] = None) -> float:
+        if self.start is None:
+            return 0.0
+        return (time.monotonic() if now is None else now) - self.start
+
+    @property
+    def effective_fps(self) -> float:
+        """实测的采集帧率"""
+        if self.start is None or self.last is None or self.last <= self.start:
+            return 0.0
+        return (self.captured - 1) / (self.last - self.start)
+
+    def stats(self) -> dict:
+        return {
+            "effective_fps": round(self.effective_fps, 2),
+            "target_fps": self.fps,
+            "duplicated": self.duplicated,
+            "paced_dropped": self.dropped,
+        }
+
+
+class BufferPool:
+    """
+    固定数量、可复用的画面缓冲区
+
+    取出的缓冲区归调用方所有，交还之前不会再被分配给别人；
+    没有空闲缓冲区时 acquire 返回None，由调用方决定跳过这一帧。
+    尺寸变化时才重新分配内存
+
+    Args:
+        count: 缓冲区数量
+    """
+
+    def __init__(self, count: int):
+        self._lock = threading.Lock()
+        self._buffers: list = [None] * count
+        self._free = deque(range(count))
+        self.allocations = 0
+        self.exhausted = 0
+
+    def acquire(self, shape: tuple, dtype=np.uint8) -> Optional[int]:
+        """取出一个指定尺寸的缓冲区，返回编号；没有空闲缓冲区时返回None"""
+        with self._lock:
+            if not self._free:
+                self.exhausted += 1
+                return None
+            slot = self._free.popleft()
+            buffer = self._buffers[slot]
+            if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+                self._buffers[slot] = np.empty(shape, dtype=dtype)
+                self.allocations += 1
+            return slot
+
+    def buffer(self, slot: int) -> np.ndarray:
+        return self._buffers[slot]
+
+    def release(self, slot: int):
+        with self._lock:
+            if slot not in self._free:
+                self._free.append(slot)
+
+
+class FrameRing:
+    """
+    固定容量的帧缓冲区
+
+    画面被复制进预先分配的缓冲区，运行期间不再分配内存。
+    读取方取出的缓冲区在 release 之前不会被覆盖，因此比容量多分配一个
+
+    Args:
+        capacity: 最多缓存的帧数
+        policy: 缓冲区满时的处理策略
+    """
+
+    def __init__(self, capacity: int, policy: str = POLICY_BLOCK):
+        if policy not in POLICIES:
+            raise ValueError(f"未知的缓冲策略: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+
+        self._cond = threading.Condition()
+        self._buffers: list = [None] * (capacity + 1)
+        # 每个缓冲区中的画面需要写入的次数
+        self._repeats: list = [1] * (capacity + 1)
+        self._free = deque(range(capacity + 1))
+        self._filled = deque()
+        self._closed = False
+
+        self.pushed = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def push(self, frame: np.ndarray, timeout: Optional[float] = None, repeat: int = 1) -> bool:
+        """
+        放入一帧画面，repeat 为写入次数，重复的画面只占一个缓冲区
+
+        Returns:
+            画面是否被缓存；按策略被丢弃、等待超时或缓冲区已关闭时返回False
+        """
+        with self._cond:
+            if self._closed:
+                return False
+            if self._full():
+                if self.policy == POLICY_DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.policy == POLICY_DROP_OLDEST:
+                    self._free.append(self._filled.popleft())
+                    self.dropped += 1
+                elif not self._cond.wait_for(lambda: self._closed or not self._full(), timeout):
+                    self.dropped += 1
+                    return False
+                if self._closed:
+                    return False
+
+            index = self._free.popleft()
+            buffer = self._buffers[index]
+            if buffer is None or buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+                buffer = self._buffers[index] = np.empty_like(frame)
+            np.copyto(buffer, frame)
+            self._repeats[index] = repeat
+            self._filled.append(index)
+            self.pushed += 1
+            self.max_depth = max(self.max_depth, len(self._filled))
+            self._cond.notify_all()
+            return True
+
+    def _full(self) -> bool:
+        return len(self._filled) >= self.capacity or not self._free
+
+    def pop(self, timeout: Optional[float] = None):
+        """
+        取出最早的一帧，用完后必须调用 release
+
+        Returns:
+            (缓冲区编号, 画面, 写入次数)；超时或已关闭且取空时返回None
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._filled or self._closed, timeout):
+                return None
+            if not self._filled:
+                return None
+            index = self._filled.popleft()
+            return index, self._buffers[index], self._repeats[index]
+
+    def release(self, index: int):
+        with self._cond:
+            self._free.append(index)
+            self._cond.notify_all()
+
+    def close(self):
+        """不再接受新画面，已缓存的画面仍可取出"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def depth(self) -> int:
+        return len(self._filled)
+
+
+class ThreadedVideoWriter:
+    """
+    在独立线程中编码写盘的视频写入器，接口与 cv2.VideoWriter 兼容
+
+    write 只把画面放入缓冲区就返回；release 不等待写完，
+    剩余画面由写入线程写完后释放底层写入器并调用 on_closed
+
+    Args:
+        writer: 已打开的编码器，cv2.VideoWriter 或 encoders.open_encoder 的返回值
+        queue_size: 缓冲的帧数
+        policy: 缓冲区满时的处理策略
+        on_closed: 全部画面写完、文件关闭后的回调（在写入线程中调用）
+        preroll: 先于缓冲区画面写入的预录制画面，在写入线程中消费
+        fps: 底层写入器的帧率，预录制画面按此帧率重新排布
+    """
+
+    def __init__(self, writer, queue_size: int = DEFAULT_PIPELINE_CONFIG["queue_size"],
+                 policy: str = DEFAULT_PIPELINE_CONFIG["policy"],
+                 on_closed: Optional[Callable[[], None]] = None,
+                 preroll: Optional[Iterable[np.ndarray]] = None, fps: float = 30.0):
+        self.writer = writer
+        self.fps = fps
+        self.ring = FrameRing(queue_size, policy)
+        self.on_closed = on_closed
+        self.preroll = preroll
+        self.written = 0
+        self.error: Optional[Exception] = None
+        self._released = False
+        self._thread = threading.Thread(target=self._run, name="video-writer")
+        self._thread.start()
+
+    def isOpened(self) -> bool:
+        return not self._released and self.error is None and self.writer.isOpened()
+
+    def write(self, frame: np.ndarray, repeat: int = 1) -> bool:
+        """
+        提交一帧画面，repeat 为写入次数（由 FramePacer 决定）
+
+        Raises:
+            RuntimeError: 写入线程已出错
+        """
+        if self.error is not None:
+            raise RuntimeError(f"视频写入线程出错: {self.error}")
+        if repeat <= 0:
+            return False
+        return self.ring.push(frame, repeat=repeat)
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self.ring.close()
+
+    def join(self, timeout: Optional[float] = None):
+        """等待剩余画面写完"""
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.ring.depth,
+            "queue_size": self.ring.capacity,
+            "max_depth": self.ring.max_depth,
+            "dropped": self.ring.dropped,
+            "written": self.written,
+            "policy": self.ring.policy,
+        }
+
+    def _run(self):
+        try:
+            if self.preroll is not None:
+                for frame in self.preroll:
+                    self.writer.write(frame)
+                    self.written += 1
+                self.preroll = None
+            while True:
+                item = self.ring.pop(timeout=0.5)
+                if item is None:
+                    if self._released:
+                        break
+                    continue
+                index, frame, repeat = item
+                try:
+                    for _ in range(repeat):
+                        self.writer.write(frame)
+                        self.written += 1
+                finally:
+                    self.ring.release(index)
+        except Exception as e:
+            self.error = e
+            self.ring.close()
+            print(f"视频写入线程出错: {e}")
+        finally:
+            self.writer.release()
+
+        if self.ring.dropped:
+            print(f"录制期间丢弃了 {self.ring.dropped} 帧（策略: {self.ring.policy}）")
+        if self.on_closed is not None and self.error is None:
+            try:
+                self.on_closed()
+            except Exception as e:
+                print(f"视频写入完成回调出错: {e}")
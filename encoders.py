@@ -0,0 +1,290 @@
+"""
+物流视频录制系统 - 视频编码器
+录制程序通过 open_encoder 创建编码器，接口与 cv2.VideoWriter 兼容（write / release / isOpened）。
+可选后端：
+- pyav: 进程内调用 libx264（需要 pip install av）
+- ffmpeg: 把原始画面通过管道交给 ffmpeg 进程用 libx264 编码（需要 ffmpeg 在 PATH 中）
+- opencv: cv2.VideoWriter，无法控制码率和关键帧间隔
+libx264 在相同画质下体积约为 mp4v 的 1/3 到 1/5
+"""
+
+import json
+import shutil
+import subprocess
+import sys
+from fractions import Fraction
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BACKEND_AUTO = "auto"
+BACKEND_PYAV = "pyav"
+BACKEND_FFMPEG = "ffmpeg"
+BACKEND_OPENCV = "opencv"
+BACKENDS = (BACKEND_PYAV, BACKEND_FFMPEG, BACKEND_OPENCV)
+
+# 预设档位，config.json 中单独指定的 crf / preset 优先
+PROFILES = {
+    # 画质优先，适合有争议时需要看清细节的场景
+    "quality": {"crf": 20, "preset": "medium"},
+    "balanced": {"crf": 23, "preset": "veryfast"},
+    # 低配电脑或多路录制时降低CPU占用
+    "fast": {"crf": 26, "preset": "ultrafast"},
+    # 长期存档，体积最小
+    "archive": {"crf": 28, "preset": "slow"},
+}
+
+DEFAULT_ENCODER_CONFIG = {
+    "backend": BACKEND_AUTO,
+    "profile": "balanced",
+    "crf": None,
+    "preset": None,
+    # 编码线程数，0表示由 libx264 自动决定
+    "threads": 0,
+    # 关键帧间隔（秒），Web端拖动进度条时最多需要解码这么长的画面
+    "keyframe_seconds": 2,
+    # 不在 PATH 中时可指定 ffmpeg 的完整路径
+    "ffmpeg_path": None,
+}
+
+# Windows 下启动 ffmpeg 时不弹出控制台窗口
+CREATE_NO_WINDOW = 0x08000000
+
+
+class EncoderError(Exception):
+    """编码器无法创建"""
+
+
+def load_encoder_config(config_path: Path = Path("config.json")) -> dict:
+    """读取 config.json 中的 encoder 配置，缺省项使用默认值，并展开预设档位"""
+    config = dict(DEFAULT_ENCODER_CONFIG)
+    if config_path.exists():
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                config.update(json.load(f).get("encoder", {}))
+        except Exception as e:
+            print(f"加载编码器配置失败: {e}，使用默认配置")
+    return resolve_profile(config)
+
+
+def resolve_profile(config: dict) -> dict:
+    """用预设档位补全未指定的 crf / preset"""
+    config = dict(config)
+    profile = PROFILES.get(config.get("profile") or "balanced")
+    if profile is None:
+        print(f"未知的编码档位 {config['profile']}，改用 balanced")
+        profile = PROFILES["balanced"]
+    for key, value in profile.items():
+        if config.get(key) is None:
+            config[key] = value
+    return config
+
+
+def find_ffmpeg(config: dict) -> Optional[str]:
+    return config.get("ffmpeg_path") or shutil.which("ffmpeg")
+
+
+def pyav_available() -> bool:
+    try:
+        import av  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def available_backends(config: dict) -> List[str]:
+    backends = []
+    if pyav_available():
+        backends.append(BACKEND_PYAV)
+    if find_ffmpeg(config):
+        backends.append(BACKEND_FFMPEG)
+    backends.append(BACKEND_OPENCV)
+    return backends
+
+
+def keyframe_interval(config: dict, fps: float) -> int:
+    return max(1, round(config["keyframe_seconds"] * fps))
+
+
+class OpenCVEncoder:
+    """
+    cv2.VideoWriter 编码器，按顺序尝试 codecs 中的编码格式
+
+    OpenCV 不提供码率、CRF和关键帧间隔的设置，配置中的这些参数对本后端无效
+    """
+
+    backend = BACKEND_OPENCV
+
+    def __init__(self, path: str, fps: float, size: Tuple[int, int], codecs: Sequence[str]):
+        import cv2
+
+        self.writer = None
+        for codec in codecs:
+            try:
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, size)
+            except Exception as e:
+                print(f"编码器 {codec} 初始化失败: {e}")
+                continue
+            if writer.isOpened():
+                self.writer = writer
+                self.codec = codec
+                return
+            writer.release()
+        raise EncoderError(f"OpenCV 无法创建视频文件，尝试过的编码格式: {', '.join(codecs)}")
+
+    def isOpened(self) -> bool:
+        return self.writer.isOpened()
+
+    def write(self, frame: np.ndarray):
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+
+class FFmpegPipeEncoder:
+    """通过标准输入把BGR原始画面交给 ffmpeg 进程，用 libx264 按CRF编码"""
+
+    backend = BACKEND_FFMPEG
+
+    def __init__(self, path: str, fps: float, size: Tuple[int, int], config: dict, ffmpeg: str):
+        width, height = size
+        self.size = size
+        command = [
+            ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps}",
+            "-i", "pipe:0",
+            "-c:v", "libx264", "-preset", config["preset"], "-crf", str(config["crf"]),
+            "-g", str(keyframe_interval(config, fps)),
+            "-threads", str(config["threads"]),
+            "-pix_fmt", "yuv420p",
+            "-f", "mp4", path,
+        ]
+        try:
+            self.process = subprocess.Popen(
+                command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                creationflags=CREATE_NO_WINDOW if sys.platform == "win32" else 0
+            )
+        except OSError as e:
+            raise EncoderError(f"无法启动 ffmpeg: {e}")
+        if self.process.poll() is not None:
+            raise EncoderError(f"ffmpeg 启动后立即退出: {self._stderr()}")
+
+    def isOpened(self) -> bool:
+        return self.process.poll() is None
+
+    def write(self, frame: np.ndarray):
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            raise ValueError(f"画面尺寸 {frame.shape[1]}x{frame.shape[0]} 与编码器 {self.size[0]}x{self.size[1]} 不一致")
+        try:
+            # 连续内存的画面直接写入管道，不额外复制
+            self.process.stdin.write(memoryview(np.ascontiguousarray(frame)).cast("B"))
+        except (BrokenPipeError, OSError):
+            raise RuntimeError(f"ffmpeg 已退出: {self._stderr()}")
+
+    def release(self):
+        if self.process.stdin.closed:
+            return
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        if self.process.wait() != 0:
+            print(f"ffmpeg 编码失败: {self._stderr()}")
+
+    def _stderr(self) -> str:
+        if self.process.poll() is None:
+            return "进程仍在运行"
+        return self.process.stderr.read().decode("utf-8", errors="replace").strip()
+
+
+class PyAVEncoder:
+    """通过 PyAV 在进程内调用 libx264，省去管道传输"""
+
+    backend = BACKEND_PYAV
+
+    def __init__(self, path: str, fps: float, size: Tuple[int, int], config: dict):
+        import av
+
+        self._av = av
+        self.rate = Fraction(fps).limit_denominator(1001)
+        try:
+            self.container = av.open(path, mode="w")
+            self.stream = self.container.add_stream("libx264", rate=self.rate)
+        except Exception as e:
+            raise EncoderError(f"PyAV 无法创建视频文件: {e}")
+        self.stream.width, self.stream.height = size
+        self.stream.pix_fmt = "yuv420p"
+        self.stream.thread_count = config["threads"]
+        self.stream.options = {
+            "crf": str(config["crf"]),
+            "preset": config["preset"],
+            "g": str(keyframe_interval(config, fps)),
+        }
+        self.frame_index = 0
+        self._closed = False
+
+    def isOpened(self) -> bool:
+        return not self._closed
+
+    def write(self, frame: np.ndarray):
+        video_frame = self._av.VideoFrame.from_ndarray(frame, format="bgr24")
+        video_frame.pts = self.frame_index
+        video_frame.time_base = 1 / self.rate
+        self.frame_index += 1
+        for packet in self.stream.encode(video_frame):
+            self.container.mux(packet)
+
+    def release(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            for packet in self.stream.encode(None):
+                self.container.mux(packet)
+        finally:
+            self.container.close()
+
+
+def open_encoder(path: str, fps: float, size: Tuple[int, int], config: dict,
+                 opencv_codecs: Sequence[str] = ("avc1", "mp4v")):
+    """
+    按配置创建编码器，指定的后端不可用时依次回退到其他后端，最后使用OpenCV
+
+    Args:
+        path: 输出文件路径
+        fps: 帧率
+        size: 画面尺寸 (宽, 高)
+        config: encoder 配置，见 load_encoder_config
+        opencv_codecs: OpenCV 后端依次尝试的编码格式
+
+    Raises:
+        EncoderError: 所有后端都无法创建编码器
+    """
+    config = resolve_profile(config)
+    backend = config["backend"]
+    if backend != BACKEND_AUTO and backend not in BACKENDS:
+        print(f"未知的编码器后端 {backend}，改为自动选择")
+        backend = BACKEND_AUTO
+
+    candidates = available_backends(config)
+    if backend != BACKEND_AUTO:
+        if backend not in candidates:
+            print(f"编码器后端 {backend} 不可用，改为自动选择")
+        else:
+            candidates.remove(backend)
+            candidates.insert(0, backend)
+
+    errors = []
+    for candidate in candidates:
+        try:
+            if candidate == BACKEND_PYAV:
+                return PyAVEncoder(path, fps, size, config)
+            if candidate == BACKEND_FFMPEG:
+                return FFmpegPipeEncoder(path, fps, size, config, find_ffmpeg(config))
+            return OpenCVEncoder(path, fps, size, opencv_codecs)
+        except EncoderError as e:
+            print(f"编码器后端 {candidate} 创建失败: {e}")
+            errors.append(str(e))
+    raise EncoderError("; ".join(errors))
@@ -0,0 +1,228 @@
+"""
+物流视频录制系统 - MP4快速启动处理
+cv2.VideoWriter 把 moov box 写在文件末尾，浏览器必须先取回文件尾部才能开始播放。
+录制结束后在后台把 moov 移到文件开头（不重新编码），同时修正 stco/co64 中的数据偏移，
+写入临时文件后原子替换原文件
+"""
+
+import os
+import shutil
+import struct
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+# 需要递归进入才能找到 stco/co64 的容器box
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"edts", b"dinf"}
+# moov 超过此大小视为异常文件
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+UINT32_MAX = 0xFFFFFFFF
+
+# 同一时间只处理一个文件，避免多个大文件同时复制与录制争抢磁盘
+_finalize_lock = threading.Lock()
+
+
+class FaststartError(Exception):
+    """文件结构无法识别或被截断"""
+
+
+def _read_top_level(f, file_size: int) -> List[Tuple[bytes, int, int]]:
+    """返回顶层box列表 (类型, 起始偏移, 总长度)"""
+    boxes = []
+    offset = 0
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        header = f.read(16)
+        size, box_type = struct.unpack(">I4s", header[:8])
+        if size == 1:
+            if len(header) < 16:
+                raise FaststartError("box头被截断")
+            size = struct.unpack(">Q", header[8:16])[0]
+        elif size == 0:
+            size = file_size - offset
+        if size < 8 or offset + size > file_size:
+            raise FaststartError(f"box大小无效: {box_type!r}")
+        boxes.append((box_type, offset, size))
+        offset += size
+    return boxes
+
+
+def _iter_children(data: bytes, start: int, end: int):
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise FaststartError(f"box越界: {box_type!r}")
+        yield box_type, offset, header_size, size
+        offset += size
+
+
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", len(payload) + 8, box_type) + payload
+
+
+def _rewrite(data: bytes, start: int, end: int, delta: int, use_co64: bool) -> bytes:
+    """
+    重新生成 [start, end) 范围内的子box，数据偏移整体加上 delta
+
+    use_co64 为True时把32位的 stco 升级为64位的 co64
+    """
+    parts = []
+    for box_type, offset, header_size, size in _iter_children(data, start, end):
+        body_start = offset + header_size
+        body_end = offset + size
+        if box_type in CONTAINER_BOXES:
+            parts.append(_box(box_type, _rewrite(data, body_start, body_end, delta, use_co64)))
+        elif box_type in (b"stco", b"co64"):
+            version_flags, count = struct.unpack_from(">II", data, body_start)
+            wide = box_type == b"co64"
+            entries = struct.unpack_from(f">{count}{'Q' if wide else 'I'}", data, body_start + 8)
+            entries = [entry + delta for entry in entries]
+            if wide or use_co64:
+                payload = struct.pack(f">II{count}Q", version_flags, count, *entries)
+                parts.append(_box(b"co64", payload))
+            else:
+                if entries and max(entries) > UINT32_MAX:
+                    raise OverflowError
+                payload = struct.pack(f">II{count}I", version_flags, count, *entries)
+                parts.append(_box(b"stco", payload))
+        else:
+            parts.append(data[offset:body_end])
+    return b"".join(parts)
+
+
+def relocate_moov(moov: bytes) -> bytes:
+    """
+    生成移到文件开头后的 moov，数据偏移增加新 moov 自身的长度
+
+    移动不会改变 moov 的长度，除非偏移超出32位需要把 stco 升级为 co64
+    """
+    header_size = 16 if struct.unpack_from(">I", moov)[0] == 1 else 8
+    for use_co64 in (False, True):
+        size = len(_box(b"moov", _rewrite(moov, header_size, len(moov), 0, use_co64)))
+        try:
+            body = _rewrite(moov, header_size, len(moov), size, use_co64)
+        except OverflowError:
+            continue
+        return _box(b"moov", body)
+    raise FaststartError("无法修正数据偏移")
+
+
+def faststart(path: Path) -> bool:
+    """
+    把MP4文件的 moov 移到 mdat 之前
+
+    Returns:
+        True表示文件已被改写；moov 已在前面或文件不是普通MP4（如分片MP4）时返回False
+
+    Raises:
+        FaststartError: 文件结构无法识别或被截断
+        OSError: 读写文件失败
+    """
+    path = Path(path)
+    temp_path = path.with_name(f"{path.name}.faststart.tmp")
+
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        boxes = _read_top_level(f, file_size)
+        types = [box_type for box_type, _, _ in boxes]
+        if b"moov" not in types or b"mdat" not in types or b"moof" in types:
+            return False
+        moov_index = types.index(b"moov")
+        if moov_index < types.index(b"mdat"):
+            return False
+
+        _, moov_offset, moov_size = boxes[moov_index]
+        if moov_size > MAX_MOOV_SIZE:
+            raise FaststartError("moov过大")
+        f.seek(moov_offset)
+        moov = f.read(moov_size)
+
+        # 新 moov 放在 ftyp 之后，其余box保持原有顺序
+        insert_index = 1 if types[0] == b"ftyp" else 0
+        new_moov = relocate_moov(moov)
+
+        try:
+            with open(temp_path, "wb") as out:
+                for i, (box_type, offset, size) in enumerate(boxes):
+                    if i == insert_index:
+                        out.write(new_moov)
+                    if i == moov_index:
+                        continue
+                    f.seek(offset)
+                    remaining = size
+                    while remaining > 0:
+                        chunk = f.read(min(COPY_BUFFER_SIZE, remaining))
+                        if not chunk:
+                            raise FaststartError("文件被截断")
+                        out.write(chunk)
+                        remaining -= len(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+            # 保留原修改时间：画面内容没有变化，依赖大小和修改时间的索引、缩略图和预览版都不必重新生成
+            shutil.copystat(path, temp_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    try:
+        os.replace(temp_path, path)
+    except OSError:
+        # Windows下原文件正被其他程序打开时无法替换
+        temp_path.unlink(missing_ok=True)
+        raise
+    return True
+
+
+def finalize_recording(path, on_done: Optional[Callable[[Path, bool], None]] = None) -> threading.Thread:
+    """
+    在后台线程中对刚录制完成的视频做快速启动处理，不阻塞采集
+
+    线程不是守护线程，程序退出前会等待当前文件处理完成；
+    处理失败时保留原文件
+
+    Args:
+        path: 视频文件路径
+        on_done: 完成回调 on_done(文件路径, 是否成功)
+    """
+    path = Path(path)
+
+    def run():
+        ok = False
+        with _finalize_lock:
+            try:
+                if faststart(path):
+                    print(f"视频已优化为快速启动: {path}")
+                ok = True
+            except Exception as e:
+                print(f"视频快速启动处理失败，保留原文件: {path}, 错误: {e}")
+        if on_done is not None:
+            on_done(path, ok)
+
+    thread = threading.Thread(target=run, name="faststart")
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="把MP4文件的moov移到文件开头")
+    parser.add_argument("paths", nargs="+", help="视频文件或目录")
+    args = parser.parse_args()
+
+    for target in args.paths:
+        target = Path(target)
+        files = sorted(target.rglob("*.mp4")) if target.is_dir() else [target]
+        for video_file in files:
+            try:
+                print(f"{video_file}: {'已处理' if faststart(video_file) else '无需处理'}")
+            except (FaststartError, OSError) as e:
+                print(f"{video_file}: 处理失败 {e}")
@@ -0,0 +1,592 @@
+"""
+物流视频录制系统 - 多工位录制
+一台电脑同时带多个打包工位，每个摄像头由独立的采集进程和编码进程负责，
+两者通过 multiprocessing.shared_memory 中的环形缓冲区交换画面，互不争抢GIL；
+主进程只负责把扫码分发到对应工位，并汇总各工位状态
+
+配置（config.json）:
+    "stations": [
+        {"name": "A", "camera_index": 0, "resolution": [1280, 720], "fps": 30},
+        {"name": "B", "camera_index": 1}
+    ]
+
+用法:
+    python multi_station.py [--preview]
+    运行后在标准输入逐行输入命令（扫码枪配置为输出“工位 单号”加回车即可）：
+        A SF1234567890    工位A开始录制该单号（正在录制时先结束上一单）
+        A stop            工位A停止录制
+        status            显示各工位状态
+        quit              停止所有工位并退出
+"""
+
+import datetime
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from capture_pipeline import FramePacer, create_preroll, load_pipeline_config
+from encoders import EncoderError, load_encoder_config, open_encoder
+from faststart import finalize_recording
+
+DEFAULT_STATION = {
+    "camera_index": 0,
+    "resolution": [1280, 720],
+    "fps": 30.0,
+    # 共享内存中缓存的帧数，编码进程落后超过这个数量时丢弃最早的画面
+    "ring_slots": 60,
+}
+# 工位进程汇报状态的间隔（秒）
+STATUS_INTERVAL = 1.0
+# 预览拼图中每个工位画面的宽度
+PREVIEW_TILE_WIDTH = 480
+
+
+def load_stations(config_path: Path = Path("config.json")) -> List[dict]:
+    """读取 config.json 中的 stations 配置，未配置时只有一个使用0号摄像头的工位"""
+    stations = []
+    if config_path.exists():
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                stations = json.load(f).get("stations", [])
+        except Exception as e:
+            print(f"加载工位配置失败: {e}")
+    if not stations:
+        stations = [{"name": "1", "camera_index": 0}]
+    return [{**DEFAULT_STATION, **station, "name": str(station.get("name", i + 1))}
+            for i, station in enumerate(stations)]
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    打开其他进程创建的共享内存，只由创建方负责删除
+
+    Python 3.13 起可以不登记到 resource_tracker；更早的版本中各进程共用主进程的
+    resource_tracker，重复登记不会产生影响
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrameRing:
+    """
+    共享内存中的单写多读环形帧缓冲区
+
+    写入方（采集进程）从不等待，缓冲区满时直接覆盖最早的画面。
+    每个槽位带有序号，写入期间序号置为-1，读取方在复制前后各检查一次序号，
+    序号不一致说明画面在复制过程中被覆盖，丢弃这一帧
+
+    布局: [下一个写入序号 int64][各槽位序号 int64 x slots][各槽位采集时间 float64 x slots][画面 x slots]
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, shape: tuple, slots: int, owner: bool = False):
+        self.shm = shm
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.owner = owner
+        frame_bytes = int(np.prod(self.shape))
+        offset = 0
+        self._head = np.ndarray((1,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += 8
+        self._seqs = np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += 8 * slots
+        self._times = np.ndarray((slots,), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += 8 * slots
+        self._frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+        self.frame_bytes = frame_bytes
+
+    @staticmethod
+    def size_for(shape: tuple, slots: int) -> int:
+        return 8 + 16 * slots + int(np.prod(shape)) * slots
+
+    @classmethod
+    def create(cls, shape: tuple, slots: int) -> "SharedFrameRing":
+        shm = shared_memory.SharedMemory(create=True, size=cls.size_for(shape, slots))
+        ring = cls(shm, shape, slots, owner=True)
+        ring._head[0] = 0
+        ring._seqs[:] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, name: str, shape: tuple, slots: int) -> "SharedFrameRing":
+        return cls(attach_shared_memory(name), shape, slots)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def head(self) -> int:
+        """下一帧的序号，也就是已写入的总帧数"""
+        return int(self._head[0])
+
+    def write(self, frame: np.ndarray, timestamp: float):
+        seq = int(self._head[0])
+        slot = seq % self.slots
+        self._seqs[slot] = -1
+        np.copyto(self._frames[slot], frame)
+        self._times[slot] = timestamp
+        self._seqs[slot] = seq
+        self._head[0] = seq + 1
+
+    def read_into(self, seq: int, out: np.ndarray) -> Optional[float]:
+        """
+        复制指定序号的画面到 out
+
+        Returns:
+            采集时间；画面已被覆盖或复制过程中被改写时返回None
+        """
+        slot = seq % self.slots
+        if self._seqs[slot] != seq:
+            return None
+        timestamp = float(self._times[slot])
+        np.copyto(out, self._frames[slot])
+        if self._seqs[slot] != seq:
+            return None
+        return timestamp
+
+    def read_latest(self, out: np.ndarray) -> Optional[float]:
+        head = self.head
+        if head == 0:
+            return None
+        return self.read_into(head - 1, out)
+
+    def close(self):
+        # 释放 numpy 视图后才能关闭共享内存
+        self._head = self._seqs = self._times = self._frames = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def capture_worker(station: dict, ready, new_frame, stop_event, status_queue):
+    """
+    采集进程：读取摄像头画面写入共享内存，每写入一帧释放一次 new_frame 信号量
+
+    打开摄像头后创建共享内存，并通过 ready 把 (名称, 画面尺寸) 发回主进程
+    """
+    name = station["name"]
+    camera = cv2.VideoCapture(station["camera_index"])
+    ring = None
+    try:
+        if not camera.isOpened():
+            ready.send((None, f"无法打开摄像头 {station['camera_index']}"))
+            return
+        width, height = station["resolution"]
+        camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        ret, frame = camera.read()
+        if not ret:
+            ready.send((None, "无法从摄像头读取画面"))
+            return
+
+        ring = SharedFrameRing.create(frame.shape, station["ring_slots"])
+        ready.send((ring.name, frame.shape))
+
+        captured = 0
+        failures = 0
+        last_status = time.monotonic()
+        while not stop_event.is_set():
+            ret, frame = camera.read(frame)
+            now = time.monotonic()
+            if not ret:
+                failures += 1
+                time.sleep(0.1)
+                continue
+            ring.write(frame, now)
+            new_frame.release()
+            captured += 1
+            if now - last_status >= STATUS_INTERVAL:
+                status_queue.put((name, "capture", {"captured": captured, "read_failures": failures}))
+                last_status = now
+    except Exception as e:
+        status_queue.put((name, "capture", {"error": str(e)}))
+    finally:
+        camera.release()
+        if ring is not None:
+            ring.close()
+
+
+class StationRecorder:
+    """编码进程中的录制状态：当前文件、编码器和帧率控制"""
+
+    def __init__(self, station: dict, base_path: Path):
+        self.station = station
+        self.base_path = base_path
+        self.encoder_config = load_encoder_config()
+        self.preroll = create_preroll(load_pipeline_config())
+        self.writer = None
+        self.pacer: Optional[FramePacer] = None
+        self.tracking_number = None
+        self.current_file = None
+        self.error = None
+        self._finalizers: List[threading.Thread] = []
+
+    @property
+    def recording(self) -> bool:
+        return self.writer is not None
+
+    def start(self, tracking_number: str, frame_size: tuple):
+        if self.recording:
+            self.stop()
+        self.base_path.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = self.base_path / f"{tracking_number}_{timestamp}.mp4"
+        fps = self.station["fps"]
+        try:
+            self.writer = open_encoder(str(path), fps, frame_size, self.encoder_config)
+        except EncoderError as e:
+            self.error = f"无法创建视频文件: {e}"
+            return
+        self.error = None
+        self.pacer = FramePacer(fps)
+        self.tracking_number = tracking_number
+        self.current_file = path
+        if self.preroll is not None:
+            for frame in self.preroll.drain(fps):
+                self.writer.write(frame)
+
+    def stop(self):
+        if not self.recording:
+            return
+        try:
+            self.writer.release()
+            self._finalizers.append(finalize_recording(self.current_file))
+        except Exception as e:
+            self.error = f"停止录制失败: {e}"
+        self.writer = None
+        self.tracking_number = None
+        self.current_file = None
+        self._finalizers = [t for t in self._finalizers if t.is_alive()]
+
+    def add_frame(self, frame: np.ndarray, timestamp: float):
+        if self.recording:
+            try:
+                repeat = self.pacer.pace(timestamp)
+                for _ in range(repeat):
+                    self.writer.write(frame)
+            except Exception as e:
+                self.error = f"写入视频失败: {e}"
+                self.stop()
+        elif self.preroll is not None:
+            self.preroll.add(frame, timestamp)
+
+    def wait_finalizers(self):
+        for thread in self._finalizers:
+            thread.join()
+
+    def status(self) -> dict:
+        pacer = self.pacer
+        return {
+            "recording": self.recording,
+            "tracking_number": self.tracking_number,
+            "file": str(self.current_file) if self.current_file else None,
+            "elapsed": round(pacer.elapsed(), 1) if self.recording else 0,
+            "effective_fps": round(pacer.effective_fps, 1) if self.recording else None,
+            "written": pacer.written if self.recording else 0,
+            "error": self.error,
+        }
+
+
+def encoder_worker(station: dict, ring_name: str, shape: tuple, new_frame, commands,
+                   status_queue, base_path: str):
+    """
+    编码进程：从共享内存读取画面，按主进程发来的命令开始或停止录制
+
+    命令: ("start", 单号)、("stop",)、("shutdown",)
+    """
+    name = station["name"]
+    ring = SharedFrameRing.attach(ring_name, shape, station["ring_slots"])
+    recorder = StationRecorder(station, Path(base_path))
+    frame = np.empty(shape, dtype=np.uint8)
+    frame_size = (shape[1], shape[0])
+    next_seq = ring.head
+    overruns = 0
+    last_status = 0.0
+    try:
+        while True:
+            while commands.poll():
+                command = commands.recv()
+                if command[0] == "start":
+                    recorder.start(command[1], frame_size)
+                elif command[0] == "stop":
+                    recorder.stop()
+                elif command[0] == "shutdown":
+                    return
+                last_status = 0.0
+
+            # 未录制且未开启预录制时不需要读取画面，只跟上写入进度
+            need_frames = recorder.recording or recorder.preroll is not None
+            new_frame.acquire(timeout=0.2)
+            head = ring.head
+            if not need_frames:
+                next_seq = head
+            elif head - next_seq >= ring.slots:
+                # 落后太多，最早的画面已被覆盖
+                overruns += head - next_seq - ring.slots + 1
+                next_seq = head - ring.slots + 1
+            while next_seq < head:
+                timestamp = ring.read_into(next_seq, frame)
+                if timestamp is None:
+                    overruns += 1
+                else:
+                    recorder.add_frame(frame, timestamp)
+                next_seq += 1
+
+            now = time.monotonic()
+            if now - last_status >= STATUS_INTERVAL:
+                status_queue.put((name, "encoder", {**recorder.status(), "overruns": overruns}))
+                last_status = now
+    except Exception as e:
+        status_queue.put((name, "encoder", {"error": str(e)}))
+    finally:
+        recorder.stop()
+        recorder.wait_finalizers()
+        ring.close()
+
+
+class Station:
+    """主进程中的工位句柄：两个工作进程和它们的通信对象"""
+
+    def __init__(self, config: dict, status_queue, base_path: Path):
+        self.config = config
+        self.name = config["name"]
+        self.status_queue = status_queue
+        self.base_path = base_path
+        self.new_frame = mp.Semaphore(0)
+        self.stop_event = mp.Event()
+        self.commands, self._worker_commands = mp.Pipe()
+        self.capture_process = None
+        self.encoder_process = None
+        self.ring: Optional[SharedFrameRing] = None
+        self.status: dict = {"capture": {}, "encoder": {}}
+        self.error = None
+
+    def start(self, timeout: float = 15.0) -> bool:
+        ready_recv, ready_send = mp.Pipe(duplex=False)
+        self.capture_process = mp.Process(
+            target=capture_worker, name=f"capture-{self.name}",
+            args=(self.config, ready_send, self.new_frame, self.stop_event, self.status_queue)
+        )
+        self.capture_process.start()
+        if not ready_recv.poll(timeout):
+            self.error = "摄像头初始化超时"
+            return False
+        ring_name, shape = ready_recv.recv()
+        if ring_name is None:
+            self.error = shape
+            return False
+
+        self.ring = SharedFrameRing.attach(ring_name, shape, self.config["ring_slots"])
+        self.encoder_process = mp.Process(
+            target=encoder_worker, name=f"encoder-{self.name}",
+            args=(self.config, ring_name, shape, self.new_frame, self._worker_commands,
+                  self.status_queue, str(self.base_path))
+        )
+        self.encoder_process.start()
+        return True
+
+    def send(self, *command):
+        if self.encoder_process is None or not self.encoder_process.is_alive():
+            print(f"工位 {self.name} 未运行")
+            return
+        self.commands.send(command)
+
+    def stop(self):
+        if self.encoder_process is not None:
+            self.send("shutdown")
+            # 等待编码进程写完当前视频
+            self.encoder_process.join(timeout=60)
+        self.stop_event.set()
+        if self.capture_process is not None:
+            self.capture_process.join(timeout=5)
+            if self.capture_process.is_alive():
+                self.capture_process.terminate()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+class StationHost:
+    """
+    控制进程：启动各工位的工作进程，分发扫码命令，汇总状态
+
+    Args:
+        stations: 工位配置，见 load_stations
+        base_path: 视频保存目录
+    """
+
+    def __init__(self, stations: List[dict], base_path: Path = Path("videos")):
+        self.status_queue = mp.Queue()
+        self.stations: Dict[str, Station] = {
+            config["name"]: Station(config, self.status_queue, base_path) for config in stations
+        }
+        self._collector: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if os.name == "posix":
+            # 先在主进程启动 resource_tracker，所有工作进程共用同一个，
+            # 否则先启动的采集进程会自己另起一个，共享内存的登记和注销对不上
+            from multiprocessing import resource_tracker
+            resource_tracker.ensure_running()
+        for station in self.stations.values():
+            if station.start():
+                print(f"工位 {station.name} 已启动，摄像头 {station.config['camera_index']}")
+            else:
+                print(f"工位 {station.name} 启动失败: {station.error}")
+        self._collector = threading.Thread(target=self._collect_status, name="station-status", daemon=True)
+        self._collector.start()
+
+    def stop(self):
+        self._stopping.set()
+        for station in self.stations.values():
+            station.stop()
+
+    def _collect_status(self):
+        while not self._stopping.is_set():
+            try:
+                name, source, status = self.status_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            station = self.stations.get(name)
+            if station is not None:
+                station.status[source] = status
+
+    def handle_command(self, line: str) -> bool:
+        """
+        处理一行命令
+
+        Returns:
+            False表示退出
+        """
+        parts = line.split()
+        if not parts:
+            return True
+        if parts[0] in ("quit", "exit"):
+            return False
+        if parts[0] == "status":
+            print(self.format_status())
+            return True
+        if len(parts) != 2:
+            print("命令格式: <工位> <单号> | <工位> stop | status | quit")
+            return True
+
+        name, argument = parts
+        station = self.stations.get(name)
+        if station is None:
+            print(f"未知工位: {name}，可用工位: {', '.join(self.stations)}")
+        elif argument == "stop":
+            station.send("stop")
+        else:
+            station.send("start", argument)
+        return True
+
+    def format_status(self) -> str:
+        lines = [f"{'工位':<6}{'状态':<8}{'单号':<22}{'时长':>8}{'帧率':>8}{'采集帧':>10}{'丢帧':>8}"]
+        for station in self.stations.values():
+            capture = station.status.get("capture", {})
+            encoder = station.status.get("encoder", {})
+            if station.error or capture.get("error") or encoder.get("error"):
+                state = "错误"
+            elif encoder.get("recording"):
+                state = "录制中"
+            else:
+                state = "空闲"
+            lines.append(
+                f"{station.name:<8}{state:<8}{encoder.get('tracking_number') or '-':<24}"
+                f"{encoder.get('elapsed', 0):>8}{encoder.get('effective_fps') or '-':>10}"
+                f"{capture.get('captured', 0):>10}{encoder.get('overruns', 0):>8}"
+            )
+            error = station.error or capture.get("error") or encoder.get("error")
+            if error:
+                lines.append(f"        {error}")
+        return "\n".join(lines)
+
+    def preview_mosaic(self) -> Optional[np.ndarray]:
+        """把各工位最新画面缩小拼成一张图，并标注录制状态"""
+        tiles = []
+        for station in self.stations.values():
+            ring = station.ring
+            if ring is None:
+                continue
+            frame = np.empty(ring.shape, dtype=np.uint8)
+            if ring.read_latest(frame) is None:
+                continue
+            height = round(ring.shape[0] * PREVIEW_TILE_WIDTH / ring.shape[1])
+            tile = cv2.resize(frame, (PREVIEW_TILE_WIDTH, height), interpolation=cv2.INTER_AREA)
+            encoder = station.status.get("encoder", {})
+            label = station.name
+            if encoder.get("recording"):
+                label += f" REC {encoder.get('tracking_number')}"
+                cv2.circle(tile, (PREVIEW_TILE_WIDTH - 20, 20), 8, (0, 0, 255), -1)
+            cv2.putText(tile, label, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+            tiles.append(tile)
+        if not tiles:
+            return None
+
+        columns = min(3, len(tiles))
+        height = max(tile.shape[0] for tile in tiles)
+        rows = []
+        for i in range(0, len(tiles), columns):
+            row = [cv2.copyMakeBorder(tile, 0, height - tile.shape[0], 0, 0, cv2.BORDER_CONSTANT)
+                   for tile in tiles[i:i + columns]]
+            row += [np.zeros_like(row[0])] * (columns - len(row))
+            rows.append(np.hstack(row))
+        return np.vstack(rows)
+
+
+def read_commands(host: StationHost, done: threading.Event):
+    for line in sys.stdin:
+        if not host.handle_command(line.strip()):
+            break
+    done.set()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="多工位视频录制")
+    parser.add_argument("--preview", action="store_true", help="显示各工位画面拼图")
+    parser.add_argument("--videos", default="videos", help="视频保存目录")
+    args = parser.parse_args()
+
+    host = StationHost(load_stations(), Path(args.videos))
+    host.start()
+    done = threading.Event()
+    threading.Thread(target=read_commands, args=(host, done), daemon=True).start()
+    try:
+        while not done.is_set():
+            if args.preview:
+                mosaic = host.preview_mosaic()
+                if mosaic is not None:
+                    cv2.imshow("Stations", mosaic)
+                if cv2.waitKey(100) & 0xFF == 27:
+                    break
+            else:
+                done.wait(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("正在停止所有工位...")
+        host.stop()
+        if args.preview:
+            cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,53 @@
 #!/usr/bin/env python3
 import os
 import sys
+import json
 import subprocess
 import site
 import glob
+import importlib.util
+from functools import lru_cache
+from importlib import metadata
+
+# 依赖检查和Qt插件路径的结果缓存，Python环境（解释器或已安装的包）变化后自动失效
+STARTUP_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".startup_cache.json")
+
+
+def environment_fingerprint():
+    """解释器路径、版本和 site-packages 目录的修改时间，安装或卸载包会改变目录修改时间"""
+    parts = [sys.executable, sys.version]
+    try:
+        directories = site.getsitepackages() + [site.getusersitepackages()]
+    except AttributeError:
+        # 部分虚拟环境中的 site 模块没有 getsitepackages
+        directories = [path for path in sys.path if path.endswith("site-packages")]
+    for directory in directories:
+        try:
+            parts.append(f"{directory}:{os.stat(directory).st_mtime_ns}")
+        except OSError:
+            pass
+    return "|".join(parts)
+
+
+def load_startup_cache():
+    try:
+        with open(STARTUP_CACHE, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("fingerprint") == environment_fingerprint():
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def save_startup_cache(**values):
+    cache = load_startup_cache()
+    cache.update(values, fingerprint=environment_fingerprint())
+    try:
+        with open(STARTUP_CACHE, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+    except OSError:
+        pass
 
 def find_qt_plugin_path():
     """查找 Qt 插件路径（支持PyInstaller打包后的应用）"""
@@ -52,26 +96,36 @@ def find_qt_plugin_path():
             print(f"找到 Qt 插件路径: {path}")
             return path
             
-    # 如果没找到，尝试使用 pip show 命令（仅开发环境）
+    # 如果没找到，按 PyQt6 包的实际位置查找（仅开发环境，不导入PyQt6也不启动pip进程）
     if not getattr(sys, 'frozen', False):
         try:
-            result = subprocess.check_output([sys.executable, "-m", "pip", "show", "PyQt6"]).decode()
-            for line in result.split("\n"):
-                if line.startswith("Location:"):
-                    base_path = line.split(": ")[1].strip()
-                    qt_path = os.path.join(base_path, "PyQt6", "Qt6", "plugins")
-                    if os.path.exists(qt_path) and os.path.exists(os.path.join(qt_path, "platforms")):
-                        print(f"找到 Qt 插件路径: {qt_path}")
-                        return qt_path
-        except:
-            pass
+            spec = importlib.util.find_spec("PyQt6")
+        except (ImportError, ValueError):
+            spec = None
+        for package_dir in (spec.submodule_search_locations or []) if spec else []:
+            for qt_dir in ("Qt6", "Qt"):
+                qt_path = os.path.join(package_dir, qt_dir, "plugins")
+                if os.path.exists(os.path.join(qt_path, "platforms")):
+                    print(f"找到 Qt 插件路径: {qt_path}")
+                    return qt_path
         
     return None
 
+
+def cached_qt_plugin_path():
+    """使用缓存的Qt插件路径，缓存失效或路径已不存在时重新查找"""
+    path = load_startup_cache().get("qt_plugin_path")
+    if path and os.path.exists(os.path.join(path, "platforms")):
+        return path
+    path = find_qt_plugin_path()
+    if path:
+        save_startup_cache(qt_plugin_path=path)
+    return path
+
 # 在导入PyQt6之前设置Qt插件路径（关键！）
 def setup_qt_environment():
     """在导入PyQt6之前设置Qt环境"""
-    qt_plugin_path = find_qt_plugin_path()
+    qt_plugin_path = cached_qt_plugin_path()
     if qt_plugin_path:
         os.environ['QT_QPA_PLATFORM_PLUGIN_PATH'] = qt_plugin_path
         print(f"设置 Qt 插件路径: {qt_plugin_path}")
@@ -92,57 +146,76 @@ def setup_qt_environment():
 if not getattr(sys, 'frozen', False):
     setup_qt_environment()
 
+# 依赖包: (可以满足要求的发行包名, 导入的模块名)
+REQUIRED_PACKAGES = {
+    'PyQt6': (['PyQt6'], 'PyQt6'),
+    'opencv-python': (['opencv-python', 'opencv-contrib-python',
+                       'opencv-python-headless', 'opencv-contrib-python-headless'], 'cv2'),
+    'numpy': (['numpy'], 'numpy'),
+    'reportlab': (['reportlab'], 'reportlab'),
+}
+
+
+@lru_cache(maxsize=None)
+def installed_version(distribution):
+    """查询已安装的发行包版本，未安装时返回None；只读取包的元数据，不导入模块"""
+    try:
+        return metadata.version(distribution)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def is_installed(package_group):
+    distributions, module = REQUIRED_PACKAGES[package_group]
+    if any(installed_version(name) for name in distributions):
+        return True
+    # 没有元数据（如直接复制到 site-packages 的包）时确认模块能否找到，同样不执行导入
+    try:
+        return importlib.util.find_spec(module) is not None
+    except (ImportError, ValueError):
+        return False
+
+
 def check_and_install_dependencies():
-    """检查并安装所需的依赖"""
-    required = {
-        'PyQt6': ['PyQt6'],
-        'opencv-python': ['opencv-python'],
-        'numpy': ['numpy'],
-        'python-barcode': ['python-barcode'],
-        'reportlab': ['reportlab'],
-        'Pillow': ['Pillow']
-    }
-    
+    """检查并安装所需的依赖，Python环境没有变化时直接使用上次的检查结果"""
+    if load_startup_cache().get("dependencies_ok"):
+        print("依赖检查通过（缓存）")
+        return
+
     print("正在检查并安装依赖...")
     
-    for package_group, packages in required.items():
+    for package_group, (packages, _) in REQUIRED_PACKAGES.items():
         print(f"\n检查 {package_group}...")
         try:
-            if package_group == 'PyQt6':
-                 import PyQt6.QtCore
-            else:
-                # 尝试导入
-                if package_group == 'opencv-python':
-                    import cv2
-                elif package_group == 'Pillow':
-                    import PIL
-                else:
-                    __import__(package_group.replace('-', '_'))
+            if is_installed(package_group):
                 print(f"✓ {package_group} 已安装")
-        except (ImportError, ModuleNotFoundError):
+                continue
+
+            # 可选的发行包中安装第一个
+            pkg = packages[0]
             print(f"安装 {package_group}...")
-            for pkg in packages:
-                try:
-                    subprocess.check_call([
-                        sys.executable, "-m", "pip", "install",
-                        "--no-cache-dir",
-                        "--index-url", "https://pypi.org/simple",
-                        pkg
-                    ])
-                    print(f"✓ {pkg} 安装成功")
-                except subprocess.CalledProcessError as e:
-                    print(f"✗ {pkg} 安装失败: {str(e)}")
-                    sys.exit(1)
+            try:
+                subprocess.check_call([
+                    sys.executable, "-m", "pip", "install",
+                    "--no-cache-dir",
+                    "--index-url", "https://pypi.org/simple",
+                    pkg
+                ])
+                print(f"✓ {pkg} 安装成功")
+            except subprocess.CalledProcessError as e:
+                print(f"✗ {pkg} 安装失败: {str(e)}")
+                sys.exit(1)
         except Exception as e:
             print(f"✗ {package_group} 检查失败: {str(e)}")
             sys.exit(1)
     
+    # 安装新包会改变环境指纹，这里保存的是安装后的状态
+    save_startup_cache(dependencies_ok=True)
     print("\n所有依赖检查完成")
 
 def main():
     """主函数"""
     # 注意：Qt环境已经在文件顶部设置好了
-    # 注意：Qt环境已经在文件顶部设置好了
     if not getattr(sys, 'frozen', False):
         print("检查依赖...")
         check_and_install_dependencies()
@@ -171,4 +244,7 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
+    # 打包后的程序中，条形码PDF等多进程任务的子进程需要从这里进入
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,114 @@
+"""
+Web API 事件循环延迟测试
+索引库中有大量记录时，同时请求视频列表（JSON 和 NDJSON），
+用一个定时协程测量事件循环被阻塞的最长时间
+"""
+
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "web" / "api"))
+
+httpx = pytest.importorskip("httpx")
+main = pytest.importorskip("main")
+
+ROW_COUNT = 20000
+# 定时协程的间隔（秒）
+TICK_INTERVAL = 0.005
+# 允许的最长事件循环延迟（秒），列表查询都在线程池中执行，单次序列化最多 2000 条
+MAX_LOOP_LAG = 0.25
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """指向临时目录、关闭后台转码和进程池的 Web API"""
+    for name, directory in (("VIDEOS_DIR", "videos"), ("REPORTS_DIR", "reports"), ("EXPORTS_DIR", "exports"),
+                            ("THUMBNAILS_DIR", "thumbnails"), ("PROXIES_DIR", "proxies")):
+        monkeypatch.setattr(main, name, tmp_path / directory)
+    monkeypatch.setattr(main, "CATALOG_FILE", tmp_path / "catalog.db")
+    monkeypatch.setitem(main.WEB_SETTINGS, "thumbnail_workers", 0)
+    monkeypatch.setitem(main.WEB_SETTINGS, "proxy_workers", 0)
+    monkeypatch.setitem(main.WEB_SETTINGS, "probe_processes", 0)
+    return main
+
+
+def make_records(count):
+    start = datetime(2025, 1, 1, 8, 0, 0)
+    for index in range(count):
+        timestamp = (start + timedelta(seconds=37 * index)).strftime("%Y-%m-%d %H:%M:%S")
+        tracking_number = f"SF{1000000000 + index}"
+        yield {
+            "path": f"{tracking_number}_{timestamp.replace('-', '').replace(':', '').replace(' ', '_')}.mp4",
+            "tracking_number": tracking_number,
+            "timestamp": timestamp,
+            "size": 1024 * 1024,
+            "mtime": 0,
+            "duration": 30.0,
+            "problems": ["破损"] if index % 10 == 0 else [],
+            "notes": "",
+        }
+
+
+async def wait_until_ready(api, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not (api.catalog.ready and api.tracking_index.ready):
+        assert time.monotonic() < deadline, "索引同步超时"
+        await asyncio.sleep(0.05)
+
+
+async def measure_lag(api):
+    async with api.lifespan(api.app):
+        await wait_until_ready(api)
+        # 启动同步会移除磁盘上不存在的记录，因此同步完成后再写入
+        await asyncio.to_thread(api.catalog.upsert_many, list(make_records(ROW_COUNT)))
+
+        max_lag = 0.0
+        stop = asyncio.Event()
+
+        async def ticker():
+            nonlocal max_lag
+            while not stop.is_set():
+                expected = time.perf_counter() + TICK_INTERVAL
+                await asyncio.sleep(TICK_INTERVAL)
+                max_lag = max(max_lag, time.perf_counter() - expected)
+
+        async def list_pages(client, fmt):
+            cursor = None
+            rows = 0
+            for _ in range(5):
+                params = {"limit": 2000, "format": fmt}
+                if cursor:
+                    params["cursor"] = cursor
+                response = await client.get("/api/videos", params=params)
+                assert response.status_code == 200
+                if fmt == "json":
+                    rows += len(response.json())
+                    cursor = response.headers.get("X-Next-Cursor")
+                else:
+                    lines = response.text.splitlines()
+                    cursor = None
+                    if lines and lines[-1].startswith('{"next_cursor"'):
+                        cursor = httpx.Response(200, content=lines.pop()).json()["next_cursor"]
+                    rows += len(lines)
+                if not cursor:
+                    break
+            return rows
+
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            tick_task = asyncio.create_task(ticker())
+            counts = await asyncio.gather(*(list_pages(client, fmt) for fmt in ("json", "ndjson", "json", "ndjson")))
+            stop.set()
+            await tick_task
+        return counts, max_lag
+
+
+def test_listing_does_not_block_event_loop(api):
+    counts, max_lag = asyncio.run(measure_lag(api))
+    assert counts == [10000] * 4
+    assert max_lag < MAX_LOOP_LAG, f"事件循环最长被阻塞 {max_lag * 1000:.0f} ms"
@@ -1,11 +1,15 @@
 import cv2
 import os
 import datetime
-import keyboard
-from threading import Thread, Event
+from threading import Thread, Event, RLock
 import time
 import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+from faststart import finalize_recording
+from capture_pipeline import FramePacer, ThreadedVideoWriter, create_preroll, load_pipeline_config
+from encoders import load_encoder_config, open_encoder
 
 class LogisticsVideoRecorder:
     def __init__(self):
@@ -13,14 +17,33 @@ class LogisticsVideoRecorder:
         self.config = self.load_config()
         self.camera = None
         self.current_writer = None
+        self.current_file = None
         self.recording = False
         self.current_tracking_number = None
         self.stop_event = Event()
+        # 守护模式的HTTP请求和键盘扫码可能同时开始/停止录制，两者整体串行执行；
+        # start_recording 内部会调用 stop_recording，因此使用可重入锁
+        self._recording_lock = RLock()
         self.base_path = "videos"
-        self.record_start_time = None
+        # 录制时按采集时间补帧/丢帧，保证视频时长与实际时间一致
+        self.pacer = None
         self.frame_count = 0
+        # 最近一帧画面（已绘制状态信息），引用采集缓冲区，使用方需自行复制
         self.last_frame = None
+        # 两块采集缓冲区轮流使用，读取下一帧时 last_frame 仍然有效
+        self._capture_buffers = [None, None]
         self.recording_error = False
+        # 守护模式：无窗口、不在画面上绘制状态，空闲时只抓取不解码
+        self.headless = False
+        self._snapshot_requested = Event()
+        self._snapshot_ready = Event()
+        self._snapshot = None
+        # 未录制时保留最近几秒画面，扫码开始录制时写在视频开头
+        pipeline = load_pipeline_config()
+        self.preroll = create_preroll(pipeline)
+        # 守护模式空闲时只按此间隔解码画面放入预录制缓冲区
+        preroll_fps = pipeline["daemon_preroll_fps"]
+        self.daemon_preroll_interval = 1.0 / preroll_fps if preroll_fps > 0 else 0.0
 
     def load_config(self):
         """加载配置文件，如果不存在则使用默认值"""
@@ -61,77 +84,77 @@ class LogisticsVideoRecorder:
 
     def start_recording(self, tracking_number):
         """开始录制视频"""
-        try:
-            if self.recording:
-                self.stop_recording()
+        with self._recording_lock:
+            try:
+                if self.recording:
+                    self.stop_recording()
 
-            # 确保videos目录存在
-            os.makedirs(self.base_path, exist_ok=True)
-            
-            # 生成文件名：快递单号_YYYYMMDD_HHMMSS.mp4
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{tracking_number}_{timestamp}.mp4"
-            filepath = os.path.join(self.base_path, filename)
-
-            # 尝试不同的编码器
-            codecs = [self.config["codec"], "mp4v", "XVID"]
-            writer = None
+                # 确保videos目录存在
+                os.makedirs(self.base_path, exist_ok=True)
             
-            for codec in codecs:
-                try:
-                    fourcc = cv2.VideoWriter_fourcc(*codec)
-                    writer = cv2.VideoWriter(
-                        filepath, 
-                        fourcc, 
-                        self.config["fps"],
-                        (int(self.camera.get(3)), int(self.camera.get(4)))
-                    )
-                    if writer.isOpened():
-                        break
-                except Exception as e:
-                    print(f"编码器 {codec} 初始化失败: {e}")
-                    if writer is not None:
-                        writer.release()
-            
-            if writer is None or not writer.isOpened():
-                raise Exception("无法创建视频文件，所有编码器都失败了")
+                # 生成文件名：快递单号_YYYYMMDD_HHMMSS.mp4
+                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                filename = f"{tracking_number}_{timestamp}.mp4"
+                filepath = os.path.join(self.base_path, filename)
+
+                # 按 encoder 配置选择编码器，使用OpenCV时依次尝试不同的编码格式
+                writer = open_encoder(
+                    filepath,
+                    self.config["fps"],
+                    (int(self.camera.get(3)), int(self.camera.get(4))),
+                    load_encoder_config(),
+                    opencv_codecs=(self.config["codec"], "mp4v", "XVID")
+                )
             
-            self.current_writer = writer
-            self.recording = True
-            self.current_tracking_number = tracking_number
-            self.record_start_time = time.time()
-            self.frame_count = 0
-            self.recording_error = False
-            print(f"开始录制视频: {tracking_number}")
+                # 编码写盘放到独立线程，写完后在后台把moov移到文件开头，便于Web端边下载边播放
+                pipeline = load_pipeline_config()
+                self.current_writer = ThreadedVideoWriter(
+                    writer, pipeline["queue_size"], pipeline["policy"],
+                    on_closed=lambda: finalize_recording(filepath),
+                    preroll=self.preroll.drain(self.config["fps"]) if self.preroll is not None else None,
+                    fps=self.config["fps"]
+                )
+                self.current_file = filepath
+                self.current_tracking_number = tracking_number
+                self.pacer = FramePacer(self.config["fps"])
+                self.frame_count = 0
+                self.recording_error = False
+                # 写入器和补帧器都就绪后再置录制标志，录制线程不会看到只设置了一半的状态
+                self.recording = True
+                print(f"开始录制视频: {tracking_number}")
             
-        except Exception as e:
-            print(f"开始录制失败: {str(e)}")
-            self.recording_error = True
-            if self.current_writer is not None:
-                self.current_writer.release()
-                self.current_writer = None
+            except Exception as e:
+                print(f"开始录制失败: {str(e)}")
+                self.recording_error = True
+                if self.current_writer is not None:
+                    self.current_writer.release()
+                    self.current_writer = None
 
     def stop_recording(self):
         """停止录制视频"""
-        if self.recording and self.current_writer is not None:
-            try:
-                self.recording = False
-                self.current_writer.release()
-                print(f"结束录制视频: {self.current_tracking_number}")
-                print(f"总共录制了 {self.frame_count} 帧")
-            except Exception as e:
-                print(f"停止录制时发生错误: {str(e)}")
-            finally:
-                self.current_tracking_number = None
-                self.record_start_time = None
-                self.current_writer = None
+        with self._recording_lock:
+            if self.recording and self.current_writer is not None:
+                try:
+                    self.recording = False
+                    self.current_writer.release()
+                    print(f"结束录制视频: {self.current_tracking_number}")
+                    print(f"总共录制了 {self.frame_count} 帧，实测采集帧率 {self.pacer.effective_fps:.1f}，"
+                          f"补帧 {self.pacer.duplicated}，跳帧 {self.pacer.dropped}")
+                except Exception as e:
+                    print(f"停止录制时发生错误: {str(e)}")
+                finally:
+                    self.current_tracking_number = None
+                    self.pacer = None
+                    self.current_writer = None
+                    self.current_file = None
 
     def draw_status(self, frame):
         """在画面上显示录制状态"""
         try:
-            if self.recording:
+            pacer = self.pacer
+            if self.recording and pacer is not None:
                 # 添加录制状态和时长
-                elapsed_time = time.time() - self.record_start_time
+                elapsed_time = pacer.elapsed()
                 minutes = int(elapsed_time // 60)
                 seconds = int(elapsed_time % 60)
                 
@@ -147,10 +170,9 @@ class LogisticsVideoRecorder:
                            self.config["font_scale"], self.config["font_color"], 
                            self.config["font_thickness"])
                 
-                # 显示帧率
+                # 显示实测采集帧率
                 if elapsed_time > 0:
-                    current_fps = self.frame_count / elapsed_time
-                    cv2.putText(frame, f"FPS: {int(current_fps)}", 
+                    cv2.putText(frame, f"FPS: {int(pacer.effective_fps)}", 
                                (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 
                                self.config["font_scale"], self.config["font_color"], 
                                self.config["font_thickness"])
@@ -171,26 +193,55 @@ class LogisticsVideoRecorder:
 
     def record_frame(self):
         """录制帧"""
+        buffer_index = 0
+        next_preroll = 0.0
         while not self.stop_event.is_set():
             try:
-                ret, frame = self.camera.read()
+                # 守护模式空闲时没有人看画面，grab 只从摄像头取数据不解码，CPU占用很低；
+                # 开启预录制时只按 daemon_preroll_fps 解码（retrieve）其中一部分画面
+                if self.headless and not self.recording and not self._snapshot_requested.is_set():
+                    if not self.camera.grab():
+                        print("无法读取摄像头画面")
+                        time.sleep(0.1)
+                        continue
+                    captured_at = time.monotonic()
+                    if self.preroll is None or captured_at < next_preroll:
+                        continue
+                    next_preroll = captured_at + self.daemon_preroll_interval
+                    buffer_index ^= 1
+                    ret, frame = self.camera.retrieve(self._capture_buffers[buffer_index])
+                else:
+                    buffer_index ^= 1
+                    ret, frame = self.camera.read(self._capture_buffers[buffer_index])
+                    captured_at = time.monotonic()
                 if not ret or frame is None:
                     print("无法读取摄像头画面")
                     if self.recording:
                         self.recording_error = True
                     continue
 
-                self.last_frame = frame.copy()
-                frame = self.draw_status(frame)
+                self._capture_buffers[buffer_index] = frame
+                if not self.headless:
+                    frame = self.draw_status(frame)
+                    cv2.imshow('Recording', frame)
+                self.last_frame = frame
+                if self._snapshot_requested.is_set():
+                    self._take_snapshot(frame)
                 
-                cv2.imshow('Recording', frame)
-                
-                if self.recording and self.current_writer is not None and not self.recording_error:
-                    self.current_writer.write(frame)
-                    self.frame_count += 1
+                writer = self.current_writer
+                pacer = self.pacer
+                if not self.recording and self.preroll is not None:
+                    self.preroll.add(frame, captured_at)
+                elif self.recording and writer is not None and pacer is not None and not self.recording_error:
+                    # 补上开始录制时取出预录制画面之后、录制标志生效之前的几帧
+                    if self.preroll is not None and len(self.preroll):
+                        for buffered in self.preroll.drain(writer.fps):
+                            writer.write(buffered)
+                    writer.write(frame, pacer.pace(captured_at))
+                    self.frame_count = pacer.written
                 
                 # 按ESC键退出
-                if cv2.waitKey(1) & 0xFF == 27:
+                if not self.headless and cv2.waitKey(1) & 0xFF == 27:
                     break
                     
             except Exception as e:
@@ -198,8 +249,38 @@ class LogisticsVideoRecorder:
                 if self.recording:
                     self.recording_error = True
 
+    def _take_snapshot(self, frame):
+        ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        self._snapshot = data.tobytes() if ok else None
+        self._snapshot_requested.clear()
+        self._snapshot_ready.set()
+
+    def snapshot(self, timeout=2.0):
+        """由其他线程调用：取当前画面的JPEG数据，超时返回None"""
+        self._snapshot_ready.clear()
+        self._snapshot_requested.set()
+        if not self._snapshot_ready.wait(timeout):
+            return None
+        return self._snapshot
+
+    def status(self):
+        """当前录制状态"""
+        pacer = self.pacer
+        return {
+            "recording": self.recording,
+            "tracking_number": self.current_tracking_number,
+            "file": self.current_file,
+            "elapsed": round(pacer.elapsed(), 1) if pacer is not None else 0,
+            "effective_fps": round(pacer.effective_fps, 1) if pacer is not None else None,
+            "frames": self.frame_count,
+            "error": self.recording_error,
+            "writer": self.current_writer.stats() if self.current_writer is not None else None,
+        }
+
     def handle_barcode_input(self):
         """处理条码扫描输入"""
+        import keyboard
+
         tracking_number = ""
         while not self.stop_event.is_set():
             try:
@@ -239,6 +320,119 @@ class LogisticsVideoRecorder:
                 self.camera.release()
             cv2.destroyAllWindows()
 
+    def run_daemon(self, host="127.0.0.1", port=8765):
+        """
+        守护模式：不打开窗口、不监听键盘，通过本机HTTP接口控制录制
+
+        GET  /status                      录制状态
+        POST /start?tracking_number=单号   开始录制（正在录制时先结束上一单）
+        POST /stop                        停止录制
+        GET  /snapshot                    当前画面（JPEG）
+        """
+        self.headless = True
+        server = None
+        try:
+            self.setup_camera()
+            os.makedirs(self.base_path, exist_ok=True)
+
+            record_thread = Thread(target=self.record_frame, name="record")
+            record_thread.start()
+
+            server = ThreadingHTTPServer((host, port), make_control_handler(self))
+            server.daemon_threads = True
+            print(f"录制守护进程已启动，控制接口: http://{host}:{port}")
+            server.serve_forever()
+
+        except KeyboardInterrupt:
+            print("正在停止录制...")
+        except Exception as e:
+            print(f"程序运行时发生错误: {str(e)}")
+        finally:
+            if server is not None:
+                server.server_close()
+            self.stop_event.set()
+            if self.recording:
+                self.stop_recording()
+            if self.camera is not None:
+                self.camera.release()
+
+
+def make_control_handler(recorder):
+    """生成守护模式控制接口的请求处理类"""
+
+    class ControlHandler(BaseHTTPRequestHandler):
+        # 保持连接并关闭Nagle算法，连续发送命令时省去建立连接和等待合并发送的时间
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/status":
+                self.send_json(200, recorder.status())
+            elif path == "/snapshot":
+                data = recorder.snapshot()
+                if data is None:
+                    self.send_json(503, {"error": "无法获取画面"})
+                else:
+                    self.send_body(200, data, "image/jpeg")
+            else:
+                self.send_json(404, {"error": "未知接口"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                body = self.rfile.read(length)
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    try:
+                        params.update({k: [str(v)] for k, v in json.loads(body).items()})
+                    except (ValueError, AttributeError):
+                        self.send_json(400, {"error": "请求内容不是有效的JSON对象"})
+                        return
+
+            if url.path == "/start":
+                tracking_number = (params.get("tracking_number") or [""])[0].strip()
+                if not tracking_number:
+                    self.send_json(400, {"error": "缺少 tracking_number"})
+                    return
+                recorder.start_recording(tracking_number)
+                status = recorder.status()
+                self.send_json(500 if status["error"] else 200, status)
+            elif url.path == "/stop":
+                recorder.stop_recording()
+                self.send_json(200, recorder.status())
+            else:
+                self.send_json(404, {"error": "未知接口"})
+
+        def send_json(self, code, data):
+            self.send_body(code, json.dumps(data, ensure_ascii=False).encode("utf-8"),
+                           "application/json; charset=utf-8")
+
+        def send_body(self, code, body, content_type):
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ControlHandler
+
+
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="物流视频录制（命令行版）")
+    parser.add_argument("--daemon", action="store_true", help="无窗口运行，通过本机HTTP接口控制")
+    parser.add_argument("--host", default="127.0.0.1", help="控制接口监听地址")
+    parser.add_argument("--port", type=int, default=8765, help="控制接口端口")
+    args = parser.parse_args()
+
     recorder = LogisticsVideoRecorder()
-    recorder.run()
+    if args.daemon:
+        recorder.run_daemon(args.host, args.port)
+    else:
+        recorder.run()
@@ -1,6 +1,7 @@
 import sys
 import cv2
 import json
+import numpy as np
 import os
 import shutil
 from datetime import datetime
@@ -10,31 +11,57 @@ from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                             QSpinBox, QComboBox, QMessageBox, QFileDialog,
                             QTableWidget, QTableWidgetItem, QDialog, 
                             QTextEdit, QHeaderView, QCheckBox, QGroupBox,
-                            QGridLayout, QListWidget, QListWidgetItem)
-from PyQt6.QtCore import Qt, QTimer, pyqtSignal, QThread
+                            QGridLayout, QListWidget, QListWidgetItem, QTableView,
+                            QAbstractItemView, QStyledItemDelegate, QStyle,
+                            QStyleOptionButton, QStyleOptionViewItem, QProgressDialog)
+from PyQt6.QtCore import (Qt, QTimer, pyqtSignal, QThread, QEvent, QAbstractTableModel,
+                          QModelIndex, QSortFilterProxyModel, QFileSystemWatcher, QEventLoop)
 from PyQt6.QtGui import QImage, QPixmap, QIcon, QFont
-import barcode
-from barcode.writer import ImageWriter
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from PIL import Image as PILImage
 import time
 import subprocess
 import csv
-from reportlab.pdfgen import canvas
-import fnmatch
+import heapq
+from faststart import finalize_recording
+from capture_pipeline import (BufferPool, FramePacer, ThreadedVideoWriter, create_preroll,
+                              load_pipeline_config)
+from encoders import load_encoder_config, open_encoder
+from camera_discovery import (discover_cameras, load_cached_cameras, refresh_in_background,
+                              save_cached_cameras)
+
+class PreviewFrame:
+    """
+    发给主线程的预览帧
+
+    image 直接引用缓冲池中的内存，本对象持有该缓冲区和缓冲池的引用，
+    视频线程退出或被释放后内存仍然有效；显示完后调用 release 交还缓冲区
+    """
+
+    __slots__ = ("image", "_buffer", "_pool", "_slot")
+
+    def __init__(self, image, buffer, pool, slot):
+        self.image = image
+        self._buffer = buffer
+        self._pool = pool
+        self._slot = slot
+
+    def release(self):
+        if self._pool is not None:
+            self._pool.release(self._slot)
+            self._pool = None
+            self._buffer = None
+
 
 class VideoThread(QThread):
-    frame_ready = pyqtSignal(QImage)
+    frame_ready = pyqtSignal(object)  # PreviewFrame，显示后须调用其 release
+    camera_ready = pyqtSignal(int, int)  # 摄像头已打开并读到画面，参数为实际分辨率
+    camera_failed = pyqtSignal()  # 摄像头打开或读取第一帧失败，线程随即退出
     error = pyqtSignal(str)
     fps_update = pyqtSignal(float)
+    pipeline_stats = pyqtSignal(dict)  # 写入队列深度、丢帧数等
     recording_timeout = pyqtSignal()  # 新增录制超时信号
     MAX_RECORDING_TIME = 5 * 60  # 5分钟，单位：秒
     WARNING_TIME = 30  # 剩余30秒时发出警告
+    PREVIEW_BUFFERS = 3  # 主线程来不及显示时最多积压的预览帧数
 
     def __init__(self, config):
         super().__init__()
@@ -45,40 +72,96 @@ class VideoThread(QThread):
         self.writer = None
         self.current_file = None
         self.frame_count = 0
-        self.start_time = None
+        self.pacer = None  # 录制时按采集时间补帧/丢帧，由主线程在开始录制时设置
         self.warning_sent = False
+        pipeline = load_pipeline_config()
+        # 未录制时保留最近几秒画面，扫码开始录制时写在视频开头
+        self.preroll = create_preroll(pipeline)
+        # 预览按窗口中预览区域的大小在本线程缩小，刷新率与录制帧率无关
+        self.preview_interval = 1.0 / max(1.0, pipeline["preview_fps"])
+        self.preview_size = (640, 480)
+        self.preview_visible = True
+        self._last_preview = 0.0
+        self._preview_bgr = None
+        # 预览图像直接引用池中的内存，主线程显示完交还后才会被复用
+        self.preview_pool = BufferPool(self.PREVIEW_BUFFERS)
+        # 摄像头画面读入同一块内存，写入队列和预录制都会自行复制
+        self._capture_buffer = None
+
+    def set_preview_target(self, width, height, visible):
+        """由主线程调用：预览区域的像素尺寸，以及窗口是否可见（最小化或隐藏时停止发送预览）"""
+        self.preview_size = (max(1, width), max(1, height))
+        self.preview_visible = visible
+
+    def emit_preview(self, frame):
+        """把画面等比缩小到预览区域大小，转为RGB后发送给主线程"""
+        now = time.monotonic()
+        if not self.preview_visible or now - self._last_preview < self.preview_interval:
+            return
+        self._last_preview = now
+
+        h, w = frame.shape[:2]
+        target_w, target_h = self.preview_size
+        scale = min(target_w / w, target_h / h, 1.0)
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        shape = (size[1], size[0], 3)
+
+        # 主线程还没显示完之前的预览帧，跳过这一帧
+        slot = self.preview_pool.acquire(shape)
+        if slot is None:
+            return
+        rgb = self.preview_pool.buffer(slot)
+
+        source = frame
+        if size != (w, h):
+            if self._preview_bgr is None or self._preview_bgr.shape != shape:
+                self._preview_bgr = np.empty(shape, dtype=np.uint8)
+            cv2.resize(frame, size, dst=self._preview_bgr, interpolation=cv2.INTER_AREA)
+            source = self._preview_bgr
+        cv2.cvtColor(source, cv2.COLOR_BGR2RGB, dst=rgb)
+        qt_image = QImage(rgb.data, size[0], size[1], size[0] * 3, QImage.Format.Format_RGB888)
+        self.frame_ready.emit(PreviewFrame(qt_image, rgb, self.preview_pool, slot))
         
     def run(self):
         if not self.setup_camera():
+            if self.camera is not None:
+                self.camera.release()
+                self.camera = None
+            self.camera_failed.emit()
             return
 
-        last_fps_update = datetime.now()
-        frame_count = 0
+        last_fps_update = time.monotonic()
         
         while self.is_running:
-            ret, frame = self.camera.read()
+            ret, frame = self.camera.read(self._capture_buffer)
+            captured_at = time.monotonic()
             if not ret:
                 self.error.emit("无法读取摄像头画面")
                 time.sleep(0.1)  # 避免过于频繁的错误消息
                 continue
+            self._capture_buffer = frame
 
-            # 转换图像格式用于显示
-            rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb_image.shape
-            bytes_per_line = ch * w
-            qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
-            
-            # 发送图像到主线程显示
-            self.frame_ready.emit(qt_image)
+            # 发送缩小后的预览图像到主线程显示
+            self.emit_preview(frame)
 
-            # 如果正在录制，写入视频文件
-            if self.recording and self.writer is not None:
+            # 如果正在录制，交给写入线程编码写盘
+            writer = self.writer
+            if not self.recording and self.preroll is not None:
+                self.preroll.add(frame, captured_at)
+            pacer = self.pacer
+            if self.recording and writer is not None and pacer is not None:
                 try:
-                    self.writer.write(frame)
-                    frame_count += 1
+                    # 开始录制时已取出预录制画面，这里补上取出之后、录制标志生效之前的几帧
+                    if self.preroll is not None and len(self.preroll):
+                        for buffered in self.preroll.drain(writer.fps):
+                            writer.write(buffered)
+                    # 按采集时间决定写入次数，保证视频时长与实际时间一致
+                    repeat = pacer.pace(captured_at)
+                    writer.write(frame, repeat)
+                    self.frame_count = pacer.written
                     
                     # 检查录制时间
-                    elapsed = (datetime.now() - self.start_time).total_seconds()
+                    elapsed = pacer.elapsed(captured_at)
                     
                     # 检查是否接近时间限制
                     if not self.warning_sent and elapsed >= (self.MAX_RECORDING_TIME - self.WARNING_TIME):
@@ -94,12 +177,11 @@ class VideoThread(QThread):
                         self.recording_timeout.emit()
                         continue
 
-                    # 每秒更新一次FPS
-                    now = datetime.now()
-                    if (now - last_fps_update).total_seconds() >= 1:
-                        current_fps = frame_count / elapsed if elapsed > 0 else 0
-                        self.fps_update.emit(current_fps)
-                        last_fps_update = now
+                    # 每秒更新一次实测采集帧率
+                    if captured_at - last_fps_update >= 1:
+                        self.fps_update.emit(pacer.effective_fps)
+                        self.pipeline_stats.emit({**writer.stats(), **pacer.stats()})
+                        last_fps_update = captured_at
                         
                 except Exception as e:
                     self.error.emit(f"写入视频文件失败: {str(e)}")
@@ -113,6 +195,7 @@ class VideoThread(QThread):
             self.camera.release()
         if self.writer is not None:
             self.writer.release()
+            self.writer = None
 
     def setup_camera(self):
         """设置摄像头"""
@@ -140,6 +223,7 @@ class VideoThread(QThread):
             actual_width = int(self.camera.get(cv2.CAP_PROP_FRAME_WIDTH))
             actual_height = int(self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
             print(f"摄像头已就绪，实际分辨率: {actual_width}x{actual_height}")
+            self.camera_ready.emit(actual_width, actual_height)
             
             return True
             
@@ -383,6 +467,408 @@ class BarcodeExportDialog(QDialog):
             "show_problems": self.show_problems.isChecked()
         }
 
+def parse_video_filename(filename, mtime):
+    """
+    从文件名中提取单号和录制时间
+    格式: 快递单号_YYYYMMDD_HHMMSS.mp4，格式不符时使用文件名作为单号、修改时间作为录制时间
+    """
+    name_without_ext = filename.rsplit('.', 1)[0]
+    parts = name_without_ext.split('_')
+    if len(parts) >= 3:  # 确保至少有单号、日期和时间三部分
+        # 最后两个部分应该是日期(8位)和时间(6位)
+        date_str = parts[-2]
+        time_str = parts[-1]
+        if len(date_str) == 8 and date_str.isdigit() and len(time_str) == 6 and time_str.isdigit():
+            tracking_number = '_'.join(parts[:-2])
+            # 格式化时间戳: YYYY-MM-DD HH:MM:SS
+            timestamp = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]} {time_str[:2]}:{time_str[2:4]}:{time_str[4:6]}"
+            return tracking_number, timestamp
+    return name_without_ext, datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class VideoRecord:
+    """视频列表中的一行，行数很多时用 __slots__ 减少内存"""
+
+    __slots__ = ("file", "mtime", "tracking_number", "timestamp", "problems", "notes", "checked")
+
+    def __init__(self, file, mtime, tracking_number=None, timestamp=None):
+        self.file = file
+        self.mtime = mtime
+        if tracking_number is None:
+            tracking_number, timestamp = parse_video_filename(file, mtime)
+        self.tracking_number = tracking_number
+        self.timestamp = timestamp
+        self.problems = ""
+        self.notes = ""
+        self.checked = True
+
+
+# 各视频目录上次扫描的结果 {目录: [(文件名, 修改时间, 单号, 录制时间), ...]}，按修改时间从新到旧排列。
+# 再次打开视频管理时先显示缓存的列表，再在后台扫描目录更新
+VIDEO_LIST_CACHE = {}
+
+
+def scan_video_dir(videos_dir, should_stop=None):
+    """
+    列出目录中的MP4文件及修改时间 [(文件名, 修改时间), ...]，按修改时间排序（最新的在前）
+
+    Args:
+        videos_dir: 视频目录
+        should_stop: 返回 True 时中止扫描并返回 None
+    """
+    files = []
+    with os.scandir(videos_dir) as entries:
+        for count, entry in enumerate(entries):
+            if count % 1000 == 0 and should_stop and should_stop():
+                return None
+            if not entry.name.endswith('.mp4'):
+                continue
+            try:
+                # scandir 在 Windows 上直接返回目录项中的修改时间，不需要逐个文件调用 stat
+                files.append((entry.name, entry.stat().st_mtime))
+            except OSError as e:
+                print(f"处理视频文件 {entry.name} 时出错: {str(e)}")
+    files.sort(key=lambda file: file[1], reverse=True)
+    return files
+
+
+class VideoListLoader(QThread):
+    """
+    在后台线程中扫描视频目录，分批把记录交给界面（最新的在前）
+
+    有缓存时先发出缓存中的记录，再重新扫描目录，只发出新增和已删除的文件；
+    文件名解析在排序之后分批进行，第一批记录不必等整个目录解析完
+    """
+
+    BATCH_SIZE = 2000
+
+    records_loaded = pyqtSignal(list)  # 一批新的 VideoRecord，按修改时间从新到旧
+    files_removed = pyqtSignal(list)   # 已不存在的文件名
+    loaded = pyqtSignal(int)           # 扫描完成，参数为视频总数，失败时为 -1
+
+    def __init__(self, videos_dir, known_files, parent=None):
+        super().__init__(parent)
+        self.videos_dir = videos_dir
+        # 表格中已有的文件
+        self.known_files = set(known_files)
+
+    def run(self):
+        try:
+            cached = VIDEO_LIST_CACHE.get(self.videos_dir, [])
+            known = self.known_files
+            if not known and cached:
+                for start in range(0, len(cached), self.BATCH_SIZE):
+                    if self.isInterruptionRequested():
+                        return
+                    self.emit_records(cached[start:start + self.BATCH_SIZE])
+                known = {entry[0] for entry in cached}
+
+            files = scan_video_dir(self.videos_dir, self.isInterruptionRequested)
+            if files is None:
+                return
+            current = {name for name, _ in files}
+            removed = [name for name in known if name not in current]
+            if removed:
+                self.files_removed.emit(removed)
+
+            # 文件名和修改时间都没变的文件沿用上次的解析结果
+            parsed = {entry[0]: entry for entry in cached}
+            entries = []
+            batch = []
+            for name, mtime in files:
+                entry = parsed.get(name)
+                if entry is None or entry[1] != mtime:
+                    entry = (name, mtime) + parse_video_filename(name, mtime)
+                entries.append(entry)
+                if name not in known:
+                    batch.append(entry)
+                    if len(batch) >= self.BATCH_SIZE:
+                        if self.isInterruptionRequested():
+                            return
+                        self.emit_records(batch)
+                        batch = []
+            self.emit_records(batch)
+            VIDEO_LIST_CACHE[self.videos_dir] = entries
+            self.loaded.emit(len(entries))
+        except Exception as e:
+            print(f"扫描视频目录失败: {str(e)}")
+            self.loaded.emit(-1)
+
+    def emit_records(self, entries):
+        if entries:
+            self.records_loaded.emit([VideoRecord(*entry) for entry in entries])
+
+
+class LabelPdfWorker(QThread):
+    """
+    在后台线程中生成条形码标签PDF
+
+    标签很多时 create_label_pdf 会启动进程池并等待全部页面完成，放在界面线程中会卡住窗口
+    """
+
+    progress = pyqtSignal(int)       # 已完成标签数
+    succeeded = pyqtSignal(bool)     # 是否生成成功
+
+    def __init__(self, labels, output_path, settings, parent=None):
+        super().__init__(parent)
+        self.labels = labels
+        self.output_path = output_path
+        self.settings = settings
+
+    def run(self):
+        # reportlab 只有导出时才用到，不在启动时加载
+        from barcode_labels import create_label_pdf
+
+        try:
+            create_label_pdf(self.labels, self.output_path, self.settings, progress=lambda done, total: self.progress.emit(done))
+            self.succeeded.emit(True)
+        except Exception as e:
+            print(f"生成PDF失败: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            self.succeeded.emit(False)
+
+
+class VideoTableModel(QAbstractTableModel):
+    """
+    视频列表模型，数据和勾选状态都保存在模型中，
+    表格只为可见的行调用 data()，行数再多打开也很快
+    """
+
+    COLUMN_CHECK, COLUMN_NUMBER, COLUMN_TIME, COLUMN_PROBLEMS, COLUMN_NOTES, COLUMN_PROBLEM_BUTTON, COLUMN_PREVIEW = range(7)
+    HEADERS = ["选择", "快递单号", "录制时间", "问题类型", "备注", "操作", "预览"]
+
+    checked_changed = pyqtSignal(int)  # 选中的视频数
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.records = []
+        self.checked_count = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.records[index.row()]
+        column = index.column()
+        if column == self.COLUMN_CHECK:
+            if role == Qt.ItemDataRole.CheckStateRole:
+                return Qt.CheckState.Checked if record.checked else Qt.CheckState.Unchecked
+            return None
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            if column == self.COLUMN_NUMBER:
+                return record.tracking_number
+            if column == self.COLUMN_TIME:
+                return record.timestamp
+            if column == self.COLUMN_PROBLEMS:
+                return record.problems
+            if column == self.COLUMN_NOTES:
+                return record.notes
+        if role == Qt.ItemDataRole.ToolTipRole and column == self.COLUMN_NUMBER:
+            return record.file
+        return None
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if not index.isValid():
+            return False
+        record = self.records[index.row()]
+        column = index.column()
+        if column == self.COLUMN_CHECK and role == Qt.ItemDataRole.CheckStateRole:
+            self.set_checked([index.row()], Qt.CheckState(value) == Qt.CheckState.Checked)
+            return True
+        if role == Qt.ItemDataRole.EditRole and column in (self.COLUMN_PROBLEMS, self.COLUMN_NOTES):
+            if column == self.COLUMN_PROBLEMS:
+                record.problems = value
+            else:
+                record.notes = value
+            self.dataChanged.emit(index, index, [role])
+            return True
+        return False
+
+    def flags(self, index):
+        flags = super().flags(index)
+        column = index.column()
+        if column == self.COLUMN_CHECK:
+            return flags | Qt.ItemFlag.ItemIsUserCheckable
+        if column in (self.COLUMN_PROBLEMS, self.COLUMN_NOTES):
+            return flags | Qt.ItemFlag.ItemIsEditable
+        return flags
+
+    def add_records(self, records):
+        """加入一批按修改时间从新到旧排列的记录"""
+        if not records:
+            return
+        if not self.records or records[0].mtime <= self.records[-1].mtime:
+            # 首次加载时各批次依次变旧，直接追加到末尾
+            first = len(self.records)
+            self.beginInsertRows(QModelIndex(), first, first + len(records) - 1)
+            self.records.extend(records)
+            self.endInsertRows()
+        elif len(records) > 100:
+            self.beginResetModel()
+            self.records = list(heapq.merge(self.records, records, key=lambda record: -record.mtime))
+            self.endResetModel()
+        else:
+            # 刷新时新增的少量视频（通常是刚录制的），逐个插入到对应位置
+            for record in records:
+                low, high = 0, len(self.records)
+                while low < high:
+                    middle = (low + high) // 2
+                    if self.records[middle].mtime > record.mtime:
+                        low = middle + 1
+                    else:
+                        high = middle
+                self.beginInsertRows(QModelIndex(), low, low)
+                self.records.insert(low, record)
+                self.endInsertRows()
+        self.checked_count += sum(1 for record in records if record.checked)
+        self.checked_changed.emit(self.checked_count)
+
+    def remove_files(self, files):
+        files = set(files)
+        rows = [row for row, record in enumerate(self.records) if record.file in files]
+        if not rows:
+            return
+        self.checked_count -= sum(1 for row in rows if self.records[row].checked)
+        if len(rows) > 100:
+            self.beginResetModel()
+            self.records = [record for record in self.records if record.file not in files]
+            self.endResetModel()
+        else:
+            for row in reversed(rows):
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.records[row]
+                self.endRemoveRows()
+        self.checked_changed.emit(self.checked_count)
+
+    def set_checked(self, rows, checked):
+        """修改多行的勾选状态，rows 为模型中的行号"""
+        changed = [row for row in rows if self.records[row].checked != checked]
+        if not changed:
+            return
+        for row in changed:
+            self.records[row].checked = checked
+        self.checked_count += len(changed) if checked else -len(changed)
+        # 只通知一次变化范围，避免逐行刷新
+        self.dataChanged.emit(self.index(min(changed), self.COLUMN_CHECK),
+                              self.index(max(changed), self.COLUMN_CHECK),
+                              [Qt.ItemDataRole.CheckStateRole])
+        self.checked_changed.emit(self.checked_count)
+
+    def set_problems(self, record, problems, notes):
+        """更新记录的问题和备注；记录所在行可能已因后台加载而变化，按对象重新查找"""
+        record.problems = problems
+        record.notes = notes
+        row = next((row for row, item in enumerate(self.records) if item is record), None)
+        if row is not None:
+            self.dataChanged.emit(self.index(row, self.COLUMN_PROBLEMS), self.index(row, self.COLUMN_NOTES))
+
+    def checked_records(self):
+        return [record for record in self.records if record.checked]
+
+    def unchecked_records(self):
+        return [record for record in self.records if not record.checked]
+
+
+class VideoFilterProxyModel(QSortFilterProxyModel):
+    """按快递单号或录制日期过滤，直接读取模型中的记录，不经过 data()"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.filter_text = ""
+
+    def set_filter_text(self, text):
+        text = text.strip().lower()
+        # 支持 20250107 这样的日期写法
+        if len(text) == 8 and text.isdigit():
+            text = f"{text[:4]}-{text[4:6]}-{text[6:]}"
+        if text != self.filter_text:
+            self.filter_text = text
+            self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self.filter_text:
+            return True
+        record = self.sourceModel().records[source_row]
+        return self.filter_text in record.tracking_number.lower() or self.filter_text in record.timestamp
+
+    def source_rows(self):
+        """当前显示的行在源模型中的行号"""
+        if not self.filter_text:
+            return range(self.sourceModel().rowCount())
+        return [self.mapToSource(self.index(row, 0)).row() for row in range(self.rowCount())]
+
+
+class CheckBoxDelegate(QStyledItemDelegate):
+    """在单元格中居中绘制复选框，点击单元格任意位置切换勾选"""
+
+    def paint(self, painter, option, index):
+        item = QStyleOptionViewItem(option)
+        self.initStyleOption(item, index)
+        style = item.widget.style() if item.widget else QApplication.style()
+        # 先画选中背景，再把复选框画在中间
+        style.drawPrimitive(QStyle.PrimitiveElement.PE_PanelItemViewItem, item, painter, item.widget)
+        check = QStyleOptionButton()
+        indicator = style.subElementRect(QStyle.SubElement.SE_CheckBoxIndicator, check, item.widget)
+        indicator.moveCenter(item.rect.center())
+        check.rect = indicator
+        check.state = QStyle.StateFlag.State_Enabled
+        if item.checkState == Qt.CheckState.Checked:
+            check.state |= QStyle.StateFlag.State_On
+        else:
+            check.state |= QStyle.StateFlag.State_Off
+        style.drawPrimitive(QStyle.PrimitiveElement.PE_IndicatorCheckBox, check, painter, item.widget)
+
+    def editorEvent(self, event, model, option, index):
+        toggle = (
+            (event.type() == QEvent.Type.MouseButtonRelease and event.button() == Qt.MouseButton.LeftButton)
+            or (event.type() == QEvent.Type.KeyPress and event.key() == Qt.Key.Key_Space)
+        )
+        if toggle:
+            checked = index.data(Qt.ItemDataRole.CheckStateRole) == Qt.CheckState.Checked
+            new_state = Qt.CheckState.Unchecked if checked else Qt.CheckState.Checked
+            return model.setData(index, new_state.value, Qt.ItemDataRole.CheckStateRole)
+        # 吞掉双击，避免快速点击时进入编辑状态
+        return event.type() == QEvent.Type.MouseButtonDblClick
+
+
+class ButtonDelegate(QStyledItemDelegate):
+    """在单元格中绘制按钮，代替每行创建一个 QPushButton"""
+
+    clicked = pyqtSignal(QModelIndex)
+
+    def __init__(self, text, parent=None):
+        super().__init__(parent)
+        self.text = text
+
+    def paint(self, painter, option, index):
+        style = option.widget.style() if option.widget else QApplication.style()
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(4, 2, -4, -2)
+        button.text = self.text
+        button.state = QStyle.StateFlag.State_Enabled | QStyle.StateFlag.State_Raised
+        if option.state & QStyle.StateFlag.State_MouseOver:
+            button.state |= QStyle.StateFlag.State_MouseOver
+        style.drawControl(QStyle.ControlElement.CE_PushButton, button, painter, option.widget)
+
+    def editorEvent(self, event, model, option, index):
+        if (event.type() == QEvent.Type.MouseButtonRelease and event.button() == Qt.MouseButton.LeftButton
+                and option.rect.contains(event.position().toPoint())):
+            self.clicked.emit(index)
+            return True
+        return event.type() in (QEvent.Type.MouseButtonPress, QEvent.Type.MouseButtonDblClick)
+
+
 class VideoManagerDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -390,13 +876,53 @@ class VideoManagerDialog(QDialog):
         self.setMinimumSize(800, 600)
         
         layout = QVBoxLayout()
-        
+
+        # 过滤栏
+        filter_layout = QHBoxLayout()
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("按快递单号或日期过滤，如 SF123 或 2025-01-07")
+        self.filter_edit.setClearButtonEnabled(True)
+        filter_layout.addWidget(self.filter_edit)
+        self.count_label = QLabel()
+        filter_layout.addWidget(self.count_label)
+        layout.addLayout(filter_layout)
+
+        # 输入停顿后再过滤，连续输入时不会每个字符都遍历一遍列表
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(150)
+        self.filter_timer.timeout.connect(self.apply_filter)
+        self.filter_edit.textChanged.connect(self.filter_timer.start)
+
         # 创建表格
-        self.table = QTableWidget()
-        self.table.setColumnCount(7)
-        self.table.setHorizontalHeaderLabels([
-            "选择", "快递单号", "录制时间", "问题类型", "备注", "操作", "预览"
-        ])
+        self.model = VideoTableModel(self)
+        self.proxy = VideoFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.model.checked_changed.connect(self.update_count_label)
+        self.proxy.rowsInserted.connect(self.update_count_label)
+        self.proxy.rowsRemoved.connect(self.update_count_label)
+        self.proxy.modelReset.connect(self.update_count_label)
+        self.proxy.layoutChanged.connect(self.update_count_label)
+
+        self.table = QTableView()
+        self.table.setModel(self.proxy)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.DoubleClicked |
+                                   QAbstractItemView.EditTrigger.EditKeyPressed)
+        # 固定行高，表格不需要逐行计算高度
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(28)
+        self.table.setItemDelegateForColumn(VideoTableModel.COLUMN_CHECK, CheckBoxDelegate(self.table))
+        problem_delegate = ButtonDelegate("添加问题", self.table)
+        problem_delegate.clicked.connect(
+            lambda index: self.add_problem(self.model.records[self.proxy.mapToSource(index).row()])
+        )
+        self.table.setItemDelegateForColumn(VideoTableModel.COLUMN_PROBLEM_BUTTON, problem_delegate)
+        preview_delegate = ButtonDelegate("预览", self.table)
+        preview_delegate.clicked.connect(
+            lambda index: self.preview_video(self.model.records[self.proxy.mapToSource(index).row()].file)
+        )
+        self.table.setItemDelegateForColumn(VideoTableModel.COLUMN_PREVIEW, preview_delegate)
         
         # 设置列宽
         self.table.setColumnWidth(0, 50)   # 选择
@@ -439,38 +965,33 @@ class VideoManagerDialog(QDialog):
         layout.addLayout(button_layout)
         
         self.setLayout(layout)
-        
+
+        # 视频列表在后台线程中加载，对话框立即显示
+        self.videos_dir = os.path.abspath(os.path.join(os.getcwd(), "videos"))
+        self.loader = None
+        self.loading = False
+        self.reload_pending = False
+
+        # 目录中新增或删除视频时（如录制完成）稍后刷新列表
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(500)
+        self.reload_timer.timeout.connect(self.load_videos)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.reload_timer.start)
+
         # 加载视频列表
         self.load_videos()
 
-    def preview_video(self, tracking_number, timestamp):
+    def preview_video(self, video_file):
         """预览视频"""
         try:
             # 获取视频存放目录的绝对路径
             videos_dir = os.path.abspath(os.path.join(os.getcwd(), "videos"))
-            if not os.path.exists(videos_dir):
-                os.makedirs(videos_dir)
-            
-            # 将时间戳格式从 "YYYY-MM-DD HH:MM:SS" 转换为文件名格式 "YYYYMMDD_HHMMSS"
-            timestamp_clean = timestamp.replace(':', '').replace('-', '').replace(' ', '_')
-            
-            # 构建文件名
-            video_filename = f"{tracking_number}_{timestamp_clean}.mp4"
-            video_path = os.path.join(videos_dir, video_filename)
-            
-            # 如果直接路径不存在，尝试查找匹配的文件
+            video_path = os.path.join(videos_dir, video_file)
             if not os.path.exists(video_path):
-                # 使用通配符查找
-                pattern = f"{tracking_number}_*.mp4"
-                matching_files = [f for f in os.listdir(videos_dir) if fnmatch.fnmatch(f, pattern)]
-                
-                if not matching_files:
-                    QMessageBox.warning(self, "错误", f"找不到视频文件: {video_filename}")
-                    return
-                    
-                # 使用最新的文件（如果有多个匹配的文件）
-                video_file = sorted(matching_files)[-1]
-                video_path = os.path.join(videos_dir, video_file)
+                QMessageBox.warning(self, "错误", f"找不到视频文件: {video_file}")
+                return
             
             print(f"正在打开视频: {video_path}")
             
@@ -486,111 +1007,73 @@ class VideoManagerDialog(QDialog):
             QMessageBox.warning(self, "错误", f"无法打开视频: {str(e)}")
 
     def load_videos(self):
-        """加载视频列表"""
+        """加载视频列表，已显示的视频保留勾选和问题，只增删有变化的文件"""
         try:
-            # 获取视频存放目录的绝对路径
-            videos_dir = os.path.abspath(os.path.join(os.getcwd(), "videos"))
-            if not os.path.exists(videos_dir):
-                os.makedirs(videos_dir)
+            if not os.path.exists(self.videos_dir):
+                os.makedirs(self.videos_dir)
+            if self.videos_dir not in self.watcher.directories():
+                self.watcher.addPath(self.videos_dir)
+
+            if self.loader is not None and self.loader.isRunning():
+                # 正在扫描，完成后再扫描一次
+                self.reload_pending = True
                 return
-                
-            # 清空表格
-            self.table.clearContents()
-            self.table.setRowCount(0)
-            
-            # 获取所有MP4文件
-            video_files = []
-            for f in os.listdir(videos_dir):
-                if f.endswith('.mp4'):
-                    file_path = os.path.join(videos_dir, f)
-                    # 获取文件修改时间
-                    mod_time = os.path.getmtime(file_path)
-                    video_files.append((f, mod_time))
-            
-            # 按修改时间排序（最新的在前）
-            video_files.sort(key=lambda x: x[1], reverse=True)
-            
-            # 添加到表格
-            for row, (video_file, _) in enumerate(video_files):
-                try:
-                    # 从文件名中提取单号和时间
-                    # 格式: 快递单号_YYYYMMDD_HHMMSS.mp4
-                    name_without_ext = video_file.rsplit('.', 1)[0]
-                    parts = name_without_ext.split('_')
-                    if len(parts) >= 3:  # 确保至少有单号、日期和时间三部分
-                        # 最后两个部分应该是日期(8位)和时间(6位)
-                        date_str = parts[-2]
-                        time_str = parts[-1]
-                        if len(date_str) == 8 and date_str.isdigit() and len(time_str) == 6 and time_str.isdigit():
-                            tracking_number = '_'.join(parts[:-2])
-                            # 格式化时间戳: YYYY-MM-DD HH:MM:SS
-                            timestamp = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]} {time_str[:2]}:{time_str[2:4]}:{time_str[4:6]}"
-                        else:
-                            # 如果格式不正确，使用文件名作为单号
-                            tracking_number = name_without_ext
-                            timestamp = datetime.fromtimestamp(os.path.getmtime(os.path.join(videos_dir, video_file))).strftime("%Y-%m-%d %H:%M:%S")
-                    else:
-                        # 如果格式不正确，使用文件名作为单号
-                        tracking_number = name_without_ext
-                        timestamp = datetime.fromtimestamp(os.path.getmtime(os.path.join(videos_dir, video_file))).strftime("%Y-%m-%d %H:%M:%S")
-                        
-                        # 设置表格行数
-                        self.table.setRowCount(row + 1)
-                        
-                        # 添加复选框
-                        checkbox = QCheckBox()
-                        checkbox.setChecked(True)
-                        self.table.setCellWidget(row, 0, checkbox)
-                        
-                        # 添加其他列
-                        self.table.setItem(row, 1, QTableWidgetItem(tracking_number))
-                        self.table.setItem(row, 2, QTableWidgetItem(timestamp))
-                        
-                        # 添加问题和备注占位符
-                        self.table.setItem(row, 3, QTableWidgetItem(""))
-                        self.table.setItem(row, 4, QTableWidgetItem(""))
-                        
-                        # 添加操作按钮
-                        problem_btn = QPushButton("添加问题")
-                        problem_btn.clicked.connect(lambda checked, r=row: self.add_problem(r))
-                        self.table.setCellWidget(row, 5, problem_btn)
-                        
-                        # 添加预览按钮
-                        preview_btn = QPushButton("预览")
-                        # 使用 lambda 捕获当前值而不是引用
-                        preview_btn.clicked.connect(
-                            lambda checked, t=tracking_number, ts=timestamp: 
-                            self.preview_video(t, ts)
-                        )
-                        self.table.setCellWidget(row, 6, preview_btn)
-                        
-                except Exception as e:
-                    print(f"处理视频文件 {video_file} 时出错: {str(e)}")
-                    continue
-            
-            print(f"已加载 {len(video_files)} 个视频")
+
+            self.loading = True
+            self.update_count_label()
+            self.loader = VideoListLoader(self.videos_dir, (record.file for record in self.model.records), self)
+            self.loader.records_loaded.connect(self.model.add_records)
+            self.loader.files_removed.connect(self.model.remove_files)
+            self.loader.loaded.connect(self.handle_videos_loaded)
+            self.loader.start()
             
         except Exception as e:
             QMessageBox.warning(self, "错误", f"加载视频列表失败: {str(e)}")
 
+    def handle_videos_loaded(self, count):
+        self.loading = False
+        if count >= 0:
+            print(f"已加载 {count} 个视频")
+        else:
+            QMessageBox.warning(self, "错误", "加载视频列表失败")
+        self.update_count_label()
+        if self.reload_pending:
+            self.reload_pending = False
+            QTimer.singleShot(0, self.load_videos)
+
+    def done(self, result):
+        # 关闭对话框时停止后台扫描
+        if self.loader is not None:
+            self.loader.requestInterruption()
+            self.loader.wait()
+        super().done(result)
+
+    def apply_filter(self):
+        self.proxy.set_filter_text(self.filter_edit.text())
+        self.update_count_label()
+
+    def update_count_label(self, *_):
+        total = self.model.rowCount()
+        shown = self.proxy.rowCount()
+        text = f"共 {total} 个视频，已选 {self.model.checked_count} 个"
+        if shown != total:
+            text = f"显示 {shown} / {text}"
+        if self.loading:
+            text += "（正在加载...）"
+        self.count_label.setText(text)
+
     def select_all(self):
-        """选择所有视频"""
-        for row in range(self.table.rowCount()):
-            checkbox = self.table.cellWidget(row, 0)
-            if checkbox:
-                checkbox.setChecked(True)
+        """选择当前显示的所有视频"""
+        self.model.set_checked(self.proxy.source_rows(), True)
 
     def deselect_all(self):
-        """取消选择所有视频"""
-        for row in range(self.table.rowCount()):
-            checkbox = self.table.cellWidget(row, 0)
-            if checkbox:
-                checkbox.setChecked(False)
+        """取消选择当前显示的所有视频"""
+        self.model.set_checked(self.proxy.source_rows(), False)
 
     def save_selected(self):
         """保存选中的视频"""
         try:
-            selected = self.get_selected_videos()
+            selected = self.model.checked_records()
             if not selected:
                 QMessageBox.warning(self, "警告", "请先选择要保存的视频")
                 return
@@ -601,13 +1084,10 @@ class VideoManagerDialog(QDialog):
                 
             videos_dir = os.path.abspath(os.path.join(os.getcwd(), "videos"))
             
-            for tracking_number, time_str, _, _ in selected:
-                time_str = time_str.replace(":", "")
-                source_file = os.path.join(videos_dir, f"{tracking_number}_{time_str}.mp4")
-                target_file = os.path.join(save_dir, f"{tracking_number}_{time_str}.mp4")
-                
+            for record in selected:
+                source_file = os.path.join(videos_dir, record.file)
                 if os.path.exists(source_file):
-                    shutil.copy2(source_file, target_file)
+                    shutil.copy2(source_file, os.path.join(save_dir, record.file))
             
             QMessageBox.information(self, "成功", "选中的视频已保存")
             
@@ -626,24 +1106,19 @@ class VideoManagerDialog(QDialog):
             if reply != QMessageBox.StandardButton.Yes:
                 return
                 
-            selected = self.get_selected_videos()
-            selected_files = set()
-            
             videos_dir = os.path.abspath(os.path.join(os.getcwd(), "videos"))
             
-            # 收集选中的文件名
-            for tracking_number, time_str, _, _ in selected:
-                time_str = time_str.replace(":", "")
-                selected_files.add(f"{tracking_number}_{time_str}.mp4")
-            
-            # 删除未选中的文件
-            deleted_count = 0
-            for file in os.listdir(videos_dir):
-                if file.endswith(".mp4") and file not in selected_files:
-                    os.remove(os.path.join(videos_dir, file))
-                    deleted_count += 1
+            # 只删除列表中未勾选的视频，打开对话框之后新录制的视频不受影响
+            deleted = []
+            for record in self.model.unchecked_records():
+                try:
+                    os.remove(os.path.join(videos_dir, record.file))
+                except FileNotFoundError:
+                    pass
+                deleted.append(record.file)
+            self.model.remove_files(deleted)
             
-            QMessageBox.information(self, "成功", f"已删除 {deleted_count} 个未选中的视频")
+            QMessageBox.information(self, "成功", f"已删除 {len(deleted)} 个未选中的视频")
             self.load_videos()  # 重新加载列表
             
         except Exception as e:
@@ -707,6 +1182,7 @@ class VideoManagerDialog(QDialog):
             settings = {
                 "width": 300,
                 "height": 100,
+                "codes_per_row": 2,
                 "show_time": True,
                 "show_problems": True
             }
@@ -719,101 +1195,38 @@ class VideoManagerDialog(QDialog):
         except Exception as e:
             QMessageBox.warning(self, "错误", f"导出条形码失败: {str(e)}")
 
-    def generate_barcode(self, tracking_number, output_path):
-        """生成单个条形码图片"""
-        try:
-            # 使用 Code128 生成条形码
-            code128 = barcode.get('code128', tracking_number, writer=ImageWriter())
-            filename = code128.save(output_path)
-            
-            # 使用 PIL 调整图片大小
-            with PILImage.open(filename) as img:
-                # 调整到合适的大小
-                new_size = (300, 100)  # 根据需要调整尺寸
-                img = img.resize(new_size, PILImage.LANCZOS)
-                img.save(filename)
-                
-            return filename
-        except Exception as e:
-            print(f"生成条形码失败: {str(e)}")
-            return None
-
     def create_barcode_pdf(self, tracking_data, output_path, settings):
-        """创建包含所有条形码的PDF文件"""
-        try:
-            # 创建临时目录存放条形码图片
-            temp_dir = "temp_barcodes"
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # 准备文档
-            doc = SimpleDocTemplate(output_path, pagesize=A4)
-            elements = []
-            
-            # 添加标题
-            styles = getSampleStyleSheet()
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=16,
-                spaceAfter=30
-            )
-            elements.append(Paragraph("物流单号条形码", title_style))
-            
-            # 为每个单号生成条形码
-            for tracking_number, time_str, problems, notes in tracking_data:
-                # 生成条形码图片
-                barcode_path = os.path.join(temp_dir, f"{tracking_number}.png")
-                barcode_file = self.generate_barcode(tracking_number, barcode_path)
-                
-                if barcode_file and os.path.exists(barcode_file):
-                    # 添加条形码图片
-                    img = Image(barcode_file, width=300, height=100)
-                    elements.append(img)
-                    
-                    # 添加单号文本
-                    elements.append(Paragraph(f"单号: {tracking_number}", styles['Normal']))
-                    if problems:
-                        elements.append(Paragraph(f"问题: {problems}", styles['Normal']))
-                    if notes:
-                        elements.append(Paragraph(f"备注: {notes}", styles['Normal']))
-                    
-                    # 添加间距
-                    elements.append(Spacer(1, 20))
-            
-            # 生成PDF
-            doc.build(elements)
-            
-            # 清理临时文件
-            shutil.rmtree(temp_dir, ignore_errors=True)
-            
-            return True
-        except Exception as e:
-            print(f"生成PDF失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return False
-
-    def add_problem(self, row):
-        tracking_number = self.table.item(row, 1).text()
-        dialog = ProblemDialog(tracking_number, self)
+        """创建包含所有条形码的PDF文件，在后台线程中生成，期间界面保持响应"""
+        progress_dialog = QProgressDialog("正在生成条形码PDF...", None, 0, len(tracking_data), self)
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+
+        worker = LabelPdfWorker(tracking_data, output_path, settings, self)
+        result = []
+        loop = QEventLoop()
+        # 进度在界面线程中更新
+        worker.progress.connect(progress_dialog.setValue)
+        worker.succeeded.connect(result.append)
+        worker.finished.connect(loop.quit)
+        worker.start()
+        loop.exec()
+        worker.wait()
+        worker.deleteLater()
+        progress_dialog.close()
+        return bool(result and result[0])
+
+    def add_problem(self, record):
+        # 对话框打开期间后台加载可能插入或移除行，因此保存记录对象而不是行号
+        dialog = ProblemDialog(record.tracking_number, self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             problems = dialog.get_problems()
             # 更新表格
-            self.table.setItem(row, 3, QTableWidgetItem(", ".join(problems["types"])))
-            self.table.setItem(row, 4, QTableWidgetItem(problems["notes"]))
+            self.model.set_problems(record, ", ".join(problems["types"]), problems["notes"])
 
     def get_selected_videos(self):
         """获取选中的视频"""
-        selected = []
-        for row in range(self.table.rowCount()):
-            checkbox = self.table.cellWidget(row, 0)
-            if checkbox and checkbox.isChecked():
-                tracking_number = self.table.item(row, 1).text()
-                time_str = self.table.item(row, 2).text()
-                problems = self.table.item(row, 3).text()
-                notes = self.table.item(row, 4).text()
-                selected.append((tracking_number, time_str, problems, notes))
-        return selected
+        return [(record.tracking_number, record.timestamp, record.problems, record.notes)
+                for record in self.model.checked_records()]
 
     def export_to_csv(self):
         """导出表格到CSV"""
@@ -852,17 +1265,7 @@ class VideoManagerDialog(QDialog):
                 writer.writerow(["快递单号", "录制时间", "问题类型", "备注"])
                 
                 # 写入数据
-                for row in range(self.table.rowCount()):
-                    checkbox = self.table.cellWidget(row, 0)
-                    if checkbox and checkbox.isChecked():
-                        # 获取每列的数据
-                        tracking_number = self.table.item(row, 1).text()
-                        timestamp = self.table.item(row, 2).text()
-                        problems = self.table.item(row, 3).text()
-                        notes = self.table.item(row, 4).text()
-                        
-                        # 写入一行数据
-                        writer.writerow([tracking_number, timestamp, problems, notes])
+                writer.writerows(self.get_selected_videos())
             
             QMessageBox.information(self, "成功", f"表格已导出到: {file_path}")
             
@@ -870,6 +1273,8 @@ class VideoManagerDialog(QDialog):
             QMessageBox.warning(self, "错误", f"导出表格失败: {str(e)}")
 
 class MainWindow(QMainWindow):
+    cameras_discovered = pyqtSignal(list)  # 后台检测到的摄像头列表
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("物流退货拆包视频录制工具")
@@ -878,31 +1283,30 @@ class MainWindow(QMainWindow):
         self.recording_start_time = None
         self.recording_timer = QTimer()
         self.recording_timer.timeout.connect(self.update_duration)
+        self.current_fps = 0.0
+        self.writer_stats = None
         self.available_cameras = self.get_available_cameras()
         self.setup_ui()
+        self.cameras_discovered.connect(self.update_camera_list)
+        # 启动时使用的是缓存的列表，等第一个摄像头打开成功或失败后再在后台重新检测
+        self.camera_refresh_pending = self.cameras_from_cache
         # 使用第一个可用的摄像头
         if self.available_cameras:
             self.setup_video_thread(self.available_cameras[0]['index'])
 
     def get_available_cameras(self):
-        """获取所有可用的摄像头"""
-        available_cameras = []
+        """获取所有可用的摄像头，优先使用上次检测结果的缓存"""
+        self.cameras_from_cache = False
         try:
-            # 在 macOS 上检测摄像头
-            for i in range(10):  # 检查前10个摄像头索引
-                try:
-                    cap = cv2.VideoCapture(i, cv2.CAP_ANY)
-                    if cap.isOpened():
-                        ret, _ = cap.read()  # 尝试读取一帧
-                        if ret:
-                            available_cameras.append({
-                                'index': i,
-                                'name': f'摄像头 {i}'
-                            })
-                    cap.release()
-                except Exception as e:
-                    print(f"检测摄像头 {i} 失败: {str(e)}")
-                    continue
+            available_cameras = load_cached_cameras()
+            if available_cameras:
+                self.cameras_from_cache = True
+                return available_cameras
+
+            # 首次运行没有缓存，并行检测
+            available_cameras = discover_cameras()
+            if available_cameras:
+                save_cached_cameras(available_cameras)
                     
             # 如果没有找到摄像头，添加默认摄像头
             if not available_cameras:
@@ -985,6 +1389,7 @@ class MainWindow(QMainWindow):
         self.video_label.setMinimumSize(640, 480)
         self.video_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.video_label.setStyleSheet("background-color: black;")
+        self.video_label.installEventFilter(self)
         layout.addWidget(self.video_label)
 
         # 按钮区域
@@ -1021,6 +1426,8 @@ class MainWindow(QMainWindow):
             if self.video_thread:
                 self.video_thread.is_running = False
                 self.video_thread.wait()
+                # 队列中可能还有旧线程的预览帧，它们各自持有缓冲区的引用，先断开再释放线程
+                self.video_thread.frame_ready.disconnect(self.update_frame)
                 self.video_thread = None
 
             self.setup_video_thread(camera_index)
@@ -1042,30 +1449,114 @@ class MainWindow(QMainWindow):
                 self.video_thread.frame_ready.connect(self.update_frame)
                 self.video_thread.error.connect(self.show_error)
                 self.video_thread.fps_update.connect(self.update_fps)
+                self.video_thread.pipeline_stats.connect(self.update_pipeline_stats)
                 self.video_thread.recording_timeout.connect(self.handle_recording_timeout)
+                self.video_thread.camera_ready.connect(self.handle_camera_ready)
+                self.video_thread.camera_failed.connect(self.handle_camera_failed)
+                self.update_preview_target()
+                # 摄像头在视频线程中打开，就绪后通过 camera_ready 通知，打开失败时通过 error 通知
                 self.video_thread.start()
-                
-                # 等待摄像头初始化
-                time.sleep(1)
-                
-                if not self.video_thread.camera or not self.video_thread.camera.isOpened():
-                    raise Exception("摄像头初始化失败")
-                    
+                self.statusBar().showMessage(f"正在打开摄像头 {camera_index}...")
                 print(f"视频线程已启动，使用摄像头 {camera_index}")
         except Exception as e:
             self.show_error(f"设置视频线程失败: {str(e)}")
 
-    def update_frame(self, image):
-        scaled_image = image.scaled(self.video_label.size(), 
-                                  Qt.AspectRatioMode.KeepAspectRatio,
-                                  Qt.TransformationMode.SmoothTransformation)
-        self.video_label.setPixmap(QPixmap.fromImage(scaled_image))
+    def handle_camera_ready(self, width, height):
+        self.statusBar().showMessage(f"摄像头已就绪 ({width}x{height})")
+        # 已确认可用的摄像头不重复打开，沿用缓存中的信息
+        thread = self.sender()
+        if isinstance(thread, VideoThread):
+            self.refresh_cameras(in_use=[thread.config["camera_index"]])
+
+    def handle_camera_failed(self):
+        self.statusBar().showMessage("摄像头打开失败")
+        # 打开失败的摄像头也重新探测，已拔出或编号变化时从缓存中移除
+        self.refresh_cameras(in_use=[])
+
+    def refresh_cameras(self, in_use):
+        """启动时使用的是缓存的列表，在后台重新检测一次"""
+        if not self.camera_refresh_pending:
+            return
+        self.camera_refresh_pending = False
+        refresh_in_background(self.cameras_discovered.emit, self.available_cameras, in_use=in_use)
+
+    def update_camera_list(self, cameras):
+        """后台检测完成后更新摄像头下拉框，保持当前选择"""
+        if not cameras:
+            return
+        self.available_cameras = cameras
+        current = self.camera_combo.currentData()
+        self.camera_combo.blockSignals(True)
+        try:
+            self.camera_combo.clear()
+            for camera in cameras:
+                self.camera_combo.addItem(camera['name'], camera['index'])
+            position = self.camera_combo.findData(current)
+            if position < 0 and current is not None:
+                self.camera_combo.addItem(f'摄像头 {current}', current)
+                position = self.camera_combo.count() - 1
+            self.camera_combo.setCurrentIndex(max(position, 0))
+        finally:
+            self.camera_combo.blockSignals(False)
+
+    def update_frame(self, preview):
+        # 图像已在视频线程中缩小到预览区域的像素尺寸，引用的是视频线程缓冲池的内存，
+        # 转为QPixmap（复制）后立即交还；切换摄像头后仍在队列中的旧帧同样有效
+        try:
+            preview.image.setDevicePixelRatio(self.video_label.devicePixelRatioF())
+            self.video_label.setPixmap(QPixmap.fromImage(preview.image))
+        finally:
+            preview.release()
+
+    def update_preview_target(self):
+        """把预览区域尺寸和窗口可见状态告知视频线程"""
+        if self.video_thread is None:
+            return
+        ratio = self.video_label.devicePixelRatioF()
+        self.video_thread.set_preview_target(
+            int(self.video_label.width() * ratio),
+            int(self.video_label.height() * ratio),
+            self.isVisible() and not self.isMinimized()
+        )
+
+    def eventFilter(self, obj, event):
+        if obj is self.video_label and event.type() == QEvent.Type.Resize:
+            self.update_preview_target()
+        return super().eventFilter(obj, event)
+
+    def changeEvent(self, event):
+        if event.type() == QEvent.Type.WindowStateChange:
+            self.update_preview_target()
+        super().changeEvent(event)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_preview_target()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.update_preview_target()
 
     def show_error(self, message):
         QMessageBox.warning(self, "错误", message)
 
     def update_fps(self, fps):
-        self.statusBar().showMessage(f"当前FPS: {fps:.1f}")
+        self.current_fps = fps
+        self.show_recording_stats()
+
+    def update_pipeline_stats(self, stats):
+        self.writer_stats = stats
+        self.show_recording_stats()
+
+    def show_recording_stats(self):
+        message = f"当前FPS: {self.current_fps:.1f}"
+        if self.writer_stats:
+            message += (f" | 写入队列: {self.writer_stats['queue_depth']}/{self.writer_stats['queue_size']}"
+                        f" | 丢帧: {self.writer_stats['dropped']}")
+            if "duplicated" in self.writer_stats:
+                message += (f" | 补帧: {self.writer_stats['duplicated']}"
+                            f" | 跳帧: {self.writer_stats['paced_dropped']}")
+        self.statusBar().showMessage(message)
 
     def start_recording(self):
         """开始录制"""
@@ -1096,23 +1587,31 @@ class MainWindow(QMainWindow):
             video_filename = f"{tracking_number}_{timestamp}.mp4"
             video_path = os.path.join(videos_dir, video_filename)
             
-            # 设置视频写入器
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            # 设置视频编码器，后端和画质参数见 config.json 的 encoder 配置
             frame_size = (int(self.video_thread.camera.get(cv2.CAP_PROP_FRAME_WIDTH)),
                          int(self.video_thread.camera.get(cv2.CAP_PROP_FRAME_HEIGHT)))
-            self.video_thread.writer = cv2.VideoWriter(
-                video_path, 
-                fourcc, 
+            writer = open_encoder(
+                video_path,
                 30.0,  # FPS
-                frame_size
+                frame_size,
+                load_encoder_config(),
+                opencv_codecs=("mp4v",)
             )
             
-            if not self.video_thread.writer.isOpened():
-                raise Exception("无法创建视频文件")
+            # 编码写盘放到独立线程，写完后在后台把moov移到文件开头，便于Web端边下载边播放
+            pipeline = load_pipeline_config()
+            preroll = self.video_thread.preroll
+            self.video_thread.writer = ThreadedVideoWriter(
+                writer, pipeline["queue_size"], pipeline["policy"],
+                on_closed=lambda: finalize_recording(video_path),
+                preroll=preroll.drain(30.0) if preroll is not None else None,
+                fps=30.0
+            )
+            self.writer_stats = None
+            self.video_thread.pacer = FramePacer(30.0)
             
             # 设置录制状态
             self.video_thread.recording = True
-            self.video_thread.start_time = datetime.now()
             self.recording_start_time = datetime.now()
             self.video_thread.frame_count = 0
             self.video_thread.warning_sent = False
@@ -1141,6 +1640,7 @@ class MainWindow(QMainWindow):
             if self.video_thread and self.video_thread.recording:
                 self.video_thread.recording = False
                 if self.video_thread.writer:
+                    # 剩余画面由写入线程写完后关闭文件
                     self.video_thread.writer.release()
                     print(f"视频已保存: {self.video_thread.current_file}")
                     self.video_thread.writer = None
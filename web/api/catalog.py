@@ -0,0 +1,610 @@
+"""
+物流视频录制系统 - 视频索引库
+使用SQLite(WAL模式)持久化保存视频记录，列表、统计和按单号查找都走索引查询，
+不再在每次请求时遍历目录并用OpenCV探测每个视频
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    path TEXT PRIMARY KEY,
+    tracking_number TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    mtime REAL NOT NULL DEFAULT 0,
+    duration REAL,
+    problems TEXT NOT NULL DEFAULT '[]',
+    problem_count INTEGER NOT NULL DEFAULT 0,
+    notes TEXT NOT NULL DEFAULT ''
+);
+DROP INDEX IF EXISTS idx_videos_timestamp;
+CREATE INDEX IF NOT EXISTS idx_videos_order ON videos(timestamp, tracking_number, path);
+CREATE INDEX IF NOT EXISTS idx_videos_tracking ON videos(tracking_number, timestamp);
+
+CREATE TABLE IF NOT EXISTS video_problems (
+    path TEXT NOT NULL,
+    problem TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_video_problems_path ON video_problems(path);
+CREATE INDEX IF NOT EXISTS idx_video_problems_problem ON video_problems(problem);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 统计汇总表由触发器随 videos / video_problems 的变化同步维护，
+# 统计接口只需读取请求范围内的汇总行
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_hourly (
+    hour TEXT PRIMARY KEY,
+    video_count INTEGER NOT NULL DEFAULT 0,
+    total_size INTEGER NOT NULL DEFAULT 0,
+    problem_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS rollup_problems (
+    day TEXT NOT NULL,
+    problem TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, problem)
+);
+CREATE TABLE IF NOT EXISTS rollup_problem_totals (
+    problem TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS rollup_totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    video_count INTEGER NOT NULL DEFAULT 0,
+    total_size INTEGER NOT NULL DEFAULT 0,
+    problem_count INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO rollup_totals (id) VALUES (1);
+
+CREATE TRIGGER IF NOT EXISTS trg_videos_insert AFTER INSERT ON videos BEGIN
+    INSERT INTO rollup_hourly (hour, video_count, total_size) VALUES (substr(NEW.timestamp, 1, 13), 1, NEW.size)
+        ON CONFLICT(hour) DO UPDATE SET video_count = video_count + 1, total_size = total_size + excluded.total_size;
+    UPDATE rollup_totals SET video_count = video_count + 1, total_size = total_size + NEW.size WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_videos_delete AFTER DELETE ON videos BEGIN
+    UPDATE rollup_hourly SET video_count = video_count - 1, total_size = total_size - OLD.size
+        WHERE hour = substr(OLD.timestamp, 1, 13);
+    UPDATE rollup_totals SET video_count = video_count - 1, total_size = total_size - OLD.size WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_videos_update AFTER UPDATE OF timestamp, size ON videos BEGIN
+    UPDATE rollup_hourly SET video_count = video_count - 1, total_size = total_size - OLD.size
+        WHERE hour = substr(OLD.timestamp, 1, 13);
+    INSERT INTO rollup_hourly (hour, video_count, total_size) VALUES (substr(NEW.timestamp, 1, 13), 1, NEW.size)
+        ON CONFLICT(hour) DO UPDATE SET video_count = video_count + 1, total_size = total_size + excluded.total_size;
+    UPDATE rollup_totals SET total_size = total_size - OLD.size + NEW.size WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_video_problems_insert AFTER INSERT ON video_problems
+WHEN EXISTS (SELECT 1 FROM videos WHERE path = NEW.path) BEGIN
+    INSERT INTO rollup_problems (day, problem, count)
+        VALUES (substr((SELECT timestamp FROM videos WHERE path = NEW.path), 1, 10), NEW.problem, 1)
+        ON CONFLICT(day, problem) DO UPDATE SET count = count + 1;
+    INSERT INTO rollup_problem_totals (problem, count) VALUES (NEW.problem, 1)
+        ON CONFLICT(problem) DO UPDATE SET count = count + 1;
+    UPDATE rollup_hourly SET problem_count = problem_count + 1
+        WHERE hour = substr((SELECT timestamp FROM videos WHERE path = NEW.path), 1, 13);
+    UPDATE rollup_totals SET problem_count = problem_count + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_video_problems_delete AFTER DELETE ON video_problems
+WHEN EXISTS (SELECT 1 FROM videos WHERE path = OLD.path) BEGIN
+    UPDATE rollup_problems SET count = count - 1
+        WHERE day = substr((SELECT timestamp FROM videos WHERE path = OLD.path), 1, 10) AND problem = OLD.problem;
+    UPDATE rollup_problem_totals SET count = count - 1 WHERE problem = OLD.problem;
+    UPDATE rollup_hourly SET problem_count = problem_count - 1
+        WHERE hour = substr((SELECT timestamp FROM videos WHERE path = OLD.path), 1, 13);
+    UPDATE rollup_totals SET problem_count = problem_count - 1 WHERE id = 1;
+END;
+"""
+
+# 汇总表结构版本，变化时从明细表重建
+ROLLUP_VERSION = "1"
+
+# 统计分组方式
+GROUP_BY_HOUR = "hour"
+GROUP_BY_DAY = "day"
+GROUP_BY_WEEK = "week"
+
+# 单次事务写入的记录数
+BATCH_SIZE = 500
+# 提交到进程池时每块包含的文件数
+PROBE_CHUNK_SIZE = 64
+
+
+class VideoCatalog:
+    """
+    视频索引库，每个线程使用独立连接，写操作串行执行
+
+    写入提交后会通知监听器 listener(类型, 记录, 旧记录)，
+    类型为 added / updated / removed，removed 时记录即被删除的记录。
+    generation 在每次内容变化后加一，可用于判断基于查询结果生成的文件是否过期
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._listeners: List[Callable[..., None]] = []
+        self.generation = 0
+        with self._write_lock:
+            conn = self._conn()
+            conn.executescript(SCHEMA)
+            conn.executescript(ROLLUP_SCHEMA)
+        if self.get_meta("rollup_version") != ROLLUP_VERSION:
+            self.rebuild_rollups()
+
+    def add_listener(self, listener: Callable[..., None]):
+        """注册变更监听器"""
+        self._listeners.append(listener)
+
+    def _notify(self, events: List[tuple]):
+        for listener in self._listeners:
+            for event in events:
+                try:
+                    listener(*event)
+                except Exception as e:
+                    print(f"索引变更通知失败: {e}")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- 状态 ----------
+
+    @property
+    def ready(self) -> bool:
+        """是否已完成过至少一次全量回填"""
+        return self.get_meta("backfill_completed") is not None
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._write_lock, self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # ---------- 写入 ----------
+
+    def upsert(self, record: dict):
+        """新增或更新一条视频记录"""
+        self.upsert_many([record])
+
+    def upsert_many(self, records: Iterable[dict]):
+        """批量新增或更新视频记录"""
+        events = []
+        changed = False
+        with self._write_lock, self._conn() as conn:
+            for record in records:
+                previous = conn.execute("SELECT * FROM videos WHERE path = ?", (record["path"],)).fetchone()
+                if previous is None:
+                    events.append(("added", record, None))
+                    changed = True
+                else:
+                    previous = self._to_record(previous)
+                    events.append(("updated", record, previous))
+                    changed = changed or any(
+                        previous[key] != record.get(key, previous[key]) for key in previous
+                    )
+
+                problems = list(record.get("problems") or [])
+                # 先按旧记录撤销问题汇总，再更新视频本身；
+                # 使用 ON CONFLICT 而不是 REPLACE，以便触发器看到的是更新而非插入
+                conn.execute("DELETE FROM video_problems WHERE path = ?", (record["path"],))
+                conn.execute(
+                    """INSERT INTO videos
+                       (path, tracking_number, timestamp, size, mtime, duration, problems, problem_count, notes)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(path) DO UPDATE SET
+                           tracking_number = excluded.tracking_number,
+                           timestamp = excluded.timestamp,
+                           size = excluded.size,
+                           mtime = excluded.mtime,
+                           duration = excluded.duration,
+                           problems = excluded.problems,
+                           problem_count = excluded.problem_count,
+                           notes = excluded.notes""",
+                    (
+                        record["path"],
+                        record["tracking_number"],
+                        record["timestamp"],
+                        record.get("size") or 0,
+                        record.get("mtime") or 0,
+                        record.get("duration"),
+                        json.dumps(problems, ensure_ascii=False),
+                        len(problems),
+                        record.get("notes") or "",
+                    ),
+                )
+                self._replace_problems(conn, record["path"], problems)
+            if changed:
+                self.generation += 1
+        self._notify(events)
+
+    def remove(self, path: str) -> bool:
+        """删除一条视频记录，返回是否存在"""
+        with self._write_lock, self._conn() as conn:
+            previous = conn.execute("SELECT * FROM videos WHERE path = ?", (path,)).fetchone()
+            if previous is None:
+                return False
+            # 先删除问题，触发器需要通过视频记录找到对应日期
+            conn.execute("DELETE FROM video_problems WHERE path = ?", (path,))
+            conn.execute("DELETE FROM videos WHERE path = ?", (path,))
+            self.generation += 1
+        self._notify([("removed", self._to_record(previous), None)])
+        return True
+
+    def update_metadata(self, tracking_number: str, timestamp: str, problems: List[str], notes: str):
+        """更新视频的问题标记和备注"""
+        with self._write_lock, self._conn() as conn:
+            rows = conn.execute(
+                "SELECT path FROM videos WHERE tracking_number = ? AND timestamp = ?",
+                (tracking_number, timestamp),
+            ).fetchall()
+            conn.execute(
+                """UPDATE videos SET problems = ?, problem_count = ?, notes = ?
+                   WHERE tracking_number = ? AND timestamp = ?""",
+                (json.dumps(problems, ensure_ascii=False), len(problems), notes or "",
+                 tracking_number, timestamp),
+            )
+            for row in rows:
+                self._replace_problems(conn, row["path"], problems)
+            self.generation += 1
+
+    @staticmethod
+    def _replace_problems(conn: sqlite3.Connection, path: str, problems: List[str]):
+        conn.execute("DELETE FROM video_problems WHERE path = ?", (path,))
+        conn.executemany(
+            "INSERT INTO video_problems (path, problem) VALUES (?, ?)",
+            [(path, problem) for problem in problems],
+        )
+
+    def rebuild_rollups(self):
+        """从明细表全量重建统计汇总表"""
+        with self._write_lock, self._conn() as conn:
+            conn.execute("DELETE FROM rollup_hourly")
+            conn.execute("DELETE FROM rollup_problems")
+            conn.execute("DELETE FROM rollup_problem_totals")
+            conn.execute(
+                """INSERT INTO rollup_hourly (hour, video_count, total_size, problem_count)
+                   SELECT substr(timestamp, 1, 13), COUNT(*), SUM(size), SUM(problem_count)
+                   FROM videos GROUP BY 1"""
+            )
+            conn.execute(
+                """INSERT INTO rollup_problems (day, problem, count)
+                   SELECT substr(v.timestamp, 1, 10), p.problem, COUNT(*)
+                   FROM video_problems p JOIN videos v ON v.path = p.path GROUP BY 1, 2"""
+            )
+            conn.execute(
+                """INSERT INTO rollup_problem_totals (problem, count)
+                   SELECT p.problem, COUNT(*)
+                   FROM video_problems p JOIN videos v ON v.path = p.path GROUP BY 1"""
+            )
+            conn.execute(
+                """UPDATE rollup_totals SET
+                       video_count = (SELECT COUNT(*) FROM videos),
+                       total_size = (SELECT COALESCE(SUM(size), 0) FROM videos),
+                       problem_count = (SELECT COUNT(*) FROM video_problems p JOIN videos v ON v.path = p.path)
+                   WHERE id = 1"""
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('rollup_version', ?)", (ROLLUP_VERSION,)
+            )
+
+    # ---------- 查询 ----------
+
+    @staticmethod
+    def _to_record(row: sqlite3.Row) -> dict:
+        return {
+            "path": row["path"],
+            "tracking_number": row["tracking_number"],
+            "timestamp": row["timestamp"],
+            "size": row["size"],
+            "mtime": row["mtime"],
+            "duration": row["duration"],
+            "problems": json.loads(row["problems"]),
+            "notes": row["notes"],
+        }
+
+    def find(self, tracking_number: str, timestamp: str) -> Optional[dict]:
+        """按快递单号和时间戳查找视频"""
+        row = self._conn().execute(
+            "SELECT * FROM videos WHERE tracking_number = ? AND timestamp = ? LIMIT 1",
+            (tracking_number, timestamp),
+        ).fetchone()
+        return self._to_record(row) if row else None
+
+    def query(
+        self,
+        search: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        has_problems: Optional[bool] = None,
+    ) -> List[dict]:
+        """按条件查询视频，按时间倒序返回"""
+        return list(self.iter_query(search, start_date, end_date, has_problems))
+
+    def iter_query(
+        self,
+        search: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        has_problems: Optional[bool] = None,
+        limit: Optional[int] = None,
+        after: Optional[Sequence[str]] = None,
+        descending: bool = True,
+        tracking_numbers: Optional[Sequence[str]] = None,
+    ) -> Iterator[dict]:
+        """
+        按条件逐条查询视频
+
+        Args:
+            tracking_numbers: 由单号索引预先匹配好的单号，提供时代替 search 的模糊查询
+            limit: 最多返回的记录数
+            after: 键集分页游标 (时间戳, 快递单号, 路径)，只返回排在其后的记录
+            descending: 是否按时间倒序
+        """
+        clauses = []
+        params: list = []
+
+        if tracking_numbers is not None:
+            if not tracking_numbers:
+                return
+            clauses.append(f"tracking_number IN ({', '.join('?' * len(tracking_numbers))})")
+            params.extend(tracking_numbers)
+        elif search:
+            clauses.append("tracking_number LIKE ? ESCAPE '\\'")
+            escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+
+        if start_date:
+            clauses.append("timestamp >= ?")
+            params.append(start_date)
+
+        if end_date:
+            # 时间戳格式为 YYYY-MM-DD HH:MM:SS，小于次日零点即包含结束日期当天
+            try:
+                next_day = datetime.strptime(end_date, "%Y-%m-%d").date() + timedelta(days=1)
+                clauses.append("timestamp < ?")
+                params.append(next_day.strftime("%Y-%m-%d"))
+            except ValueError:
+                pass
+
+        if has_problems is not None:
+            clauses.append("problem_count > 0" if has_problems else "problem_count = 0")
+
+        if after is not None:
+            clauses.append(f"(timestamp, tracking_number, path) {'<' if descending else '>'} (?, ?, ?)")
+            params.extend(after)
+
+        direction = "DESC" if descending else "ASC"
+        sql = "SELECT * FROM videos"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY timestamp {direction}, tracking_number {direction}, path {direction}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        for row in self._conn().execute(sql, params):
+            yield self._to_record(row)
+
+    def stats(
+        self,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        group_by: str = GROUP_BY_DAY,
+        today: Optional[date] = None,
+    ) -> dict:
+        """
+        从汇总表读取统计数据，代价只与请求的时间范围有关
+
+        Args:
+            date_from: 趋势起始日期，默认结束日期前6天
+            date_to: 趋势结束日期（含），默认今天
+            group_by: 趋势分组方式 hour / day / week
+            today: 计算今日录制数所用的日期，默认今天
+
+        指定了时间范围时问题分布只统计该范围，否则为全部视频
+        """
+        conn = self._conn()
+        today = today or datetime.now().date()
+        ranged = date_from is not None or date_to is not None
+        date_to = date_to or today
+        date_from = date_from or (date_to - timedelta(days=6))
+
+        totals = conn.execute(
+            "SELECT video_count, total_size, problem_count FROM rollup_totals WHERE id = 1"
+        ).fetchone()
+        today_videos = conn.execute(
+            "SELECT COALESCE(SUM(video_count), 0) FROM rollup_hourly WHERE hour >= ? AND hour < ?",
+            (today.isoformat(), (today + timedelta(days=1)).isoformat()),
+        ).fetchone()[0]
+
+        range_start = date_from.isoformat()
+        range_end = (date_to + timedelta(days=1)).isoformat()
+        if ranged:
+            rows = conn.execute(
+                """SELECT problem, SUM(count) AS count FROM rollup_problems
+                   WHERE day >= ? AND day < ? GROUP BY problem HAVING SUM(count) > 0""",
+                (range_start, range_end),
+            )
+        else:
+            rows = conn.execute("SELECT problem, count FROM rollup_problem_totals WHERE count > 0")
+        problem_distribution = {row["problem"]: row["count"] for row in rows}
+
+        hourly = {
+            row["hour"]: row["video_count"]
+            for row in conn.execute(
+                "SELECT hour, video_count FROM rollup_hourly WHERE hour >= ? AND hour < ?",
+                (range_start, range_end),
+            )
+        }
+
+        return {
+            "total_videos": totals["video_count"],
+            "today_videos": today_videos,
+            "total_problems": totals["problem_count"],
+            "total_size": totals["total_size"],
+            "problem_distribution": problem_distribution,
+            "daily_trend": self._trend(hourly, date_from, date_to, group_by),
+        }
+
+    @staticmethod
+    def _trend(hourly: Dict[str, int], date_from: date, date_to: date, group_by: str) -> List[dict]:
+        """将按小时汇总的数量展开为连续的分组序列，没有数据的分组补0"""
+        trend = []
+        day = date_from
+        while day <= date_to:
+            day_str = day.isoformat()
+            if group_by == GROUP_BY_HOUR:
+                for hour in range(24):
+                    trend.append({
+                        "date": f"{day_str} {hour:02d}:00",
+                        "count": hourly.get(f"{day_str} {hour:02d}", 0),
+                    })
+            else:
+                count = sum(hourly.get(f"{day_str} {hour:02d}", 0) for hour in range(24))
+                if group_by == GROUP_BY_WEEK:
+                    # 以周一作为每周的标签
+                    week_str = (day - timedelta(days=day.weekday())).isoformat()
+                    if trend and trend[-1]["date"] == week_str:
+                        trend[-1]["count"] += count
+                    else:
+                        trend.append({"date": week_str, "count": count})
+                else:
+                    trend.append({"date": day_str, "count": count})
+            day += timedelta(days=1)
+        return trend
+
+    def tracking_number_counts(self) -> List[Tuple[str, int]]:
+        """返回每个快递单号的视频数量"""
+        return [
+            (row[0], row[1])
+            for row in self._conn().execute(
+                "SELECT tracking_number, COUNT(*) FROM videos GROUP BY tracking_number"
+            )
+        ]
+
+    def known_files(self) -> Dict[str, Tuple[int, float]]:
+        """返回已索引文件的 {相对路径: (大小, 修改时间)}"""
+        return {
+            row["path"]: (row["size"], row["mtime"])
+            for row in self._conn().execute("SELECT path, size, mtime FROM videos")
+        }
+
+    # ---------- 回填 ----------
+
+    def backfill(
+        self,
+        videos_dir: Path,
+        scan_file: Callable[..., dict],
+        workers: Optional[int] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+        probe_many: Optional[Callable[[List[Path]], List[Optional[float]]]] = None,
+        probe_executor: Optional[Executor] = None,
+    ) -> dict:
+        """
+        并行扫描视频目录并同步到索引库
+
+        只探测新增或大小/修改时间发生变化的文件，已删除的文件会从索引中移除，
+        因此重复执行的代价只与变化的文件数量有关
+
+        Args:
+            videos_dir: 视频根目录
+            scan_file: 将视频文件转换为索引记录的函数 scan_file(视频文件[, 时长])
+            workers: 并行扫描的线程数，默认CPU核心数；使用 probe_executor 时为
+                读取文件信息和元数据（scan_file）的线程数
+            progress: 进度回调 progress(已完成数, 总数)
+            probe_many: 批量探测时长的函数，需可在子进程中调用
+            probe_executor: 执行 probe_many 的进程池；与 probe_many 同时给出时，
+                时长按块在进程池中探测，结果作为 scan_file 的第二个参数传入
+        """
+        videos_dir = Path(videos_dir)
+        known = self.known_files()
+        seen = set()
+        changed: List[Path] = []
+
+        for video_file in videos_dir.rglob("*.mp4"):
+            relative_path = str(video_file.relative_to(videos_dir))
+            seen.add(relative_path)
+            try:
+                stat = video_file.stat()
+            except OSError:
+                continue
+            if known.get(relative_path) != (stat.st_size, stat.st_mtime):
+                changed.append(video_file)
+
+        removed = [path for path in known if path not in seen]
+        for path in removed:
+            self.remove(path)
+
+        batch = []
+        done = 0
+
+        def collect(scan: Callable[[], dict]):
+            nonlocal batch, done
+            done += 1
+            try:
+                batch.append(scan())
+            except Exception as e:
+                print(f"索引视频失败: {e}")
+            if len(batch) >= BATCH_SIZE:
+                self.upsert_many(batch)
+                batch = []
+            if progress:
+                progress(done, len(changed))
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4) as executor:
+            if probe_many is not None and probe_executor is not None:
+                chunks = {
+                    probe_executor.submit(probe_many, changed[i:i + PROBE_CHUNK_SIZE]): changed[i:i + PROBE_CHUNK_SIZE]
+                    for i in range(0, len(changed), PROBE_CHUNK_SIZE)
+                }
+                scans = set()
+                for future in as_completed(chunks):
+                    chunk = chunks[future]
+                    try:
+                        durations = future.result()
+                    except Exception as e:
+                        # 进程池异常时由 scan_file 在线程中重新探测
+                        print(f"进程池探测视频失败: {e}")
+                        durations = [None] * len(chunk)
+                    # 读取文件信息和元数据同样按 workers 并行，不在当前线程中逐个执行
+                    scans.update(executor.submit(scan_file, video_file, duration)
+                                 for video_file, duration in zip(chunk, durations))
+                    for scan in [scan for scan in scans if scan.done()]:
+                        scans.discard(scan)
+                        collect(scan.result)
+                for scan in as_completed(scans):
+                    collect(scan.result)
+            else:
+                futures = [executor.submit(scan_file, video_file) for video_file in changed]
+                for future in as_completed(futures):
+                    collect(future.result)
+        if batch:
+            self.upsert_many(batch)
+
+        self.set_meta("backfill_completed", datetime.now().isoformat())
+        return {"scanned": len(seen), "updated": len(changed), "removed": len(removed)}
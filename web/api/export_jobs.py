@@ -0,0 +1,242 @@
+"""
+物流视频录制系统 - 导出任务
+Web端提交的CSV表格和条形码PDF导出在后台线程中执行，可查询进度和预计剩余时间。
+视频索引没有变化时，相同筛选条件的导出直接复用已生成的文件；
+同时执行的任务数有上限，且工作线程以较低优先级运行，导出不会占满同一台电脑上录制所需的CPU
+"""
+
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+KIND_CSV = "csv"
+KIND_PDF = "pdf"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# 保留的已结束任务数，更早的任务不能再查询，也不再参与复用
+MAX_FINISHED_JOBS = 200
+# CSV 每写入这么多行更新一次进度
+PROGRESS_INTERVAL = 500
+# Windows 线程优先级
+THREAD_PRIORITY_BELOW_NORMAL = -1
+
+CSV_HEADER = ["快递单号", "录制时间", "问题类型", "备注"]
+
+
+class ExportQueueFull(Exception):
+    """排队和执行中的导出任务已达上限"""
+
+
+def lower_thread_priority():
+    """线程池初始化函数：降低导出线程的调度优先级"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY_BELOW_NORMAL)
+        elif sys.platform.startswith("linux"):
+            # Linux 上 nice 值按线程生效，其他系统上会影响整个进程，因此不设置
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except Exception as e:
+        print(f"降低导出线程优先级失败: {e}")
+
+
+def filter_hash(kind: str, filters: dict, generation: Optional[int]) -> str:
+    """由导出类型、筛选条件和索引版本生成复用键"""
+    raw = json.dumps([kind, filters, generation], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def next_filename(directory: Path, base_name: str, extension: str, reserved: set) -> str:
+    """与桌面端相同的命名规则: 20250107.csv, 20250107_1.csv, ...，跳过正在生成的文件名"""
+    name = f"{base_name}{extension}"
+    index = 0
+    while name in reserved or (directory / name).exists():
+        index += 1
+        name = f"{base_name}_{index}{extension}"
+    return name
+
+
+class ExportJob:
+    def __init__(self, kind: str, filters: dict, key: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filters = filters
+        self.key = key
+        self.status = QUEUED
+        self.total: Optional[int] = None
+        self.done = 0
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.file: Optional[str] = None
+        self.error: Optional[str] = None
+
+    def eta_seconds(self) -> Optional[float]:
+        """按已完成部分的平均速度估计剩余时间"""
+        if self.status != RUNNING or not self.total or not self.done:
+            return None
+        elapsed = time.time() - self.started
+        return round(elapsed / self.done * (self.total - self.done), 1)
+
+    def to_dict(self) -> dict:
+        progress = 1.0 if self.status == DONE else (self.done / self.total if self.total else 0.0)
+        return {
+            "id": self.id,
+            "type": self.kind,
+            "filters": self.filters,
+            "status": self.status,
+            "progress": round(progress, 4),
+            "done": self.done,
+            "total": self.total,
+            "eta_seconds": self.eta_seconds(),
+            "created": datetime.fromtimestamp(self.created).isoformat(),
+            "started": datetime.fromtimestamp(self.started).isoformat() if self.started else None,
+            "finished": datetime.fromtimestamp(self.finished).isoformat() if self.finished else None,
+            "file": self.file,
+            "download_url": f"/api/exports/{self.file}" if self.status == DONE else None,
+            "error": self.error,
+        }
+
+
+class ExportJobs:
+    """
+    导出任务队列
+
+    Args:
+        fetch_records: 按筛选条件读取全部视频记录（按时间倒序）
+        generation: 返回视频索引的当前版本，索引不可用时返回None（此时已完成的任务不参与复用）
+        output_dirs: 各导出类型的输出目录 {KIND_CSV: 报表目录, KIND_PDF: 导出目录}
+        workers: 同时执行的任务数
+        max_pending: 排队和执行中的任务上限
+    """
+
+    def __init__(self, fetch_records: Callable[[dict], List[dict]], generation: Callable[[], Optional[int]],
+                 output_dirs: Dict[str, Path], workers: int = 1, max_pending: int = 8):
+        self.fetch_records = fetch_records
+        self.generation = generation
+        self.output_dirs = output_dirs
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="export", initializer=lower_thread_priority
+        )
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, ExportJob]" = OrderedDict()
+        self._by_key: Dict[str, str] = {}
+        self._reserved = set()
+
+    def submit(self, kind: str, filters: dict) -> Tuple[ExportJob, bool]:
+        """
+        提交导出任务，返回 (任务, 是否复用)
+
+        相同条件的任务正在排队或执行时直接返回该任务；已完成且索引没有变化、文件仍存在时复用其结果
+
+        Raises:
+            ExportQueueFull: 排队和执行中的任务已达上限
+        """
+        generation = self.generation()
+        key = filter_hash(kind, filters, generation)
+        with self._lock:
+            existing = self._jobs.get(self._by_key.get(key))
+            if existing is not None and self._reusable(existing, generation):
+                return existing, True
+
+            pending = sum(1 for job in self._jobs.values() if job.status in (QUEUED, RUNNING))
+            if pending >= self.max_pending:
+                raise ExportQueueFull(f"导出任务过多（{pending} 个排队或执行中），请稍后再试")
+
+            job = ExportJob(kind, filters, key)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+        self._executor.submit(self._run, job)
+        return job, False
+
+    def _reusable(self, job: ExportJob, generation: Optional[int]) -> bool:
+        if job.status in (QUEUED, RUNNING):
+            return True
+        return (job.status == DONE and generation is not None
+                and (self.output_dirs[job.kind] / job.file).exists())
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job: ExportJob):
+        directory = self.output_dirs[job.kind]
+        directory.mkdir(parents=True, exist_ok=True)
+        extension = ".csv" if job.kind == KIND_CSV else ".pdf"
+        with self._lock:
+            job.file = next_filename(directory, datetime.now().strftime("%Y%m%d"), extension, self._reserved)
+            self._reserved.add(job.file)
+        job.status = RUNNING
+        job.started = time.time()
+        # 先写入临时文件，完成后再改名，导出列表中不会出现未写完的文件
+        temp_path = directory / f".{job.file}.part"
+        try:
+            records = self.fetch_records(job.filters)
+            job.total = len(records)
+            if job.kind == KIND_CSV:
+                self._write_csv(job, records, temp_path)
+            else:
+                self._write_pdf(job, records, temp_path)
+            os.replace(temp_path, directory / job.file)
+            job.status = DONE
+        except Exception as e:
+            print(f"导出任务失败: {job.id}, 错误: {e}")
+            job.error = str(e)
+            job.status = FAILED
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._reserved.discard(job.file)
+                self._trim()
+
+    def _write_csv(self, job: ExportJob, records: List[dict], path: Path):
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            for index, record in enumerate(records, 1):
+                writer.writerow([record["tracking_number"], record["timestamp"],
+                                 ", ".join(record["problems"]), record["notes"]])
+                if index % PROGRESS_INTERVAL == 0:
+                    job.done = index
+        job.done = len(records)
+
+    def _write_pdf(self, job: ExportJob, records: List[dict], path: Path):
+        # reportlab 只在生成PDF时加载
+        from barcode_labels import create_label_pdf
+
+        labels = [(record["tracking_number"], record["timestamp"], ", ".join(record["problems"]), record["notes"])
+                  for record in records]
+        # Web端导出与录制共用CPU，只用单进程生成
+        create_label_pdf(labels, str(path), workers=1,
+                         progress=lambda done, total: setattr(job, "done", done))
+
+    def _trim(self):
+        """只保留最近 MAX_FINISHED_JOBS 个已结束的任务"""
+        finished = [job for job in self._jobs.values() if job.status in (DONE, FAILED)]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) == job.id:
+                del self._by_key[job.key]
@@ -0,0 +1,235 @@
+"""
+物流视频录制系统 - 文件传输
+为视频流和导出文件处理条件请求（ETag / Last-Modified，返回304）和字节范围请求（单段或多段206），
+文件在线程池中分块读取后发送，不占用事件循环。uvicorn 不提供 sendfile 一类的 ASGI 扩展，
+每个字节都要经过一次用户态复制，大量并发下载时应由前置的 nginx 等直接发送文件
+"""
+
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import List, Mapping, Optional, Tuple
+from urllib.parse import quote
+
+import anyio.to_thread
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# 每次读取的大小
+CHUNK_SIZE = 256 * 1024
+# 合并后超过这个段数的多段请求按完整文件返回，避免被拆成大量小段
+MAX_RANGES = 16
+
+# 录制完成的视频不会再变化，可长期缓存
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# 可能被重新生成的文件，每次使用前用ETag确认
+REVALIDATE_CACHE = "no-cache"
+
+
+def make_etag(stat: os.stat_result) -> str:
+    """由inode、大小和修改时间生成强ETag，文件被替换或改写后随之变化"""
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def is_not_modified(headers: Mapping[str, str], etag: str, mtime: float) -> bool:
+    """判断客户端缓存是否仍然有效，If-None-Match 优先于 If-Modified-Since"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # 条件GET使用弱比较
+        return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since).timestamp() >= int(mtime)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    解析 Range 请求头
+
+    Returns:
+        合并后按起点排序的 [(起点, 终点含)]；请求头无法识别或段数过多时返回None（返回完整文件），
+        所有范围都超出文件大小时返回空列表（返回416）
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        start_text, dash, end_text = part.strip().partition("-")
+        start_text, end_text = start_text.strip(), end_text.strip()
+        if not dash or not (start_text or end_text):
+            return None
+        if not (start_text or "0").isdigit() or not (end_text or "0").isdigit():
+            return None
+        if not start_text:
+            # 后缀范围: 最后N个字节；空文件没有可返回的字节
+            length = int(end_text)
+            if length == 0 or size == 0:
+                continue
+            ranges.append((max(0, size - length), size - 1))
+            continue
+        start = int(start_text)
+        end = int(end_text) if end_text else None
+        if end is not None and end < start:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, size - 1 if end is None else min(end, size - 1)))
+
+    if not ranges:
+        return []
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def if_range_matches(value: Optional[str], etag: str, last_modified: str) -> bool:
+    """If-Range 只接受强ETag或与 Last-Modified 完全相同的日期"""
+    if value is None:
+        return True
+    value = value.strip()
+    if value.startswith('"'):
+        return value == etag
+    return value == last_modified
+
+
+class FileRangeResponse(Response):
+    """
+    按给定范围发送文件
+
+    pieces 为发送顺序的片段列表，每项是 bytes（多段响应的分隔头）或 (偏移, 长度)
+    """
+
+    def __init__(self, path: Path, pieces: list, status_code: int, headers: dict, media_type: str):
+        self.path = path
+        self.pieces = pieces
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or not self.pieces:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        f = await anyio.to_thread.run_sync(open, self.path, "rb", 0)
+        try:
+            last = len(self.pieces) - 1
+            for i, piece in enumerate(self.pieces):
+                if isinstance(piece, bytes):
+                    await send({"type": "http.response.body", "body": piece, "more_body": i < last})
+                    continue
+
+                offset, count = piece
+                await anyio.to_thread.run_sync(f.seek, offset)
+                remaining = count
+                while remaining > 0:
+                    chunk = await anyio.to_thread.run_sync(f.read, min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise OSError(f"文件在发送过程中被截断: {self.path}")
+                    remaining -= len(chunk)
+                    await send({
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0 or i < last,
+                    })
+        finally:
+            await anyio.to_thread.run_sync(f.close)
+
+
+def file_response(
+    request_headers: Mapping[str, str],
+    path: Path,
+    media_type: str,
+    cache_control: str = REVALIDATE_CACHE,
+    filename: Optional[str] = None,
+    inline: bool = False,
+    stat: Optional[os.stat_result] = None,
+) -> Response:
+    """
+    根据请求头生成文件响应：304、416、单段/多段206或完整的200
+
+    会读取文件状态，应在线程池中调用
+
+    Args:
+        request_headers: 请求头（键为小写）
+        path: 文件路径
+        media_type: 文件类型
+        cache_control: Cache-Control 响应头
+        filename: 下载文件名，默认取路径中的文件名
+        inline: 是否在浏览器中直接打开而不是下载
+        stat: 已获取的文件状态
+    """
+    stat = stat or os.stat(path)
+    size = stat.st_size
+    etag = make_etag(stat)
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+
+    if is_not_modified(request_headers, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    filename = filename or path.name
+    disposition = "inline" if inline else "attachment"
+    if filename.isascii():
+        headers["Content-Disposition"] = f'{disposition}; filename="{filename}"'
+    else:
+        headers["Content-Disposition"] = f"{disposition}; filename*=utf-8''{quote(filename)}"
+
+    range_header = request_headers.get("range")
+    ranges = None
+    if range_header and if_range_matches(request_headers.get("if-range"), etag, last_modified):
+        ranges = parse_range(range_header, size)
+
+    if ranges is None:
+        headers["Content-Length"] = str(size)
+        return FileRangeResponse(path, [(0, size)] if size else [], 200, headers, media_type)
+
+    if not ranges:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return FileRangeResponse(path, [(start, end - start + 1)], 206, headers, media_type)
+
+    boundary = secrets.token_hex(16)
+    pieces: list = []
+    for i, (start, end) in enumerate(ranges):
+        pieces.append((
+            ("\r\n" if i else "") +
+            f"--{boundary}\r\nContent-Type: {media_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1"))
+        pieces.append((start, end - start + 1))
+    pieces.append(f"\r\n--{boundary}--\r\n".encode("latin-1"))
+
+    headers["Content-Length"] = str(sum(len(p) if isinstance(p, bytes) else p[1] for p in pieces))
+    return FileRangeResponse(
+        path, pieces, 206, headers, f"multipart/byteranges; boundary={boundary}"
+    )
@@ -3,24 +3,210 @@
 提供RESTful API接口用于视频管理、数据统计等功能
 """
 
-from fastapi import FastAPI, HTTPException, Query, Body
+from fastapi import FastAPI, HTTPException, Query, Body, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import List, Optional
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import List, Optional, Tuple
+import base64
+import heapq
 import json
 import os
+import sys
 from pathlib import Path
-from datetime import datetime, timedelta
-import cv2
+from datetime import date, datetime, timedelta
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 import mimetypes
+import threading
+import time
+import anyio.to_thread
+
+from catalog import VideoCatalog
+from watcher import VideoWatcher, DELETED
+from search_index import TrackingIndex
+import mp4info
+from file_serving import file_response, IMMUTABLE_CACHE, REVALIDATE_CACHE
+from thumbnails import ThumbnailCache, ThumbnailWorker
+from proxies import ProxyQueue
+from export_jobs import ExportJobs, ExportQueueFull, KIND_CSV, KIND_PDF
+
+# 配置路径
+BASE_DIR = Path(__file__).parent.parent.parent
+VIDEOS_DIR = BASE_DIR / "videos"
+REPORTS_DIR = BASE_DIR / "reports"
+EXPORTS_DIR = BASE_DIR / "exports"
+CONFIG_FILE = BASE_DIR / "config.json"
+CATALOG_FILE = BASE_DIR / "catalog.db"
+THUMBNAILS_DIR = BASE_DIR / "thumbnails"
+PROXIES_DIR = BASE_DIR / "proxies"
+
+# 条形码PDF导出复用桌面端的 barcode_labels 模块
+if str(BASE_DIR) not in sys.path:
+    sys.path.append(str(BASE_DIR))
+
+# Web服务默认配置，可在 config.json 的 "web" 部分覆盖
+DEFAULT_WEB_SETTINGS = {
+    # 同时执行文件读写、目录扫描、数据库查询等阻塞操作的线程数
+    "io_threads": 16,
+    # 同步索引时探测视频时长的进程数，0表示只在线程中探测
+    "probe_processes": max(1, (os.cpu_count() or 2) // 2),
+    # 后台生成缩略图的线程数
+    "thumbnail_workers": 1,
+    # 缩略图宽度（像素）、格式（jpg/webp）和缓存目录大小上限（MB）
+    "thumbnail_width": 320,
+    "thumbnail_format": "jpg",
+    "thumbnail_cache_mb": 256,
+    # 生成预览版视频的进程数，0表示不生成；预览版的高度和码率
+    "proxy_workers": 1,
+    "proxy_height": 480,
+    "proxy_bitrate": "600k",
+    # 同时执行的导出任务数，以及排队和执行中的任务上限
+    "export_workers": 1,
+    "export_max_pending": 8,
+}
+
+
+def read_config() -> dict:
+    """读取 config.json，文件不存在或格式错误时返回空配置"""
+    if CONFIG_FILE.exists():
+        try:
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"读取配置文件失败: {e}")
+    return {}
+
+
+def load_web_settings() -> dict:
+    """加载Web服务配置"""
+    settings = dict(DEFAULT_WEB_SETTINGS)
+    settings.update(read_config().get("web", {}))
+    return settings
+
+
+WEB_SETTINGS = load_web_settings()
+
+# 探测视频时长的进程池，首次同步索引时创建
+_probe_executor: Optional[ProcessPoolExecutor] = None
+_probe_executor_lock = threading.Lock()
+
+# 以下对象在 init_services() 中创建。Windows 上进程池的子进程会重新导入主模块，
+# 因此模块级别不能打开数据库、创建目录或启动后台线程
+# 视频索引库
+catalog: Optional[VideoCatalog] = None
+# 快递单号索引，随索引库变更增量更新
+tracking_index: Optional[TrackingIndex] = None
+# 缩略图缓存，新录制的视频入库后自动排队生成
+thumbnail_cache: Optional[ThumbnailCache] = None
+thumbnail_worker: Optional[ThumbnailWorker] = None
+# 预览版转码队列，供手机等弱网环境播放
+proxy_queue: Optional[ProxyQueue] = None
+# CSV表格和条形码PDF导出任务
+export_jobs: Optional[ExportJobs] = None
+_services_lock = threading.Lock()
+
+
+def init_services():
+    """创建所需目录、索引库和各后台队列（不启动），重复调用时直接返回"""
+    global catalog, tracking_index, thumbnail_cache, thumbnail_worker, proxy_queue, export_jobs
+    with _services_lock:
+        if catalog is not None:
+            return
+        for directory in (VIDEOS_DIR, REPORTS_DIR, EXPORTS_DIR):
+            directory.mkdir(exist_ok=True)
+
+        catalog = VideoCatalog(CATALOG_FILE)
+        tracking_index = TrackingIndex()
+        catalog.add_listener(tracking_index.apply_catalog_event)
+
+        thumbnail_cache = ThumbnailCache(
+            THUMBNAILS_DIR,
+            max_bytes=WEB_SETTINGS["thumbnail_cache_mb"] * 1024 * 1024,
+            width=WEB_SETTINGS["thumbnail_width"],
+            image_format=WEB_SETTINGS["thumbnail_format"]
+        )
+        thumbnail_worker = ThumbnailWorker(
+            thumbnail_cache, lambda path: VIDEOS_DIR / path, workers=WEB_SETTINGS["thumbnail_workers"]
+        )
+        catalog.add_listener(thumbnail_worker.apply_catalog_event)
+
+        proxy_queue = ProxyQueue(
+            PROXIES_DIR, lambda path: VIDEOS_DIR / path,
+            workers=WEB_SETTINGS["proxy_workers"],
+            height=WEB_SETTINGS["proxy_height"],
+            bitrate=WEB_SETTINGS["proxy_bitrate"]
+        )
+        catalog.add_listener(proxy_queue.apply_catalog_event)
+
+        export_jobs = ExportJobs(
+            lambda filters: fetch_export_records(**filters),
+            lambda: catalog.generation if catalog.ready else None,
+            {KIND_CSV: REPORTS_DIR, KIND_PDF: EXPORTS_DIR},
+            workers=WEB_SETTINGS["export_workers"],
+            max_pending=WEB_SETTINGS["export_max_pending"]
+        )
+
+
+def close_services():
+    """停止后台队列并释放各对象，之后可再次调用 init_services()"""
+    global catalog, tracking_index, thumbnail_cache, thumbnail_worker, proxy_queue, export_jobs
+    with _services_lock:
+        if catalog is None:
+            return
+        thumbnail_worker.stop()
+        proxy_queue.stop()
+        export_jobs.shutdown()
+        shutdown_probe_executor()
+        catalog = tracking_index = thumbnail_cache = thumbnail_worker = proxy_queue = export_jobs = None
+
+
+# NDJSON 流式输出时每次从索引读取的记录数
+NDJSON_CHUNK_SIZE = 100
+
+# 视频修改后超过这个时间（秒）才视为录制完成，此后允许长期缓存
+VIDEO_IMMUTABLE_AFTER = 300
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    启动时在后台加载单号索引、开始监听视频目录并增量同步索引库。
+    同步完成前列表和统计回退到目录扫描，之后只按目录事件增量更新。
+
+    请求处理中的阻塞操作都放到线程池执行，线程数由 io_threads 限制，
+    避免事件循环被磁盘或数据库操作卡住
+    """
+    anyio.to_thread.current_default_thread_limiter().total_tokens = WEB_SETTINGS["io_threads"]
+    init_services()
+    watcher = VideoWatcher(VIDEOS_DIR, apply_video_event, on_overflow=sync_catalog)
+
+    def start_background_sync():
+        tracking_index.rebuild(catalog.tracking_number_counts())
+        watcher.start()
+        sync_catalog()
+        # 补齐历史视频的缩略图和预览版，已生成的会被直接跳过
+        known_files = catalog.known_files()
+        thumbnail_worker.enqueue_many(known_files)
+        # 预览版转码较慢，最近的视频优先
+        proxy_queue.enqueue_many(sorted(known_files, key=lambda path: known_files[path][1], reverse=True))
+
+    thumbnail_worker.start()
+    proxy_queue.start()
+    threading.Thread(target=start_background_sync, daemon=True).start()
+    yield
+    watcher.stop()
+    close_services()
+
 
 app = FastAPI(
     title="物流视频录制系统API",
     description="物流退货视频录制与管理系统的Web API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 配置CORS
@@ -30,21 +216,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Content-Range", "X-Video-Quality"],
 )
 
-# 配置路径
-BASE_DIR = Path(__file__).parent.parent.parent
-VIDEOS_DIR = BASE_DIR / "videos"
-REPORTS_DIR = BASE_DIR / "reports"
-EXPORTS_DIR = BASE_DIR / "exports"
-CONFIG_FILE = BASE_DIR / "config.json"
-
-# 确保目录存在
-VIDEOS_DIR.mkdir(exist_ok=True)
-REPORTS_DIR.mkdir(exist_ok=True)
-EXPORTS_DIR.mkdir(exist_ok=True)
-
-
 # 数据模型
 class VideoRecord(BaseModel):
     tracking_number: str
@@ -61,6 +235,15 @@ class ProblemUpdate(BaseModel):
     notes: str
 
 
+class ExportRequest(BaseModel):
+    """导出请求，筛选条件与 /api/videos 相同"""
+    type: str = Field(KIND_CSV, pattern="^(csv|pdf)$", description="csv 表格或 pdf 条形码")
+    search: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    has_problems: Optional[bool] = None
+
+
 class StatsSummary(BaseModel):
     total_videos: int
     today_videos: int
@@ -72,18 +255,15 @@ class StatsSummary(BaseModel):
 
 # 工具函数
 def get_video_info(video_path: Path) -> dict:
-    """获取视频文件信息"""
+    """获取视频文件信息，优先直接解析MP4头，解析失败时回退到OpenCV"""
     try:
-        cap = cv2.VideoCapture(str(video_path))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        duration = frame_count / fps if fps > 0 else 0
-        cap.release()
+        stat = video_path.stat()
+        duration = mp4info.probe_duration(video_path)
         
         return {
-            "duration": round(duration, 2),
-            "size": video_path.stat().st_size,
-            "modified": datetime.fromtimestamp(video_path.stat().st_mtime).isoformat()
+            "duration": duration,
+            "size": stat.st_size,
+            "modified": datetime.fromtimestamp(stat.st_mtime).isoformat()
         }
     except Exception as e:
         print(f"获取视频信息失败: {e}")
@@ -148,6 +328,100 @@ def save_video_metadata(tracking_number: str, timestamp: str, problems: List[str
         json.dump(metadata, f, ensure_ascii=False, indent=2)
 
 
+def scan_video_file(video_file: Path, duration: Optional[float] = None) -> dict:
+    """探测视频文件并生成索引记录，已在进程池中探测过时长时直接传入"""
+    file_info = parse_filename(video_file.name)
+    if duration is None:
+        duration = get_video_info(video_file).get("duration")
+    metadata = load_video_metadata(file_info["tracking_number"], file_info["timestamp"])
+    stat = video_file.stat()
+
+    return {
+        "path": str(video_file.relative_to(VIDEOS_DIR)),
+        "tracking_number": file_info["tracking_number"],
+        "timestamp": file_info["timestamp"],
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "duration": duration,
+        "problems": metadata.get("problems", []),
+        "notes": metadata.get("notes", "")
+    }
+
+
+def get_probe_executor() -> Optional[ProcessPoolExecutor]:
+    """
+    获取探测视频时长的进程池，未启用时返回None
+
+    子进程只执行 mp4info 中的函数；Windows 上子进程会重新导入启动脚本和本模块，
+    因此本模块导入时只定义路由，不创建任何运行时对象（见 init_services）
+    """
+    global _probe_executor
+    processes = WEB_SETTINGS["probe_processes"]
+    if not processes:
+        return None
+    with _probe_executor_lock:
+        if _probe_executor is None:
+            _probe_executor = ProcessPoolExecutor(max_workers=processes)
+        return _probe_executor
+
+
+def shutdown_probe_executor():
+    global _probe_executor
+    with _probe_executor_lock:
+        if _probe_executor is not None:
+            _probe_executor.shutdown(wait=False, cancel_futures=True)
+            _probe_executor = None
+
+
+def sync_catalog(workers: Optional[int] = None) -> dict:
+    """增量同步索引库与视频目录，时长探测在进程池中进行，不占用Web进程的CPU"""
+    try:
+        result = catalog.backfill(
+            VIDEOS_DIR, scan_video_file, workers=workers,
+            probe_many=mp4info.probe_durations, probe_executor=get_probe_executor()
+        )
+        print(f"索引同步完成: 扫描 {result['scanned']} 个, 更新 {result['updated']} 个, 移除 {result['removed']} 个")
+        return result
+    except Exception as e:
+        print(f"索引同步失败: {e}")
+        return {}
+
+
+def apply_video_event(kind: str, path: Path):
+    """将目录监听事件应用到索引库"""
+    if path.suffix.lower() == ".json":
+        # 元数据文件变化，刷新对应视频的问题标记和备注
+        file_info = parse_filename(path.name)
+        metadata = load_video_metadata(file_info["tracking_number"], file_info["timestamp"])
+        catalog.update_metadata(
+            file_info["tracking_number"], file_info["timestamp"],
+            metadata.get("problems", []), metadata.get("notes", "")
+        )
+    elif kind == DELETED:
+        catalog.remove(str(path.relative_to(VIDEOS_DIR)))
+    else:
+        catalog.upsert(scan_video_file(path))
+
+
+def find_video_file(tracking_number: str, timestamp: str) -> Optional[Path]:
+    """按快递单号和时间戳查找视频文件，优先使用索引"""
+    record = catalog.find(tracking_number, timestamp)
+    if record:
+        video_file = VIDEOS_DIR / record["path"]
+        if video_file.exists():
+            return video_file
+
+    # 构建文件名：快递单号_YYYYMMDD_HHMMSS.mp4
+    timestamp_clean = timestamp.replace(':', '').replace('-', '').replace(' ', '_')
+    video_file = VIDEOS_DIR / f"{tracking_number}_{timestamp_clean}.mp4"
+    if video_file.exists():
+        return video_file
+
+    # 如果直接路径不存在，尝试递归查找
+    matching_files = list(VIDEOS_DIR.rglob(f"{tracking_number}_{timestamp_clean}.mp4"))
+    return matching_files[0] if matching_files else None
+
+
 def format_size(size_bytes: int) -> str:
     """格式化文件大小"""
     for unit in ['B', 'KB', 'MB', 'GB']:
@@ -168,21 +442,50 @@ async def root():
     }
 
 
-@app.get("/api/videos", response_model=List[VideoRecord])
-async def get_videos(
-    search: Optional[str] = Query(None, description="搜索关键词"),
-    start_date: Optional[str] = Query(None, description="开始日期 YYYY-MM-DD"),
-    end_date: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD"),
-    has_problems: Optional[bool] = Query(None, description="是否有问题")
+def to_video_record(record: dict) -> VideoRecord:
+    """将索引记录转换为接口数据模型"""
+    return VideoRecord(
+        tracking_number=record["tracking_number"],
+        timestamp=record["timestamp"],
+        file_path=record["path"],
+        duration=record["duration"],
+        size=record["size"],
+        problems=record["problems"],
+        notes=record["notes"]
+    )
+
+
+def record_sort_key(record: dict) -> Tuple[str, str, str]:
+    """排序和分页使用的键：时间戳、快递单号、路径"""
+    return record["timestamp"], record["tracking_number"], record["path"]
+
+
+def encode_cursor(key: Tuple[str, str, str]) -> str:
+    """由排序键生成不透明的分页游标"""
+    raw = json.dumps(key, ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str, str]:
+    """解析分页游标"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if len(key) != 3 or not all(isinstance(part, str) for part in key):
+            raise ValueError(cursor)
+        return tuple(key)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+def iter_disk_records(
+    search: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    has_problems: Optional[bool] = None
 ):
-    """获取所有视频记录"""
-    videos = []
-    
-    # 递归遍历videos目录下的所有mp4文件（包括子目录）
+    """索引尚未建立时，递归遍历videos目录下的所有mp4文件（包括子目录）"""
     for video_file in VIDEOS_DIR.rglob("*.mp4"):
         file_info = parse_filename(video_file.name)
-        video_info = get_video_info(video_file)
-        metadata = load_video_metadata(file_info["tracking_number"], file_info["timestamp"])
         
         # 过滤条件
         if search and search.lower() not in file_info["tracking_number"].lower():
@@ -206,53 +509,237 @@ async def get_videos(
             except:
                 pass
         
+        metadata = load_video_metadata(file_info["tracking_number"], file_info["timestamp"])
         if has_problems is not None:
             if has_problems and not metadata.get("problems"):
                 continue
             if not has_problems and metadata.get("problems"):
                 continue
         
-        # 使用相对路径（相对于VIDEOS_DIR）
-        relative_path = video_file.relative_to(VIDEOS_DIR)
+        video_info = get_video_info(video_file)
         
-        videos.append(VideoRecord(
-            tracking_number=file_info["tracking_number"],
-            timestamp=file_info["timestamp"],
-            file_path=str(relative_path),
-            duration=video_info.get("duration"),
-            size=video_info.get("size"),
-            problems=metadata.get("problems", []),
-            notes=metadata.get("notes", "")
+        yield {
+            # 使用相对路径（相对于VIDEOS_DIR）
+            "path": str(video_file.relative_to(VIDEOS_DIR)),
+            "tracking_number": file_info["tracking_number"],
+            "timestamp": file_info["timestamp"],
+            "size": video_info.get("size"),
+            "duration": video_info.get("duration"),
+            "problems": metadata.get("problems", []),
+            "notes": metadata.get("notes", "")
+        }
+
+
+def fetch_records(
+    search: Optional[str],
+    start_date: Optional[str],
+    end_date: Optional[str],
+    has_problems: Optional[bool],
+    limit: int,
+    after: Optional[Tuple[str, str, str]],
+    descending: bool
+) -> List[dict]:
+    """
+    读取一页视频记录
+
+    有索引时直接做键集分页查询；没有索引时扫描目录，
+    用大小为 limit 的堆选出前 limit 条，内存占用与目录规模无关
+    """
+    if catalog.ready:
+        tracking_numbers = tracking_index.search(search) if search and tracking_index.ready else None
+        return list(catalog.iter_query(
+            search, start_date, end_date, has_problems,
+            limit=limit, after=after, descending=descending,
+            tracking_numbers=tracking_numbers
         ))
+
+    records = iter_disk_records(search, start_date, end_date, has_problems)
+    if after is not None:
+        if descending:
+            records = (r for r in records if record_sort_key(r) < after)
+        else:
+            records = (r for r in records if record_sort_key(r) > after)
+    select = heapq.nlargest if descending else heapq.nsmallest
+    return select(limit, records, key=record_sort_key)
+
+
+@app.get("/api/videos", response_model=List[VideoRecord])
+async def get_videos(
+    request: Request,
+    response: Response,
+    search: Optional[str] = Query(None, description="搜索关键词"),
+    start_date: Optional[str] = Query(None, description="开始日期 YYYY-MM-DD"),
+    end_date: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD"),
+    has_problems: Optional[bool] = Query(None, description="是否有问题"),
+    limit: int = Query(200, ge=1, le=2000, description="每页数量"),
+    cursor: Optional[str] = Query(None, description="分页游标，取自上一页响应头 X-Next-Cursor"),
+    sort: str = Query("newest", pattern="^(newest|oldest)$", description="排序: newest 最新在前, oldest 最早在前"),
+    format: Optional[str] = Query(None, pattern="^(json|ndjson)$", description="输出格式，也可通过 Accept: application/x-ndjson 指定")
+):
+    """
+    分页获取视频记录
+
+    默认返回JSON数组，如果还有下一页，游标放在响应头 X-Next-Cursor 中。
+    NDJSON模式逐行输出记录，还有下一页时最后一行为 {"next_cursor": "..."}
+    """
+    descending = sort == "newest"
+    after = decode_cursor(cursor) if cursor else None
+    filters = (search, start_date, end_date, has_problems)
+
+    if format == "ndjson" or (format is None and "application/x-ndjson" in request.headers.get("accept", "")):
+        return StreamingResponse(
+            stream_ndjson(filters, limit, after, descending),
+            media_type="application/x-ndjson"
+        )
+
+    # 多取一条用于判断是否还有下一页
+    page = await run_in_threadpool(fetch_records, *filters, limit + 1, after, descending)
+    if len(page) > limit:
+        page = page[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(record_sort_key(page[-1]))
     
-    # 按时间倒序排序
-    videos.sort(key=lambda x: x.timestamp, reverse=True)
-    
-    return videos
+    return [to_video_record(record) for record in page]
+
+
+async def stream_ndjson(filters: tuple, limit: int, after: Optional[Tuple[str, str, str]], descending: bool):
+    """按块读取记录并逐行输出，首批记录无需等待整页查询完成"""
+    # 没有索引时只能一次性扫描目录，此时按整页读取
+    chunk_size = NDJSON_CHUNK_SIZE if catalog.ready else limit
+    sent = 0
+
+    while sent < limit:
+        size = min(chunk_size, limit - sent)
+        records = await run_in_threadpool(fetch_records, *filters, size + 1, after, descending)
+        has_more = len(records) > size
+        records = records[:size]
+
+        for record in records:
+            yield to_video_record(record).model_dump_json() + "\n"
+        sent += len(records)
+
+        if not has_more:
+            return
+        after = record_sort_key(records[-1])
+
+    yield json.dumps({"next_cursor": encode_cursor(after)}) + "\n"
+
+
+@app.get("/api/videos/suggest", response_model=List[str])
+async def suggest_tracking_numbers(
+    q: str = Query(..., min_length=1, description="单号片段"),
+    limit: int = Query(10, ge=1, le=50, description="最多返回数量")
+):
+    """快递单号输入联想，前缀匹配在前"""
+    if not catalog.ready or not tracking_index.ready:
+        return []
+    return tracking_index.suggest(q.strip(), limit)
+
+
+@app.get("/api/videos/{tracking_number}", response_model=VideoRecord)
+async def get_video(tracking_number: str, timestamp: str = Query(..., description="时间戳 YYYY-MM-DD HH:MM:SS")):
+    """获取单个视频记录"""
+    record = await run_in_threadpool(load_video_record, tracking_number, timestamp)
+    if record is None:
+        raise HTTPException(status_code=404, detail="视频不存在")
+    return to_video_record(record)
+
+
+def load_video_record(tracking_number: str, timestamp: str) -> Optional[dict]:
+    """从索引读取单个视频记录，索引中没有时直接探测文件"""
+    record = catalog.find(tracking_number, timestamp)
+    if record is None:
+        video_file = find_video_file(tracking_number, timestamp)
+        if video_file is not None:
+            record = scan_video_file(video_file)
+    return record
 
 
 @app.get("/api/videos/{tracking_number}/stream")
-async def stream_video(tracking_number: str, timestamp: str = Query(..., description="时间戳 YYYY-MM-DD HH:MM:SS")):
-    """流式传输视频"""
-    # 构建文件名：快递单号_YYYYMMDD_HHMMSS.mp4
-    timestamp_clean = timestamp.replace(':', '').replace('-', '').replace(' ', '_')
-    video_file = VIDEOS_DIR / f"{tracking_number}_{timestamp_clean}.mp4"
-    
-    # 如果直接路径不存在，尝试递归查找
-    if not video_file.exists():
-        matching_files = list(VIDEOS_DIR.rglob(f"{tracking_number}_{timestamp_clean}.mp4"))
-        if matching_files:
-            video_file = matching_files[0]
-        else:
-            raise HTTPException(status_code=404, detail="视频文件不存在")
+async def stream_video(
+    request: Request,
+    tracking_number: str,
+    timestamp: str = Query(..., description="时间戳 YYYY-MM-DD HH:MM:SS"),
+    quality: str = Query("original", pattern="^(proxy|original)$", description="画质: proxy 低码率预览版, original 原始视频")
+):
+    """
+    流式传输视频
+
+    支持 If-None-Match / If-Modified-Since 条件请求和单段、多段 Range 请求，
+    录制完成的视频允许浏览器和代理长期缓存。
+    请求预览版但尚未生成时返回原始视频，实际画质见响应头 X-Video-Quality
+    """
+    video_file = await run_in_threadpool(find_video_file, tracking_number, timestamp)
+    if video_file is None:
+        raise HTTPException(status_code=404, detail="视频文件不存在")
     
-    return FileResponse(
-        video_file,
-        media_type="video/mp4",
-        headers={
-            "Accept-Ranges": "bytes",
-            "Content-Disposition": f'inline; filename="{video_file.name}"'
-        }
+    if quality == "proxy":
+        return await run_in_threadpool(proxy_file_response, request.headers, video_file)
+    response = await run_in_threadpool(video_file_response, request.headers, video_file)
+    response.headers["X-Video-Quality"] = "original"
+    return response
+
+
+def video_cache_control(video_file: Path) -> str:
+    """视频修改后一段时间内可能仍在写入或后处理，此时只允许协商缓存"""
+    settled = time.time() - video_file.stat().st_mtime > VIDEO_IMMUTABLE_AFTER
+    return IMMUTABLE_CACHE if settled else REVALIDATE_CACHE
+
+
+def video_file_response(request_headers, video_file: Path) -> Response:
+    return file_response(
+        request_headers, video_file, "video/mp4",
+        cache_control=video_cache_control(video_file), inline=True
+    )
+
+
+def proxy_file_response(request_headers, video_file: Path) -> Response:
+    relative_path = str(video_file.relative_to(VIDEOS_DIR))
+    proxy = proxy_queue.ready_proxy(relative_path, video_file)
+    if proxy is None:
+        # 预览版生成后同一地址会返回不同内容，回退时不能长期缓存；
+        # 无法生成H.264预览版时 enqueue 直接忽略，始终返回原始视频
+        proxy_queue.enqueue(relative_path)
+        response = file_response(
+            request_headers, video_file, "video/mp4", cache_control=REVALIDATE_CACHE, inline=True
+        )
+        response.headers["X-Video-Quality"] = "original"
+        return response
+
+    response = file_response(
+        request_headers, proxy, "video/mp4",
+        cache_control=video_cache_control(video_file), inline=True, filename=video_file.name
+    )
+    response.headers["X-Video-Quality"] = "proxy"
+    return response
+
+
+@app.get("/api/proxies/status")
+async def get_proxy_status():
+    """预览版转码队列状态"""
+    return proxy_queue.status()
+
+
+@app.get("/api/videos/{tracking_number}/thumbnail")
+async def get_thumbnail(
+    request: Request,
+    tracking_number: str,
+    timestamp: str = Query(..., description="时间戳 YYYY-MM-DD HH:MM:SS")
+):
+    """获取视频缩略图，后台尚未生成时当场生成"""
+    video_file = await run_in_threadpool(find_video_file, tracking_number, timestamp)
+    if video_file is None:
+        raise HTTPException(status_code=404, detail="视频文件不存在")
+
+    return await run_in_threadpool(thumbnail_response, request.headers, video_file)
+
+
+def thumbnail_response(request_headers, video_file: Path) -> Response:
+    thumbnail = thumbnail_cache.generate(video_file, str(video_file.relative_to(VIDEOS_DIR)))
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="无法读取视频画面")
+    return file_response(
+        request_headers, thumbnail, thumbnail_cache.media_type,
+        cache_control=video_cache_control(video_file), inline=True
     )
 
 
@@ -264,7 +751,8 @@ async def update_video_problems(
 ):
     """更新视频的问题标记和备注"""
     try:
-        save_video_metadata(tracking_number, timestamp, update.problems, update.notes)
+        await run_in_threadpool(save_video_metadata, tracking_number, timestamp, update.problems, update.notes)
+        await run_in_threadpool(catalog.update_metadata, tracking_number, timestamp, update.problems, update.notes)
         return {"message": "更新成功", "tracking_number": tracking_number}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"更新失败: {str(e)}")
@@ -273,35 +761,74 @@ async def update_video_problems(
 @app.delete("/api/videos/{tracking_number}")
 async def delete_video(tracking_number: str, timestamp: str = Query(..., description="时间戳 YYYY-MM-DD HH:MM:SS")):
     """删除视频及其元数据"""
+    deleted = await run_in_threadpool(delete_video_files, tracking_number, timestamp)
+    
+    if not deleted:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    return {"message": f"已删除: {', '.join(deleted)}", "tracking_number": tracking_number}
+
+
+def delete_video_files(tracking_number: str, timestamp: str) -> List[str]:
+    """删除视频文件和元数据文件，返回已删除的类型"""
     timestamp_clean = timestamp.replace(':', '').replace('-', '').replace(' ', '_')
-    video_file = VIDEOS_DIR / f"{tracking_number}_{timestamp_clean}.mp4"
+    video_file = find_video_file(tracking_number, timestamp)
     metadata_file = VIDEOS_DIR / f"{tracking_number}_{timestamp_clean}.json"
     
-    # 如果直接路径不存在，尝试递归查找
-    if not video_file.exists():
-        matching_files = list(VIDEOS_DIR.rglob(f"{tracking_number}_{timestamp_clean}.mp4"))
-        if matching_files:
-            video_file = matching_files[0]
-    
     deleted = []
     
-    if video_file.exists():
+    if video_file is not None:
         video_file.unlink()
+        catalog.remove(str(video_file.relative_to(VIDEOS_DIR)))
         deleted.append("video")
     
     if metadata_file.exists():
         metadata_file.unlink()
         deleted.append("metadata")
     
-    if not deleted:
-        raise HTTPException(status_code=404, detail="文件不存在")
-    
-    return {"message": f"已删除: {', '.join(deleted)}", "tracking_number": tracking_number}
+    return deleted
 
 
 @app.get("/api/stats", response_model=StatsSummary)
-async def get_statistics():
-    """获取统计数据"""
+async def get_statistics(
+    date_from: Optional[str] = Query(None, alias="from", description="趋势开始日期 YYYY-MM-DD"),
+    date_to: Optional[str] = Query(None, alias="to", description="趋势结束日期 YYYY-MM-DD"),
+    group_by: str = Query("day", pattern="^(hour|day|week)$", description="趋势分组: hour / day / week")
+):
+    """
+    获取统计数据
+
+    默认返回最近7天按天的趋势；指定 from/to 时问题分布也只统计该范围
+    """
+    try:
+        range_from = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else None
+        range_to = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式应为 YYYY-MM-DD")
+    if range_from and range_to and range_from > range_to:
+        raise HTTPException(status_code=400, detail="开始日期不能晚于结束日期")
+    if group_by == "hour" and range_from and (range_to or datetime.now().date()) - range_from > timedelta(days=31):
+        raise HTTPException(status_code=400, detail="按小时统计的范围不能超过31天")
+
+    if not catalog.ready and (date_from or date_to or group_by != "day"):
+        raise HTTPException(status_code=503, detail="视频索引尚未就绪，暂不支持自定义统计范围")
+
+    return await run_in_threadpool(build_statistics, range_from, range_to, group_by)
+
+
+def build_statistics(range_from: Optional[date], range_to: Optional[date], group_by: str) -> StatsSummary:
+    """汇总统计数据，索引就绪前回退到扫描目录"""
+    if catalog.ready:
+        stats = catalog.stats(range_from, range_to, group_by)
+        return StatsSummary(
+            total_videos=stats["total_videos"],
+            today_videos=stats["today_videos"],
+            total_problems=stats["total_problems"],
+            storage_used=format_size(stats["total_size"]),
+            problem_distribution=stats["problem_distribution"],
+            daily_trend=stats["daily_trend"]
+        )
+
     all_videos = []
     total_size = 0
     problem_list = []
@@ -360,6 +887,11 @@ async def get_statistics():
 @app.get("/api/exports")
 async def list_exports():
     """列出所有导出文件"""
+    return await run_in_threadpool(collect_exports)
+
+
+def collect_exports() -> List[dict]:
+    """扫描导出目录和报表目录"""
     exports = []
     
     for export_file in EXPORTS_DIR.glob("*.pdf"):
@@ -384,15 +916,57 @@ async def list_exports():
     return exports
 
 
+@app.post("/api/exports", status_code=202)
+async def create_export(request: ExportRequest):
+    """
+    提交导出任务，返回任务信息，通过 /api/exports/jobs/{id} 查询进度
+
+    相同的筛选条件在视频没有变化时复用已生成的文件（响应中 reused 为 true）
+    """
+    filters = {
+        # 空字符串与不填等价，保证相同条件得到相同的复用键
+        "search": request.search or None,
+        "start_date": request.start_date or None,
+        "end_date": request.end_date or None,
+        "has_problems": request.has_problems,
+    }
+    try:
+        job, reused = await run_in_threadpool(export_jobs.submit, request.type, filters)
+    except ExportQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {**job.to_dict(), "reused": reused}
+
+
+@app.get("/api/exports/jobs/{job_id}")
+async def get_export_job(job_id: str):
+    """查询导出任务的状态、进度和预计剩余时间"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.to_dict()
+
+
+def fetch_export_records(
+    search: Optional[str],
+    start_date: Optional[str],
+    end_date: Optional[str],
+    has_problems: Optional[bool]
+) -> List[dict]:
+    """读取导出的全部记录，按时间倒序"""
+    if catalog.ready:
+        tracking_numbers = tracking_index.search(search) if search and tracking_index.ready else None
+        return list(catalog.iter_query(
+            search, start_date, end_date, has_problems, tracking_numbers=tracking_numbers
+        ))
+    return sorted(iter_disk_records(search, start_date, end_date, has_problems), key=record_sort_key, reverse=True)
+
+
 @app.get("/api/exports/{filename}")
-async def download_export(filename: str):
-    """下载导出文件"""
-    # 尝试从两个目录查找
-    file_path = EXPORTS_DIR / filename
-    if not file_path.exists():
-        file_path = REPORTS_DIR / filename
+async def download_export(request: Request, filename: str):
+    """下载导出文件，同名文件可能被重新导出，因此每次通过ETag确认"""
+    file_path = await run_in_threadpool(locate_export, filename)
     
-    if not file_path.exists():
+    if file_path is None:
         raise HTTPException(status_code=404, detail="文件不存在")
     
     # 获取MIME类型
@@ -400,20 +974,25 @@ async def download_export(filename: str):
     if mime_type is None:
         mime_type = "application/octet-stream"
     
-    return FileResponse(
-        file_path,
-        media_type=mime_type,
-        filename=filename
+    return await run_in_threadpool(
+        file_response, request.headers, file_path, mime_type,
+        cache_control=REVALIDATE_CACHE, filename=filename
     )
 
 
+def locate_export(filename: str) -> Optional[Path]:
+    """在导出目录和报表目录中查找文件"""
+    for directory in (EXPORTS_DIR, REPORTS_DIR):
+        file_path = directory / filename
+        if file_path.exists():
+            return file_path
+    return None
+
+
 @app.get("/api/config")
 async def get_config():
     """获取系统配置"""
-    if CONFIG_FILE.exists():
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return await run_in_threadpool(read_config)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,219 @@
+"""
+物流视频录制系统 - MP4元数据读取
+直接解析 moov/mvhd 和 trak/tkhd/mdhd/stsd/stsz 等box获取时长、帧数、分辨率和编码，
+只需少量定点读取，不必为每个文件创建OpenCV解码器
+"""
+
+import os
+import struct
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# moov 超过此大小视为异常文件
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+# 缓存条目数
+CACHE_SIZE = 4096
+
+
+class Mp4ParseError(Exception):
+    """文件被截断、缺少moov或结构无法识别"""
+
+
+def _pread(f, size: int, offset: int) -> bytes:
+    if hasattr(os, "pread"):
+        return os.pread(f.fileno(), size, offset)
+    f.seek(offset)
+    return f.read(size)
+
+
+def _iter_top_level(f, file_size: int) -> Iterator[Tuple[bytes, int, int]]:
+    """遍历顶层box，返回 (类型, 内容偏移, 内容长度)"""
+    offset = 0
+    while offset + 8 <= file_size:
+        header = _pread(f, 16, offset)
+        if len(header) < 8:
+            raise Mp4ParseError("box头被截断")
+        size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1:
+            if len(header) < 16:
+                raise Mp4ParseError("box头被截断")
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - offset
+        if size < header_size:
+            raise Mp4ParseError(f"box大小无效: {box_type!r}")
+        yield box_type, offset + header_size, size - header_size
+        offset += size
+
+
+def _iter_children(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int]]:
+    """遍历内存中的子box，返回 (类型, 内容起点, 内容终点)"""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise Mp4ParseError(f"box越界: {box_type!r}")
+        yield box_type, offset + header_size, offset + size
+        offset += size
+
+
+def _find(data: bytes, start: int, end: int, path: Tuple[bytes, ...]) -> Optional[Tuple[int, int]]:
+    for box_type, body_start, body_end in _iter_children(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return body_start, body_end
+            return _find(data, body_start, body_end, path[1:])
+    return None
+
+
+def _parse_track(data: bytes, start: int, end: int) -> Dict:
+    track: Dict = {}
+
+    tkhd = _find(data, start, end, (b"tkhd",))
+    if tkhd:
+        # 宽高为16.16定点数，位于box末尾
+        width, height = struct.unpack_from(">II", data, tkhd[1] - 8)
+        track["width"] = width >> 16
+        track["height"] = height >> 16
+
+    hdlr = _find(data, start, end, (b"mdia", b"hdlr"))
+    if hdlr:
+        track["handler"] = data[hdlr[0] + 8:hdlr[0] + 12]
+
+    mdhd = _find(data, start, end, (b"mdia", b"mdhd"))
+    if mdhd:
+        if data[mdhd[0]] == 1:
+            timescale, duration = struct.unpack_from(">IQ", data, mdhd[0] + 20)
+        else:
+            timescale, duration = struct.unpack_from(">II", data, mdhd[0] + 12)
+        track["timescale"] = timescale
+        track["duration"] = duration
+
+    stsd = _find(data, start, end, (b"mdia", b"minf", b"stbl", b"stsd"))
+    if stsd and stsd[1] - stsd[0] >= 16:
+        # 跳过 version/flags 和 entry_count，第一个样本描述的类型即编码格式
+        track["codec"] = data[stsd[0] + 12:stsd[0] + 16].decode("latin-1")
+
+    stsz = _find(data, start, end, (b"mdia", b"minf", b"stbl", b"stsz"))
+    if stsz:
+        track["frame_count"] = struct.unpack_from(">I", data, stsz[0] + 8)[0]
+
+    return track
+
+
+def parse_mp4(video_path: Path) -> Dict:
+    """
+    解析MP4文件头信息
+
+    Returns:
+        {"duration": 秒, "frame_count": 帧数, "fps": 帧率, "width": 宽, "height": 高, "codec": 编码}
+
+    Raises:
+        Mp4ParseError: 文件被截断、缺少moov或结构无法识别
+    """
+    with open(video_path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+
+        moov = None
+        for box_type, body_offset, body_size in _iter_top_level(f, file_size):
+            if box_type == b"moov":
+                if body_offset + body_size > file_size:
+                    raise Mp4ParseError("moov被截断")
+                if body_size > MAX_MOOV_SIZE:
+                    raise Mp4ParseError("moov过大")
+                moov = _pread(f, body_size, body_offset)
+                break
+        if moov is None:
+            raise Mp4ParseError("缺少moov")
+
+    try:
+        mvhd = _find(moov, 0, len(moov), (b"mvhd",))
+        if mvhd is None:
+            raise Mp4ParseError("缺少mvhd")
+        if moov[mvhd[0]] == 1:
+            timescale, duration = struct.unpack_from(">IQ", moov, mvhd[0] + 20)
+        else:
+            timescale, duration = struct.unpack_from(">II", moov, mvhd[0] + 12)
+
+        video_track: Dict = {}
+        for box_type, body_start, body_end in _iter_children(moov):
+            if box_type == b"trak":
+                track = _parse_track(moov, body_start, body_end)
+                if track.get("handler") == b"vide":
+                    video_track = track
+                    break
+    except struct.error as e:
+        raise Mp4ParseError(f"box内容被截断: {e}")
+
+    if video_track.get("timescale"):
+        seconds = video_track["duration"] / video_track["timescale"]
+    else:
+        seconds = duration / timescale if timescale else 0.0
+
+    frame_count = video_track.get("frame_count", 0)
+    return {
+        "duration": round(seconds, 2),
+        "frame_count": frame_count,
+        "fps": round(frame_count / seconds, 2) if seconds > 0 else 0.0,
+        "width": video_track.get("width", 0),
+        "height": video_track.get("height", 0),
+        "codec": video_track.get("codec", ""),
+    }
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _probe_cached(path: str, size: int, mtime: float) -> Dict:
+    return parse_mp4(Path(path))
+
+
+def probe(video_path: Path) -> Dict:
+    """带缓存的解析，文件大小或修改时间变化后自动失效"""
+    stat = os.stat(video_path)
+    return dict(_probe_cached(str(video_path), stat.st_size, stat.st_mtime))
+
+
+def probe_duration(video_path: Path) -> float:
+    """
+    获取视频时长（秒），文件被截断或缺少moov（例如仍在录制）时回退到OpenCV
+
+    Raises:
+        OSError: 文件不存在或无法读取
+    """
+    try:
+        return probe(video_path)["duration"]
+    except Mp4ParseError:
+        # 只有回退时才需要OpenCV，进程池中的工作进程不必预先加载
+        import cv2
+        cap = cv2.VideoCapture(str(video_path))
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            return round(frame_count / fps, 2) if fps > 0 else 0
+        finally:
+            cap.release()
+
+
+def probe_durations(video_paths: List[Path]) -> List[Optional[float]]:
+    """
+    批量获取时长，单个文件失败时记为None
+
+    供进程池按块调用，一次提交多个文件以摊薄进程间通信的开销
+    """
+    durations: List[Optional[float]] = []
+    for video_path in video_paths:
+        try:
+            durations.append(probe_duration(video_path))
+        except Exception as e:
+            print(f"获取视频时长失败: {video_path}, 错误: {e}")
+            durations.append(None)
+    return durations
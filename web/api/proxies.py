@@ -0,0 +1,336 @@
+"""
+物流视频录制系统 - 预览版视频
+后台队列把每个录制视频转成480p低码率的预览版，供手机等弱网环境播放。
+转码在降低优先级的进程池中进行，有 ffmpeg 时使用 libx264，否则回退到OpenCV。
+浏览器只能播放H.264，OpenCV 不支持H.264编码时不生成预览版，播放时直接返回原始视频
+"""
+
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import mp4info
+
+# Windows 进程优先级
+BELOW_NORMAL_PRIORITY_CLASS = 0x00004000
+# 统计吞吐量的时间窗口（秒）
+THROUGHPUT_WINDOW = 600
+# 浏览器可以播放的视频编码
+BROWSER_CODECS = ("avc1", "avc3")
+
+
+def lower_priority():
+    """进程池初始化函数：降低工作进程的调度优先级，转码不影响Web请求和录制"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), BELOW_NORMAL_PRIORITY_CLASS)
+        else:
+            os.nice(10)
+    except Exception as e:
+        print(f"降低转码进程优先级失败: {e}")
+
+
+def transcode_ffmpeg(ffmpeg: str, source: Path, target: Path, height: int, bitrate: str):
+    command = [
+        ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", str(source),
+        "-vf", f"scale=-2:'min({height},ih)'",
+        "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main", "-pix_fmt", "yuv420p",
+        "-b:v", bitrate, "-maxrate", bitrate, "-bufsize", bitrate,
+        "-c:a", "aac", "-b:a", "64k",
+        "-movflags", "+faststart",
+        "-f", "mp4", str(target),
+    ]
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode("utf-8", errors="replace").strip() or "ffmpeg 转码失败")
+
+
+def transcode_opencv(source: Path, target: Path, height: int):
+    """没有 ffmpeg 时逐帧缩小重新编码，无法控制码率，只靠降低分辨率减小体积"""
+    import cv2
+
+    cap = cv2.VideoCapture(str(source))
+    writer = None
+    try:
+        if not cap.isOpened():
+            raise RuntimeError("无法打开视频")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        source_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if source_height > height:
+            size = (round(width * height / source_height / 2) * 2, height)
+        else:
+            size = (width, source_height)
+
+        # 浏览器只能播放H.264，不回退到mp4v
+        writer = cv2.VideoWriter(str(target), cv2.VideoWriter_fourcc(*"avc1"), fps, size)
+        if not writer.isOpened():
+            writer.release()
+            writer = None
+            raise RuntimeError("OpenCV 不支持H.264编码")
+
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if (frame.shape[1], frame.shape[0]) != size:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            writer.write(frame)
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
+
+
+def opencv_h264_available() -> bool:
+    """在工作进程中检查 OpenCV 能否编码H.264（部分发行版的 OpenCV 不带H.264编码器）"""
+    import tempfile
+
+    import cv2
+    import numpy as np
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "check.mp4")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"avc1"), 10, (64, 64))
+        try:
+            if not writer.isOpened():
+                return False
+            for _ in range(3):
+                writer.write(np.zeros((64, 64, 3), dtype=np.uint8))
+        finally:
+            writer.release()
+        return is_browser_playable(Path(path))
+
+
+def is_browser_playable(video_file: Path) -> bool:
+    """视频编码是否为浏览器可以播放的H.264"""
+    try:
+        return mp4info.probe(video_file).get("codec") in BROWSER_CODECS
+    except (OSError, mp4info.Mp4ParseError):
+        return False
+
+
+def transcode(source: Path, target: Path, height: int, bitrate: str, ffmpeg: Optional[str]) -> int:
+    """
+    在工作进程中生成预览版，写入临时文件后原子替换，
+    并把修改时间设为与源视频一致，用于判断预览版是否过期
+
+    Returns:
+        预览版大小（字节）
+    """
+    source_mtime_ns = os.stat(source).st_mtime_ns
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = target.with_name(f"{target.stem}.{os.getpid()}.tmp.mp4")
+    try:
+        if ffmpeg:
+            transcode_ffmpeg(ffmpeg, source, temp_path, height, bitrate)
+        else:
+            transcode_opencv(source, temp_path, height)
+        if not is_browser_playable(temp_path):
+            raise RuntimeError("预览版不是H.264编码，浏览器无法播放")
+        os.utime(temp_path, ns=(time.time_ns(), source_mtime_ns))
+        os.replace(temp_path, target)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+    return target.stat().st_size
+
+
+class ProxyQueue:
+    """
+    预览版转码队列
+
+    Args:
+        proxies_dir: 预览版保存目录，目录结构与视频目录一致
+        resolve: 将索引中的相对路径转换为视频文件路径
+        workers: 转码进程数，0表示不生成预览版
+        height: 预览版高度
+        bitrate: ffmpeg 转码的目标码率
+    """
+
+    def __init__(self, proxies_dir: Path, resolve: Callable[[str], Path], workers: int = 1,
+                 height: int = 480, bitrate: str = "600k"):
+        self.proxies_dir = Path(proxies_dir)
+        self.resolve = resolve
+        self.workers = workers
+        self.height = height
+        self.bitrate = bitrate
+        self.ffmpeg = shutil.which("ffmpeg")
+        # 能否生成H.264预览版；没有 ffmpeg 时在转码进程中检查 OpenCV，检查前为None
+        self.h264: Optional[bool] = True if self.ffmpeg else None
+
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = threading.Semaphore(max(1, workers))
+
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._busy_seconds = 0.0
+        self._output_bytes = 0
+        self._recent: deque = deque()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    @property
+    def available(self) -> bool:
+        """是否会生成预览版，未启用或只能生成浏览器无法播放的编码时为False"""
+        return self.enabled and self.h264 is not False
+
+    @property
+    def backend(self) -> str:
+        return "ffmpeg" if self.ffmpeg else "opencv"
+
+    def proxy_path(self, relative_path: str) -> Path:
+        return self.proxies_dir / relative_path
+
+    def ready_proxy(self, relative_path: str, video_file: Path) -> Optional[Path]:
+        """返回与当前视频对应的H.264预览版，不存在、已过期或浏览器无法播放时返回None"""
+        proxy = self.proxy_path(relative_path)
+        try:
+            if proxy.stat().st_mtime_ns != video_file.stat().st_mtime_ns:
+                return None
+        except OSError:
+            return None
+        # 早期版本可能留下mp4v编码的预览版
+        return proxy if is_browser_playable(proxy) else None
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        # 子进程只执行本模块的 transcode，本模块导入时没有副作用
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=lower_priority)
+        self._thread = threading.Thread(target=self._dispatch, name="proxy-queue", daemon=True)
+        self._thread.start()
+        print(f"预览版转码已启动 ({self.backend}, {self.workers} 个进程)")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._thread = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def enqueue(self, relative_path: str):
+        if not self.available:
+            return
+        with self._lock:
+            if relative_path in self._queued:
+                return
+            self._queued.add(relative_path)
+        self._queue.put(relative_path)
+
+    def enqueue_many(self, relative_paths: Iterable[str]):
+        for relative_path in relative_paths:
+            self.enqueue(relative_path)
+
+    def remove(self, relative_path: str):
+        try:
+            self.proxy_path(relative_path).unlink()
+        except OSError:
+            pass
+
+    def apply_catalog_event(self, kind: str, record: dict, previous: Optional[dict] = None):
+        """索引库变更回调，新增或改写的视频排队转码，删除的视频同时删除预览版"""
+        if kind == "removed":
+            self.remove(record["path"])
+        else:
+            self.enqueue(record["path"])
+
+    def _check_h264(self):
+        try:
+            self.h264 = self._executor.submit(opencv_h264_available).result()
+        except Exception as e:
+            print(f"检查OpenCV H.264编码失败: {e}")
+            self.h264 = False
+        if not self.h264:
+            print("未找到 ffmpeg 且 OpenCV 不支持H.264编码，不生成预览版，播放预览版时返回原始视频")
+
+    def _dispatch(self):
+        if self.h264 is None:
+            self._check_h264()
+        while True:
+            relative_path = self._queue.get()
+            if relative_path is None:
+                return
+            with self._lock:
+                self._queued.discard(relative_path)
+            if not self.h264:
+                continue
+
+            video_file = self.resolve(relative_path)
+            if not video_file.exists() or self.ready_proxy(relative_path, video_file) is not None:
+                continue
+
+            # 进程池内部也有队列，这里限制提交数量，让排队深度留在本队列中可以观察
+            self._slots.acquire()
+            with self._lock:
+                self._running += 1
+            started = time.monotonic()
+            try:
+                future = self._executor.submit(
+                    transcode, video_file, self.proxy_path(relative_path),
+                    self.height, self.bitrate, self.ffmpeg
+                )
+            except RuntimeError:
+                # 进程池已关闭
+                self._slots.release()
+                return
+            future.add_done_callback(
+                lambda f, path=relative_path, started=started: self._finished(path, started, f)
+            )
+
+    def _finished(self, relative_path: str, started: float, future):
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._running -= 1
+            self._busy_seconds += elapsed
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+                error = "已取消" if future.cancelled() else future.exception()
+                print(f"生成预览版失败: {relative_path}, 错误: {error}")
+            else:
+                self._completed += 1
+                self._output_bytes += future.result()
+                self._recent.append(time.monotonic())
+        self._slots.release()
+
+    def status(self) -> dict:
+        """队列状态：排队数、进行中、完成/失败数和近期吞吐量"""
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > THROUGHPUT_WINDOW:
+                self._recent.popleft()
+            finished = self._completed + self._failed
+            return {
+                "enabled": self.enabled,
+                # 没有 ffmpeg 且 OpenCV 不支持H.264时为False，quality=proxy 返回原始视频
+                "available": self.available,
+                "backend": self.backend,
+                "workers": self.workers,
+                "pending": self._queue.qsize(),
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_seconds": round(self._busy_seconds / finished, 2) if finished else None,
+                "per_minute": round(len(self._recent) * 60 / THROUGHPUT_WINDOW, 2),
+                "output_bytes": self._output_bytes,
+            }
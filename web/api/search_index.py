@@ -0,0 +1,196 @@
+"""
+物流视频录制系统 - 快递单号索引
+常驻内存的单号索引：有序数组用于前缀查找，三元组倒排表用于子串查找，
+替代对每个视频做 `search in tracking_number` 的线性匹配
+"""
+
+import threading
+from array import array
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 子串查找时，候选集合缩小到这个数量以内就直接逐个校验
+VERIFY_THRESHOLD = 64
+# 匹配的单号超过这个数量时交给数据库做模糊查询
+MAX_MATCHES = 500
+
+
+def trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrackingIndex:
+    """
+    快递单号索引，按不区分大小写的方式匹配
+
+    每个单号记录出现次数（同一单号可能录制多次），
+    次数归零后从有序数组移除，倒排表中的旧编号在垃圾过多时统一压缩
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # 首次全量重建完成前查询结果不完整，调用方应回退到数据库查询
+        self.ready = False
+        self._reset()
+
+    def _reset(self):
+        # 小写单号 -> {原始单号: 视频数}
+        self._originals: Dict[str, Dict[str, int]] = {}
+        # 有序的小写单号，用于前缀查找
+        self._sorted: List[str] = []
+        # 小写单号 <-> 编号
+        self._ids: Dict[str, int] = {}
+        self._keys: List[Optional[str]] = []
+        # 三元组 -> 按编号递增的倒排表
+        self._postings: Dict[str, array] = {}
+        self._garbage = 0
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+    # ---------- 维护 ----------
+
+    def rebuild(self, counts: Iterable[Tuple[str, int]]):
+        """根据 (单号, 视频数) 全量重建索引"""
+        with self._lock:
+            self._reset()
+            for tracking_number, count in counts:
+                self._add(tracking_number, count, keep_sorted=False)
+            self._sorted.sort()
+            self.ready = True
+
+    def add(self, tracking_number: str, count: int = 1):
+        with self._lock:
+            self._add(tracking_number, count, keep_sorted=True)
+
+    def remove(self, tracking_number: str, count: int = 1):
+        with self._lock:
+            key = tracking_number.lower()
+            originals = self._originals.get(key)
+            if not originals or tracking_number not in originals:
+                return
+            originals[tracking_number] -= count
+            if originals[tracking_number] <= 0:
+                del originals[tracking_number]
+            if originals:
+                return
+
+            del self._originals[key]
+            del self._sorted[bisect_left(self._sorted, key)]
+            self._keys[self._ids.pop(key)] = None
+            self._garbage += 1
+            if self._garbage > 1024 and self._garbage * 2 > len(self._keys):
+                self._compact()
+
+    def apply_catalog_event(self, kind: str, record: dict, previous: Optional[dict] = None):
+        """索引库变更回调，保持索引与索引库一致"""
+        if kind == "removed":
+            self.remove(record["tracking_number"])
+            return
+        if previous is not None:
+            self.remove(previous["tracking_number"])
+        self.add(record["tracking_number"])
+
+    def _add(self, tracking_number: str, count: int, keep_sorted: bool):
+        key = tracking_number.lower()
+        originals = self._originals.get(key)
+        if originals is None:
+            originals = self._originals[key] = {}
+            if keep_sorted:
+                insort(self._sorted, key)
+            else:
+                self._sorted.append(key)
+            key_id = len(self._keys)
+            self._keys.append(key)
+            self._ids[key] = key_id
+            for gram in trigrams(key):
+                postings = self._postings.get(gram)
+                if postings is None:
+                    postings = self._postings[gram] = array("I")
+                postings.append(key_id)
+        originals[tracking_number] = originals.get(tracking_number, 0) + count
+
+    def _compact(self):
+        counts = [
+            (original, count)
+            for originals in self._originals.values()
+            for original, count in originals.items()
+        ]
+        self.rebuild(counts)
+
+    # ---------- 查询 ----------
+
+    def _expand(self, keys: Iterable[str]) -> List[str]:
+        return sorted(original for key in keys for original in self._originals.get(key, ()))
+
+    def prefix(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """查找以 query 开头的单号"""
+        query = query.lower()
+        with self._lock:
+            keys = []
+            i = bisect_left(self._sorted, query)
+            while i < len(self._sorted) and self._sorted[i].startswith(query):
+                keys.append(self._sorted[i])
+                if limit is not None and len(keys) >= limit:
+                    break
+                i += 1
+            return self._expand(keys)
+
+    def _substring_keys(self, query: str, limit: Optional[int]) -> Tuple[List[str], bool]:
+        """返回包含 query 的小写单号，以及是否因达到 limit 被截断"""
+        lists = sorted(
+            (self._postings.get(gram, array("I")) for gram in trigrams(query)),
+            key=len
+        )
+        if not lists[0]:
+            return [], False
+
+        # 倒排表按编号递增，直接以零拷贝视图做有序求交；
+        # 从最短的开始，候选足够少时直接校验
+        candidates = np.frombuffer(lists[0], dtype=np.uint32)
+        for postings in lists[1:]:
+            if len(candidates) <= VERIFY_THRESHOLD:
+                break
+            candidates = np.intersect1d(
+                candidates, np.frombuffer(postings, dtype=np.uint32), assume_unique=True
+            )
+
+        keys = []
+        for key_id in candidates.tolist():
+            key = self._keys[key_id]
+            if key is not None and query in key:
+                if limit is not None and len(keys) >= limit:
+                    return keys, True
+                keys.append(key)
+        return keys, False
+
+    def search(self, query: str, limit: int = MAX_MATCHES) -> Optional[List[str]]:
+        """
+        查找包含 query 的单号
+
+        Returns:
+            匹配的原始单号列表；查询过短或匹配过多、索引帮不上忙时返回None，
+            调用方应回退到数据库模糊查询
+        """
+        query = query.lower()
+        if len(query) < 3:
+            return None
+
+        with self._lock:
+            keys, truncated = self._substring_keys(query, limit)
+            return None if truncated else self._expand(keys)
+
+    def suggest(self, query: str, limit: int = 10) -> List[str]:
+        """输入联想：前缀匹配在前，其余子串匹配在后"""
+        results = self.prefix(query, limit=limit)
+        query = query.lower()
+        if len(results) < limit and len(query) >= 3:
+            seen = set(results)
+            with self._lock:
+                keys, _ = self._substring_keys(query, limit * 2)
+                for tracking_number in self._expand(keys):
+                    if tracking_number not in seen:
+                        results.append(tracking_number)
+        return results[:limit]
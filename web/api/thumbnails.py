@@ -0,0 +1,233 @@
+"""
+物流视频录制系统 - 视频缩略图
+后台线程为每个视频截取约1秒处的一帧，缩小后编码为JPEG/WebP，
+按源文件身份（路径、大小、修改时间）寻址保存到缓存目录，超出容量时按最近使用淘汰
+"""
+
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import cv2
+
+# 截取画面的位置（毫秒），视频过短时退回第一帧
+POSTER_POSITION_MS = 1000
+FORMATS = {
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+class ThumbnailCache:
+    """
+    缩略图缓存目录
+
+    文件名由源视频的相对路径、大小和修改时间哈希得到，视频被改写后自然对应新的缩略图，
+    旧文件不再被访问，最终被LRU淘汰
+
+    Args:
+        cache_dir: 缓存目录
+        max_bytes: 缓存总大小上限
+        width: 缩略图宽度，高度按比例缩放
+        image_format: jpg 或 webp
+        quality: 编码质量 0-100
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int, width: int = 320,
+                 image_format: str = "jpg", quality: int = 75):
+        if image_format not in FORMATS:
+            raise ValueError(f"不支持的缩略图格式: {image_format}")
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.width = width
+        self.suffix, self._quality_flag = FORMATS[image_format]
+        self.quality = quality
+        self.media_type = "image/jpeg" if image_format == "jpg" else "image/webp"
+
+        self._lock = threading.Lock()
+        # 缓存文件 -> 大小，按最近使用排序
+        self._entries: "OrderedDict[Path, int]" = OrderedDict()
+        self._total = 0
+        self._load()
+
+    def _load(self):
+        """按访问时间恢复LRU顺序，命中时只更新访问时间，修改时间（ETag）保持不变"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.cache_dir.rglob(f"*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_atime, path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._entries[path] = size
+            self._total += size
+
+    def key_path(self, relative_path: str, stat: os.stat_result) -> Path:
+        digest = hashlib.sha1(
+            f"{relative_path}\0{stat.st_size}\0{stat.st_mtime_ns}".encode("utf-8")
+        ).hexdigest()
+        return self.cache_dir / digest[:2] / f"{digest}{self.suffix}"
+
+    def get(self, relative_path: str, stat: os.stat_result) -> Optional[Path]:
+        """返回已缓存的缩略图，并标记为最近使用"""
+        path = self.key_path(relative_path, stat)
+        with self._lock:
+            if path not in self._entries:
+                return None
+            self._entries.move_to_end(path)
+        try:
+            os.utime(path, ns=(time.time_ns(), path.stat().st_mtime_ns))
+        except OSError:
+            with self._lock:
+                self._forget(path)
+            return None
+        return path
+
+    def generate(self, video_file: Path, relative_path: str) -> Optional[Path]:
+        """
+        生成缩略图，已存在时直接返回
+
+        Returns:
+            缩略图路径；视频无法读取时返回None
+        """
+        stat = video_file.stat()
+        cached = self.get(relative_path, stat)
+        if cached is not None:
+            return cached
+
+        frame = read_poster_frame(video_file)
+        if frame is None:
+            return None
+        height, width = frame.shape[:2]
+        if width > self.width:
+            frame = cv2.resize(frame, (self.width, max(1, round(height * self.width / width))),
+                               interpolation=cv2.INTER_AREA)
+        ok, data = cv2.imencode(self.suffix, frame, [self._quality_flag, self.quality])
+        if not ok:
+            return None
+
+        path = self.key_path(relative_path, stat)
+        path.parent.mkdir(exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        temp_path.write_bytes(data.tobytes())
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._forget(path)
+            self._entries[path] = len(data)
+            self._total += len(data)
+            self._evict()
+        return path
+
+    def _forget(self, path: Path):
+        size = self._entries.pop(path, None)
+        if size is not None:
+            self._total -= size
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def read_poster_frame(video_file: Path):
+    """读取约1秒处的画面，视频短于1秒或无法定位时读取第一帧"""
+    cap = cv2.VideoCapture(str(video_file))
+    try:
+        if not cap.isOpened():
+            return None
+        cap.set(cv2.CAP_PROP_POS_MSEC, POSTER_POSITION_MS)
+        ret, frame = cap.read()
+        if not ret:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = cap.read()
+        return frame if ret else None
+    finally:
+        cap.release()
+
+
+class ThumbnailWorker:
+    """
+    后台生成缩略图的线程池，重复提交的视频只处理一次
+
+    Args:
+        cache: 缩略图缓存
+        resolve: 将索引中的相对路径转换为视频文件路径
+        workers: 线程数
+    """
+
+    def __init__(self, cache: ThumbnailCache, resolve: Callable[[str], Path], workers: int = 1):
+        self.cache = cache
+        self.resolve = resolve
+        self.workers = workers
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"thumbnail-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def enqueue(self, relative_path: str):
+        with self._lock:
+            if relative_path in self._queued:
+                return
+            self._queued.add(relative_path)
+        self._queue.put(relative_path)
+
+    def enqueue_many(self, relative_paths: Iterable[str]):
+        for relative_path in relative_paths:
+            self.enqueue(relative_path)
+
+    def apply_catalog_event(self, kind: str, record: dict, previous: Optional[dict] = None):
+        """索引库变更回调，新增或改写的视频排队生成缩略图"""
+        if kind != "removed":
+            self.enqueue(record["path"])
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            relative_path = self._queue.get()
+            if relative_path is None:
+                return
+            with self._lock:
+                self._queued.discard(relative_path)
+            try:
+                video_file = self.resolve(relative_path)
+                if video_file.exists():
+                    self.cache.generate(video_file, relative_path)
+            except Exception as e:
+                print(f"生成缩略图失败: {relative_path}, 错误: {e}")
@@ -0,0 +1,331 @@
+"""
+物流视频录制系统 - 视频目录监听
+在Web服务进程内后台监听videos目录，产生新增/修改/删除事件并增量更新索引库。
+Linux下使用inotify，其他平台回退到按目录修改时间和文件大小轮询。
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+ADDED = "added"
+MODIFIED = "modified"
+DELETED = "deleted"
+
+# inotify 事件掩码
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class VideoWatcher:
+    """
+    监听视频目录的后台线程
+
+    文件在写入期间会不断产生修改事件，只有在 settle 秒内没有新的变化
+    （或收到写入关闭/移入事件）后才会回调，避免索引半写入的视频。
+
+    Args:
+        root: 监听的根目录
+        on_event: 事件回调 on_event(事件类型, 文件路径)
+        on_overflow: 事件丢失时的回调，通常触发一次增量同步
+        suffixes: 关注的文件后缀
+        settle: 文件稳定多少秒后才认为写入完成
+        poll_interval: 轮询模式下的检查间隔（秒）
+        rescan_interval: 轮询模式下全量核对的间隔（秒），0表示不做全量核对
+        use_inotify: 是否尝试使用inotify
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        on_event: Callable[[str, Path], None],
+        on_overflow: Optional[Callable[[], None]] = None,
+        suffixes: Tuple[str, ...] = (".mp4", ".json"),
+        settle: float = 2.0,
+        poll_interval: float = 2.0,
+        rescan_interval: float = 300.0,
+        use_inotify: bool = True,
+    ):
+        self.root = Path(root)
+        self.on_event = on_event
+        self.on_overflow = on_overflow
+        self.suffixes = suffixes
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.use_inotify = use_inotify and sys.platform.startswith("linux")
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # 待确认的变化: 路径 -> [最后变化时间, 是否新建, 是否可立即提交]
+        self._pending: Dict[Path, list] = {}
+
+    @property
+    def backend(self) -> str:
+        return "inotify" if self.use_inotify else "polling"
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="video-watcher", daemon=True)
+        self._thread.start()
+        print(f"视频目录监听已启动 ({self.backend}): {self.root}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        if self.use_inotify:
+            try:
+                self._run_inotify()
+                return
+            except OSError as e:
+                print(f"inotify 不可用，改用轮询: {e}")
+                self.use_inotify = False
+        self._run_polling()
+
+    # ---------- 去抖 ----------
+
+    def _interesting(self, path: Path) -> bool:
+        return path.suffix.lower() in self.suffixes
+
+    def _touch(self, path: Path, created: bool = False, final: bool = False):
+        entry = self._pending.get(path)
+        if entry is None:
+            self._pending[path] = [time.monotonic(), created, final]
+        else:
+            entry[0] = time.monotonic()
+            entry[1] = entry[1] or created
+            entry[2] = final
+
+    def _next_due(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        return max(0.0, min(
+            0.0 if final else changed_at + self.settle - now
+            for changed_at, _, final in self._pending.values()
+        ))
+
+    def _flush(self):
+        now = time.monotonic()
+        for path, (changed_at, created, final) in list(self._pending.items()):
+            if not final and now - changed_at < self.settle:
+                continue
+            del self._pending[path]
+            if not path.exists():
+                kind = DELETED
+            else:
+                kind = ADDED if created else MODIFIED
+            self._dispatch(kind, path)
+
+    def _dispatch(self, kind: str, path: Path):
+        try:
+            self.on_event(kind, path)
+        except Exception as e:
+            print(f"处理目录事件失败 {kind} {path}: {e}")
+
+    def _overflow(self):
+        self._pending.clear()
+        if self.on_overflow is not None:
+            try:
+                self.on_overflow()
+            except Exception as e:
+                print(f"目录全量同步失败: {e}")
+
+    # ---------- inotify ----------
+
+    def _run_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+
+        watches: Dict[int, Path] = {}
+
+        def add_watch(directory: Path):
+            wd = libc.inotify_add_watch(fd, os.fsencode(str(directory)), WATCH_MASK)
+            if wd < 0:
+                print(f"无法监听目录 {directory}: {os.strerror(ctypes.get_errno())}")
+                return
+            watches[wd] = directory
+
+        def add_tree(directory: Path, report_existing: bool):
+            add_watch(directory)
+            for dirpath, dirnames, filenames in os.walk(directory):
+                for name in dirnames:
+                    add_watch(Path(dirpath) / name)
+                if report_existing:
+                    # 监听建立前已经写入的新目录内容
+                    for name in filenames:
+                        path = Path(dirpath) / name
+                        if self._interesting(path):
+                            self._touch(path, created=True)
+
+        try:
+            add_tree(self.root, report_existing=False)
+
+            while not self._stop.is_set():
+                due = self._next_due()
+                timeout = 1.0 if due is None else min(due, 1.0)
+                readable, _, _ = select.select([fd], [], [], timeout)
+                if readable:
+                    try:
+                        data = os.read(fd, 64 * 1024)
+                    except BlockingIOError:
+                        data = b""
+                    offset = 0
+                    while offset + EVENT_HEADER.size <= len(data):
+                        wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+                        offset += EVENT_HEADER.size
+                        name = data[offset:offset + name_len].rstrip(b"\0")
+                        offset += name_len
+
+                        if mask & IN_Q_OVERFLOW:
+                            self._overflow()
+                            continue
+                        if mask & IN_IGNORED:
+                            watches.pop(wd, None)
+                            continue
+
+                        directory = watches.get(wd)
+                        if directory is None or not name:
+                            continue
+                        path = directory / os.fsdecode(name)
+
+                        if mask & IN_ISDIR:
+                            if mask & (IN_CREATE | IN_MOVED_TO):
+                                add_tree(path, report_existing=True)
+                            elif mask & IN_MOVED_FROM:
+                                # 目录被移走，其中文件的删除由全量同步处理
+                                self._overflow()
+                            continue
+
+                        if not self._interesting(path):
+                            continue
+                        if mask & (IN_DELETE | IN_MOVED_FROM):
+                            self._touch(path, final=True)
+                        elif mask & IN_MOVED_TO:
+                            self._touch(path, created=True, final=True)
+                        elif mask & IN_CREATE:
+                            self._touch(path, created=True)
+                        elif mask & IN_CLOSE_WRITE:
+                            self._touch(path, final=True)
+                        elif mask & IN_MODIFY:
+                            self._touch(path)
+                self._flush()
+        finally:
+            os.close(fd)
+
+    # ---------- 轮询 ----------
+
+    def _run_polling(self):
+        # 目录修改时间只在增删文件时变化，所以每轮只需 stat 目录本身，
+        # 再对有变化的目录和正在写入的文件做检查
+        dirs: Dict[Path, float] = {}
+        files: Dict[Path, Tuple[int, float]] = {}
+        hot: Dict[Path, Tuple[int, float]] = {}
+
+        def stat_key(path: Path) -> Optional[Tuple[int, float]]:
+            try:
+                stat = path.stat()
+                return stat.st_size, stat.st_mtime
+            except OSError:
+                return None
+
+        def scan_dir(directory: Path, report: bool):
+            try:
+                entries = list(os.scandir(directory))
+                dirs[directory] = directory.stat().st_mtime
+            except OSError:
+                return
+            present = set()
+            for entry in entries:
+                path = Path(entry.path)
+                if entry.is_dir(follow_symlinks=False):
+                    if path not in dirs:
+                        scan_dir(path, report)
+                    continue
+                if not self._interesting(path):
+                    continue
+                present.add(path)
+                if path not in files:
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files[path] = (stat.st_size, stat.st_mtime)
+                    if report:
+                        hot[path] = files[path]
+                        self._touch(path, created=True)
+            for path in [p for p in files if p.parent == directory and p not in present]:
+                del files[path]
+                hot.pop(path, None)
+                if report:
+                    self._touch(path, final=True)
+
+        scan_dir(self.root, report=False)
+        last_rescan = time.monotonic()
+
+        while not self._stop.wait(self.poll_interval):
+            for directory, mtime in list(dirs.items()):
+                try:
+                    current = directory.stat().st_mtime
+                except OSError:
+                    # 目录被删除
+                    del dirs[directory]
+                    for path in [p for p in files if directory in p.parents]:
+                        del files[path]
+                        hot.pop(path, None)
+                        self._touch(path, final=True)
+                    continue
+                if current != mtime:
+                    scan_dir(directory, report=True)
+
+            # 正在写入的文件需要持续检查，直到大小和修改时间稳定
+            for path, previous in list(hot.items()):
+                current = stat_key(path)
+                if current is None:
+                    continue
+                if current != previous:
+                    hot[path] = files[path] = current
+                    self._touch(path)
+                elif path not in self._pending:
+                    del hot[path]
+
+            # 兜底：定期全量核对，捕获原地改写等不改变目录修改时间的变化
+            if self.rescan_interval and time.monotonic() - last_rescan >= self.rescan_interval:
+                last_rescan = time.monotonic()
+                for path, previous in list(files.items()):
+                    current = stat_key(path)
+                    if current is not None and current != previous:
+                        hot[path] = files[path] = current
+                        self._touch(path)
+
+            self._flush()
@@ -1,8 +1,13 @@
 // ==================== API配置 ====================
 const API_BASE = '/api';
 
+// 视频列表每页数量
+const VIDEO_PAGE_SIZE = 60;
+
 // 全局状态
 let currentVideo = null;
+let videoFilters = {};
+let nextVideoCursor = null;
 let trendChartInstance = null;
 let problemChartInstance = null;
 
@@ -88,19 +93,28 @@ async function loadDashboard() {
     }
 }
 
-async function loadVideos(filters = {}) {
+async function loadVideos(filters = {}, append = false) {
     showLoading();
     try {
+        if (!append) {
+            videoFilters = filters;
+            nextVideoCursor = null;
+        }
+
         const params = new URLSearchParams();
-        if (filters.search) params.append('search', filters.search);
-        if (filters.start_date) params.append('start_date', filters.start_date);
-        if (filters.end_date) params.append('end_date', filters.end_date);
-        if (filters.has_problems !== undefined) params.append('has_problems', filters.has_problems);
+        if (videoFilters.search) params.append('search', videoFilters.search);
+        if (videoFilters.start_date) params.append('start_date', videoFilters.start_date);
+        if (videoFilters.end_date) params.append('end_date', videoFilters.end_date);
+        if (videoFilters.has_problems !== undefined) params.append('has_problems', videoFilters.has_problems);
+        params.append('limit', VIDEO_PAGE_SIZE);
+        if (append && nextVideoCursor) params.append('cursor', nextVideoCursor);
 
         const response = await fetch(`${API_BASE}/videos?${params}`);
         const videos = await response.json();
+        nextVideoCursor = response.headers.get('X-Next-Cursor');
 
-        displayVideos(videos);
+        displayVideos(videos, append);
+        document.getElementById('loadMoreVideos').style.display = nextVideoCursor ? '' : 'none';
 
     } catch (error) {
         showToast('加载视频列表失败: ' + error.message, 'error');
@@ -124,11 +138,17 @@ async function loadExports() {
     }
 }
 
+function loadMoreVideos() {
+    if (nextVideoCursor) {
+        loadVideos(videoFilters, true);
+    }
+}
+
 // ==================== 数据显示 ====================
-function displayVideos(videos) {
+function displayVideos(videos, append = false) {
     const grid = document.getElementById('videoGrid');
 
-    if (videos.length === 0) {
+    if (videos.length === 0 && !append) {
         grid.innerHTML = `
             <div style="grid-column: 1/-1; text-align: center; padding: 3rem; color: var(--text-muted);">
                 <div style="font-size: 4rem; margin-bottom: 1rem;">📹</div>
@@ -138,10 +158,13 @@ function displayVideos(videos) {
         return;
     }
 
-    grid.innerHTML = videos.map(video => `
+    const html = videos.map(video => `
         <div class="video-card" onclick="openVideoModal('${video.tracking_number}', '${video.timestamp}')">
             <div class="video-thumbnail">
                 🎬
+                <img class="thumbnail-image" loading="lazy" alt=""
+                    src="${API_BASE}/videos/${encodeURIComponent(video.tracking_number)}/thumbnail?timestamp=${encodeURIComponent(video.timestamp)}"
+                    onerror="this.remove()">
                 <div class="play-overlay">
                     <div class="play-icon">▶️</div>
                 </div>
@@ -162,6 +185,12 @@ function displayVideos(videos) {
             </div>
         </div>
     `).join('');
+
+    if (append) {
+        grid.insertAdjacentHTML('beforeend', html);
+    } else {
+        grid.innerHTML = html;
+    }
 }
 
 function displayExports(exports) {
@@ -310,16 +339,19 @@ async function openVideoModal(trackingNumber, timestamp) {
     // 设置视频源
     const videoElement = document.getElementById('modalVideo');
     const timestampClean = timestamp.replace(/:/g, '').replace(/-/g, '').replace(/ /g, '_');
-    videoElement.src = `${API_BASE}/videos/${trackingNumber}/stream?timestamp=${timestamp}`;
+    // 手机或开启省流量时播放低码率预览版
+    const saveData = navigator.connection && navigator.connection.saveData;
+    const quality = saveData || window.matchMedia('(max-width: 768px)').matches ? 'proxy' : 'original';
+    videoElement.src = `${API_BASE}/videos/${encodeURIComponent(trackingNumber)}/stream?${new URLSearchParams({ timestamp, quality })}`;
 
     // 设置标题
     document.getElementById('modalVideoTitle').textContent = trackingNumber;
 
     // 加载视频信息
     try {
-        const response = await fetch(`${API_BASE}/videos?search=${trackingNumber}`);
-        const videos = await response.json();
-        const video = videos.find(v => v.tracking_number === trackingNumber && v.timestamp === timestamp);
+        const params = new URLSearchParams({ timestamp });
+        const response = await fetch(`${API_BASE}/videos/${encodeURIComponent(trackingNumber)}?${params}`);
+        const video = response.ok ? await response.json() : null;
 
         if (video) {
             // 显示问题标签
@@ -462,7 +494,9 @@ function applyFilters() {
     loadVideos(filters);
 }
 
-// 搜索框回车事件
+// 搜索框回车事件和单号联想
+let suggestTimer = null;
+
 document.addEventListener('DOMContentLoaded', () => {
     const searchInput = document.getElementById('searchInput');
     if (searchInput) {
@@ -471,9 +505,30 @@ document.addEventListener('DOMContentLoaded', () => {
                 searchVideos();
             }
         });
+        searchInput.addEventListener('input', () => {
+            clearTimeout(suggestTimer);
+            suggestTimer = setTimeout(() => loadSuggestions(searchInput.value.trim()), 150);
+        });
     }
 });
 
+async function loadSuggestions(query) {
+    const list = document.getElementById('trackingSuggestions');
+    if (!query) {
+        list.innerHTML = '';
+        return;
+    }
+
+    try {
+        const params = new URLSearchParams({ q: query, limit: 10 });
+        const response = await fetch(`${API_BASE}/videos/suggest?${params}`);
+        const suggestions = await response.json();
+        list.innerHTML = suggestions.map(s => `<option value="${s}">`).join('');
+    } catch (error) {
+        list.innerHTML = '';
+    }
+}
+
 // ==================== 刷新数据 ====================
 function refreshData() {
     const activePage = document.querySelector('.nav-item.active').dataset.page;
@@ -1,7 +1,7 @@
 // 物流视频录制管理系统 - Service Worker
 // 用于PWA离线缓存和资源管理
 
-const CACHE_NAME = 'logistics-video-v1';
+const CACHE_NAME = 'logistics-video-v6';
 const RUNTIME_CACHE = 'logistics-video-runtime';
 
 // 需要缓存的静态资源
@@ -54,16 +54,23 @@ self.addEventListener('fetch', (event) => {
     const { request } = event;
     const url = new URL(request.url);
 
+    // 视频流、缩略图和导出文件 - 交给浏览器直接处理，Range请求和HTTP缓存由服务器的ETag/Cache-Control控制
+    if (url.pathname.endsWith('/stream') || url.pathname.endsWith('/thumbnail') || url.pathname.startsWith('/api/exports/')) {
+        return;
+    }
+
     // API请求 - 网络优先，失败时使用缓存
     if (url.pathname.startsWith('/api/')) {
         event.respondWith(
             fetch(request)
                 .then((response) => {
-                    // 克隆响应并存入运行时缓存
-                    const responseClone = response.clone();
-                    caches.open(RUNTIME_CACHE).then((cache) => {
-                        cache.put(request, responseClone);
-                    });
+                    // 只缓存完整的GET响应，部分内容和其他方法的请求无法存入缓存
+                    if (request.method === 'GET' && response.status === 200) {
+                        const responseClone = response.clone();
+                        caches.open(RUNTIME_CACHE).then((cache) => {
+                            cache.put(request, responseClone);
+                        });
+                    }
                     return response;
                 })
                 .catch(() => {
@@ -74,12 +81,6 @@ self.addEventListener('fetch', (event) => {
         return;
     }
 
-    // 视频流 - 直接从网络获取，不缓存视频文件
-    if (url.pathname.includes('/stream')) {
-        event.respondWith(fetch(request));
-        return;
-    }
-
     // 静态资源 - 缓存优先，失败时从网络获取
     event.respondWith(
         caches.match(request)
@@ -14,7 +14,7 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent / "web" / "api"))
 
 # 导入API应用
-from main import app
+from main import app, init_services, close_services, sync_catalog
 
 # 配置静态文件和模板
 WEB_DIR = Path(__file__).parent / "web"
@@ -72,7 +72,15 @@ if __name__ == "__main__":
     parser.add_argument("--host", default="0.0.0.0", help="服务器地址")
     parser.add_argument("--port", type=int, default=8000, help="服务器端口")
     parser.add_argument("--reload", action="store_true", help="启用热重载（开发模式）")
+    parser.add_argument("--backfill", action="store_true", help="扫描视频目录回填索引库后退出")
+    parser.add_argument("--workers", type=int, default=None, help="回填索引时的并行线程数")
     
     args = parser.parse_args()
     
+    if args.backfill:
+        init_services()
+        sync_catalog(workers=args.workers)
+        close_services()
+        sys.exit(0)
+    
     start_server(host=args.host, port=args.port, reload=args.reload)